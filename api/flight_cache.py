@@ -0,0 +1,99 @@
+from models.flight import APIFlightData
+from cachetools import LRUCache
+from typing import Optional, Tuple
+import sqlite3
+import threading
+import time
+
+class FlightDataCache:
+    # Two-tier cache for FR24 historic lookups. Positive results never expire since
+    # historic positions do not change, misses are kept for negative_ttl_seconds.
+
+    def __init__(self, path: str, max_entries: int, negative_ttl_seconds: int):
+        self.path = path
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.memory = LRUCache(maxsize=max_entries)
+        self._lock = threading.Lock()
+        self._db = None
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "negative_hits": 0,
+            "misses": 0
+        }
+
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS flight_cache (key TEXT PRIMARY KEY, payload TEXT, expires_at REAL)"
+            )
+            self._db.commit()
+        except Exception as e:
+            # Fall back to memory only
+            self._db = None
+            print(f"Error opening FR24 cache at {path}: {str(e)}")
+
+    @staticmethod
+    def make_key(flight_number: str, date: str, departure_time: str, timezone: str) -> str:
+        return f"{flight_number}|{date}|{departure_time}|{timezone}"
+
+    def get(self, key: str) -> Tuple[bool, Optional[APIFlightData]]:
+        # Returns (found, value), value is None for a cached miss
+        now = time.time()
+        with self._lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._count_hit("memory_hits", value)
+                    return True, value
+                del self.memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT payload, expires_at FROM flight_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    payload, expires_at = row
+                    if expires_at is None or expires_at > now:
+                        value = APIFlightData.model_validate_json(payload) if payload is not None else None
+                        self.memory[key] = (value, expires_at)
+                        self._count_hit("disk_hits", value)
+                        return True, value
+
+            self.counters["misses"] += 1
+            return False, None
+
+    def _count_hit(self, counter: str, value: Optional[APIFlightData]):
+        if value is None:
+            self.counters["negative_hits"] += 1
+        else:
+            self.counters[counter] += 1
+
+    def put(self, key: str, value: APIFlightData):
+        self._store(key, value, None)
+
+    def put_negative(self, key: str):
+        self._store(key, None, time.time() + self.negative_ttl_seconds)
+
+    def _store(self, key: str, value: Optional[APIFlightData], expires_at: Optional[float]):
+        payload = value.model_dump_json() if value is not None else None
+        with self._lock:
+            self.memory[key] = (value, expires_at)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO flight_cache (key, payload, expires_at) VALUES (?, ?, ?)",
+                        (key, payload, expires_at)
+                    )
+                    self._db.commit()
+                except Exception as e:
+                    print(f"Error writing FR24 cache: {str(e)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self.memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["negative_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0
+        return stats
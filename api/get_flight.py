@@ -1,8 +1,14 @@
 from utils.time import convert_to_utc_timestamp
 from models.flight import APIFlightData
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+from typing import Optional
 import requests
-from core.config import API_KEY
+from core.config import API_KEY, FR24_API_URL, FR24_PROBE_POLICY, FR24_HEDGE_DELAY_SECONDS, FR24_TIMEOUT_SECONDS, FR24_MAX_WORKERS
+from core.config import FR24_CACHE_PATH, FR24_CACHE_MAX_ENTRIES, FR24_NEGATIVE_TTL_SECONDS
+from api.flight_cache import FlightDataCache
+from utils.metrics import in_context, upstream_call
 
 headers = {
     "Accept": "application/json",
@@ -10,7 +16,97 @@ headers = {
     "Authorization": f"Bearer {API_KEY}"
 }
 
-def get_flight_data(flight_number: str, date: str, departure_time: str, timezone: str):
+url = FR24_API_URL
+
+time_increment = [30, 60, 90, 120]
+
+# Keep-alive session shared by all probes so repeated lookups reuse connections
+session = requests.Session()
+session.headers.update(headers)
+session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=FR24_MAX_WORKERS))
+
+executor = ThreadPoolExecutor(max_workers=FR24_MAX_WORKERS, thread_name_prefix="fr24-probe")
+
+flight_cache = FlightDataCache(FR24_CACHE_PATH, FR24_CACHE_MAX_ENTRIES, FR24_NEGATIVE_TTL_SECONDS)
+
+class FlightDataUnavailable(Exception):
+    # FR24 could not be asked (network error, timeout, error status), as opposed
+    # to answering that it has no such flight
+    pass
+
+def probe_offset(flight_number: str, date: str, departure_time: str, timezone: str, offset: int) -> Optional[APIFlightData]:
+    api_call_time = datetime.strptime(f"{date} {departure_time}", "%Y-%m-%d %H:%M") + timedelta(minutes=offset)
+
+    params = {
+        "timestamp": f"{convert_to_utc_timestamp(api_call_time.strftime('%H:%M'), timezone, date)}",
+        "flights": flight_number
+    }
+
+    try:
+        with upstream_call("fr24") as call:
+            response = session.get(url, params=params, timeout=FR24_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            data = response.json()
+            found = "data" in data and isinstance(data["data"], list) and len(data["data"]) > 0
+            call["outcome"] = "found" if found else "empty"
+    except Exception as e:
+        print(f"Error probing FR24 at +{offset} minutes: {str(e)}")
+        raise FlightDataUnavailable(str(e)) from e
+
+    if found:
+        flight_data = data["data"][0]
+        return APIFlightData.model_validate(flight_data)
+
+    return None
+
+def probe_sequential(flight_number: str, date: str, departure_time: str, timezone: str) -> Optional[APIFlightData]:
+    # One request at a time, cheapest on API quota. A failed probe does not stop the
+    # others, but the flight only counts as not found when every probe answered.
+    failure = None
+    for offset in time_increment:
+        try:
+            result = probe_offset(flight_number, date, departure_time, timezone, offset)
+        except FlightDataUnavailable as e:
+            failure = e
+            continue
+        if result is not None:
+            return result
+    if failure is not None:
+        raise failure
+    return None
+
+def probe_concurrent(flight_number: str, date: str, departure_time: str, timezone: str, hedge_delay: float) -> Optional[APIFlightData]:
+    # hedge_delay == 0 fires every offset at once, otherwise the next offset is only
+    # started if nothing has come back within hedge_delay seconds
+    remaining = list(time_increment)
+    pending = set()
+    failure = None
+
+    while remaining or pending:
+        launch = remaining if hedge_delay <= 0 else remaining[:1]
+        for offset in launch:
+            pending.add(executor.submit(in_context(probe_offset), flight_number, date, departure_time, timezone, offset))
+        remaining = remaining[len(launch):]
+
+        done, pending = wait(pending, timeout=hedge_delay if remaining else None, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            try:
+                result = future.result()
+            except FlightDataUnavailable as e:
+                failure = e
+                continue
+            if result is not None:
+                # Probes still queued are dropped, in-flight ones finish and are ignored
+                for other in pending:
+                    other.cancel()
+                return result
+
+    if failure is not None:
+        raise failure
+    return None
+
+def get_flight_data(flight_number: str, date: str, departure_time: str, timezone: str, policy: str = FR24_PROBE_POLICY):
     # Date validation
     requested_date = datetime.strptime(date, "%Y-%m-%d").date()
     current_date = datetime.now().date()
@@ -22,27 +118,29 @@ def get_flight_data(flight_number: str, date: str, departure_time: str, timezone
             "message": "Flight data is only available for the last 30 days"
         }
 
-    url = "https://fr24api.flightradar24.com/api/historic/flight-positions/full"
-    
-    attempts = 0
-    time_increment = [30, 60, 90, 120]
-    max_attempts = len(time_increment)
-
-    while attempts < max_attempts:
-        api_call_time = datetime.strptime(f"{date} {departure_time}", "%Y-%m-%d %H:%M") + timedelta(minutes=time_increment[attempts])
-        
-        params = {
-            "timestamp": f"{convert_to_utc_timestamp(api_call_time.strftime('%H:%M'), timezone, date)}",
-            "flights": flight_number
-        } 
-
-        response = requests.get(url, headers=headers, params=params)
-        data = response.json()
-        
-        if "data" in data and isinstance(data["data"], list) and len(data["data"]) > 0:
-            flight_data = data["data"][0]
-            return APIFlightData.model_validate(flight_data)
-        
-        attempts += 1  
-
-    return {}
\ No newline at end of file
+    cache_key = FlightDataCache.make_key(flight_number, date, departure_time, timezone)
+    found, cached = flight_cache.get(cache_key)
+    if found:
+        return cached if cached is not None else {}
+
+    try:
+        if policy == "sequential":
+            result = probe_sequential(flight_number, date, departure_time, timezone)
+        elif policy == "hedged":
+            result = probe_concurrent(flight_number, date, departure_time, timezone, FR24_HEDGE_DELAY_SECONDS)
+        else:
+            result = probe_concurrent(flight_number, date, departure_time, timezone, 0)
+    except FlightDataUnavailable as e:
+        # Not cached, the next request asks again
+        return {
+            "error": "Flight data unavailable",
+            "message": f"The flight data provider could not be reached: {str(e)}"
+        }
+
+    if result is None:
+        # Only genuine empty answers are negative-cached
+        flight_cache.put_negative(cache_key)
+        return {}
+
+    flight_cache.put(cache_key, result)
+    return result
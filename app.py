@@ -1,12 +1,50 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from routes.user_routes import router as user_router
 from routes.flights_routes import router as flight_router
 from routes.statistics_routes import router as statistics_router
 from routes.route_info import router as route_info_router
+from routes.cache_routes import router as cache_router
+from routes.metrics_routes import router as metrics_router
+from routes.admin_routes import router as admin_router
+from routes.airport_routes import router as airport_router
+from routes.search_routes import router as search_router
+from services.reference_data import reference_cache
+from db.write_batcher import write_batcher
+from core.passwords import password_hasher
+from db.user_directory import user_directory
+from db.tombstones import tombstone_log
+from db.replica import replica
+from db.repository import repository, QueryTimeout, ClientDisconnected
+from utils.metrics import RequestMetrics, current_request, http_request_duration
+from utils.profiler import profiler, current_profile, ProfileTaskMiddleware
+from core.security import is_admin_authorization
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from time import perf_counter
 import uvicorn
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        reference_cache.start()
+        user_directory.start()
+        write_batcher.start()
+        tombstone_log.start()
+        replica.start()
+        yield
+    finally:
+        # Also runs when startup failed partway, stopping a component that never
+        # started is a no-op
+        replica.stop()
+        tombstone_log.stop()
+        write_batcher.stop()
+        password_hasher.stop()
+        user_directory.stop()
+        repository.shutdown()
+        reference_cache.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
        CORSMiddleware,
@@ -16,10 +54,58 @@ app.add_middleware(
        allow_headers=["*"],
    )
 
+# Runs inside record_request_metrics, which is added last and so wraps it
+app.add_middleware(ProfileTaskMiddleware)
+
 app.include_router(user_router, tags=["User"])
 app.include_router(flight_router, tags=["Flights"])
 app.include_router(statistics_router, tags=["Statistics"])
 app.include_router(route_info_router, tags=["Route Info"])
+app.include_router(airport_router, tags=["Airports"])
+app.include_router(search_router, tags=["Search"])
+app.include_router(cache_router, tags=["Cache"])
+app.include_router(metrics_router, tags=["Metrics"])
+app.include_router(admin_router, tags=["Admin"])
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    # Endpoint latency histogram plus a Server-Timing breakdown of the time spent
+    # in BigQuery, inserts and upstream providers while handling this request
+    request_metrics = RequestMetrics()
+    token = current_request.set(request_metrics)
+
+    # Opt-in sampling, see utils/profiler.py
+    profile_label = profiler.label_for(request.url.path, request.headers, lambda: is_admin_authorization(request.headers.get("Authorization")))
+    profile_session = profiler.begin(profile_label) if profile_label is not None else None
+    profile_token = current_profile.set(profile_session)
+
+    started = perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        current_profile.reset(profile_token)
+        if profile_session is not None:
+            profiler.end(profile_session)
+        current_request.reset(token)
+        duration = perf_counter() - started
+        # Route templates keep the label set bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        http_request_duration.observe(duration, method=request.method, route=route, status=status_code)
+
+    timing = ", ".join(part for part in (f"total;dur={duration * 1000:.1f}", request_metrics.server_timing(), response.headers.get("Server-Timing")) if part)
+    response.headers["Server-Timing"] = timing
+    return response
+
+@app.exception_handler(QueryTimeout)
+async def query_timeout_handler(request, exc: QueryTimeout):
+    return JSONResponse(status_code=504, content={"errors": str(exc)})
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request, exc: ClientDisconnected):
+    # Nobody is listening any more, the status only shows up in logs
+    return JSONResponse(status_code=499, content={"errors": "Client disconnected"})
 
 @app.get("/")
 def root():
@@ -0,0 +1,107 @@
+from datetime import date, timedelta
+from typing import Dict, List
+import math
+import random
+import string
+import uuid
+
+# Synthetic reference data, users and flight histories. Generation only depends on
+# the seed, so the server and the load driver build the same dataset independently.
+
+PASSWORD = "benchmark-password"
+
+AIRCRAFT = ["A20N", "A320", "A321", "A333", "A359", "B38M", "B738", "B77W", "B789", "E190"]
+
+def generate_airports(rng: random.Random, count: int) -> List[dict]:
+    codes = set()
+    while len(codes) < count:
+        codes.add("".join(rng.choice(string.ascii_uppercase) for _ in range(3)))
+    return [
+        {
+            "iata_code": code,
+            "name": f"{code} International",
+            "lat": round(rng.uniform(-60, 70), 4),
+            "long": round(rng.uniform(-180, 180), 4)
+        }
+        for code in sorted(codes)
+    ]
+
+def generate_airlines(rng: random.Random, count: int) -> List[dict]:
+    codes = set()
+    while len(codes) < count:
+        codes.add("".join(rng.choice(string.ascii_uppercase) for _ in range(3)))
+    return [{"airline_icao": code, "airline_name": f"{code} Airways"} for code in sorted(codes)]
+
+def generate_co2(rng: random.Random) -> List[dict]:
+    return [{"aircraft_code": code, "co2_per_hour_per_passenger": round(rng.uniform(60, 120), 2)} for code in AIRCRAFT]
+
+def distance_km(origin: dict, destination: dict) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (origin["lat"], origin["long"], destination["lat"], destination["long"]))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371 * 2 * math.asin(math.sqrt(a))
+
+def generate_flight(rng: random.Random, user_id: str, airports: List[dict], airlines: List[dict], co2: Dict[str, float]) -> dict:
+    origin, destination = rng.sample(airports, 2)
+    airline = rng.choice(airlines)
+    aircraft = rng.choice(AIRCRAFT)
+    distance = distance_km(origin, destination)
+    hours = distance / 850
+    flight_date = date(2015, 1, 1) + timedelta(days=rng.randrange(3650))
+    return {
+        "flight_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "user_id": user_id,
+        "flight_number": f"{airline['airline_icao'][:2]}{rng.randrange(1, 9999)}",
+        "date": flight_date,
+        "departure_time": f"{rng.randrange(24):02d}:{rng.choice([0, 15, 30, 45]):02d}",
+        "timezone": "UTC",
+        "estimated_co2": round(co2[aircraft] * hours, 2),
+        "airline_icao": airline["airline_icao"],
+        "airline_name": airline["airline_name"],
+        "aircraft": aircraft,
+        "registration": f"D-{rng.choice(string.ascii_uppercase)}{rng.choice(string.ascii_uppercase)}{rng.choice(string.ascii_uppercase)}",
+        "estimated_time": f"{int(hours):02d}:{int((hours - int(hours)) * 60):02d}",
+        "estimated_distance": int(distance),
+        "origin_iata": origin["iata_code"],
+        "origin_name": origin["name"],
+        "destination_iata": destination["iata_code"],
+        "destination_name": destination["name"],
+        "route": f"{origin['iata_code']} - {destination['iata_code']}",
+        "dep_lat": origin["lat"],
+        "dep_long": origin["long"],
+        "arr_lat": destination["lat"],
+        "arr_long": destination["long"],
+        "deleted": False
+    }
+
+def generate_dataset(seed: int, users_per_size: int, history_sizes: List[int], airport_count: int = 300, airline_count: int = 40) -> dict:
+    # users_per_size users are created for every history size, flights are spread
+    # over ten years so date-range queries select a subset
+    rng = random.Random(seed)
+    airports = generate_airports(rng, airport_count)
+    airlines = generate_airlines(rng, airline_count)
+    co2 = generate_co2(rng)
+    co2_by_aircraft = {row["aircraft_code"]: row["co2_per_hour_per_passenger"] for row in co2}
+
+    users = []
+    flights = []
+    for size in history_sizes:
+        for index in range(users_per_size):
+            user_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            users.append({
+                "user_id": user_id,
+                "name": "Bench",
+                "surname": f"User{size}-{index}",
+                "email": f"bench-{size}-{index}@example.com",
+                "password_hash": None,
+                "created_at": "2024-01-01T00:00:00",
+                "history_size": size
+            })
+            flights.extend(generate_flight(rng, user_id, airports, airlines, co2_by_aircraft) for _ in range(size))
+
+    return {
+        "airports": airports,
+        "airlines": airlines,
+        "co2": co2,
+        "users": users,
+        "flights": flights
+    }
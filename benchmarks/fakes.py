@@ -0,0 +1,361 @@
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+# In-memory stand-in for bigquery.Client. It understands the query shapes the app
+# issues (column lists, `col = @param`, `col IN UNNEST(@param)`, the flights keyset
+# and LIMIT, simple UPDATEs), evaluates the date-range statistics query in Python
+# and answers everything else, including the full-history aggregate and the
+# compaction script, with an empty result. Each call sleeps
+# for the configured latency so the app sees warehouse-like response times.
+
+TABLE_PATTERN = re.compile(r"(?:FROM|INTO|UPDATE)\s+`([^`]+)`", re.IGNORECASE)
+SELECT_PATTERN = re.compile(r"^\s*SELECT\s+(.*?)\s+FROM\s", re.IGNORECASE | re.DOTALL)
+EQUALS_PATTERN = re.compile(r"\b(\w+)\s*=\s*@(\w+)")
+IN_UNNEST_PATTERN = re.compile(r"\b(\w+)\s+IN\s+UNNEST\(@(\w+)\)", re.IGNORECASE)
+LIMIT_PATTERN = re.compile(r"\bLIMIT\s+(@\w+|\d+)\s*$", re.IGNORECASE)
+IDENTIFIER_PATTERN = re.compile(r"^`?(\w+)`?$")
+
+class FakeRow(dict):
+    # Supports dict(row), row.values() and row.column like bigquery.Row
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+class FakeRowIterator(list):
+    def __init__(self, rows: List[FakeRow], columns: List[str]):
+        super().__init__(rows)
+        self.schema = [SimpleNamespace(name=column) for column in columns]
+        self.total_rows = len(rows)
+
+class FakeQueryJob:
+    def __init__(self, fake: "FakeBigQueryClient", query: str, params: dict):
+        self.fake = fake
+        self.query = query
+        self.params = params
+        self.job_id = f"fake-{id(self)}"
+        self.num_dml_affected_rows = None
+        self.cancelled = False
+        self._result = None
+
+    def result(self, page_size: Optional[int] = None, timeout: Optional[float] = None, **kwargs) -> FakeRowIterator:
+        if self._result is None:
+            self.fake._sleep(self.fake.query_latency_ms)
+            self._result = self.fake._execute(self.query, self.params, self)
+        return self._result
+
+    def cancel(self) -> bool:
+        self.cancelled = True
+        return True
+
+class FakeBigQueryClient:
+    def __init__(self, tables: Dict[str, List[dict]], project: str = "benchmark", query_latency_ms: float = 0, insert_latency_ms: float = 0, jitter_ms: float = 0, flights_table: str = "flights", tombstones_table: str = "tombstones"):
+        self.project = project
+        self.tables = {name: [dict(row) for row in rows] for name, rows in tables.items()}
+        self.query_latency_ms = query_latency_ms
+        self.insert_latency_ms = insert_latency_ms
+        self.jitter_ms = jitter_ms
+        self.flights_table = flights_table
+        self.tombstones_table = tombstones_table
+        self.calls = {"query": 0, "insert_rows_json": 0}
+        self.created_at = datetime.now(timezone.utc)
+        self.modified: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+
+    def _sleep(self, latency_ms: float):
+        delay = latency_ms + (random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    @staticmethod
+    def _table_name(table_id: str) -> str:
+        return table_id.rsplit(".", 1)[-1]
+
+    @staticmethod
+    def _params(job_config) -> dict:
+        params = {}
+        for parameter in getattr(job_config, "query_parameters", None) or []:
+            params[parameter.name] = parameter.values if hasattr(parameter, "values") else parameter.value
+        return params
+
+    # bigquery.Client surface used by the app
+
+    def query(self, query: str, job_config=None, **kwargs) -> FakeQueryJob:
+        with self._lock:
+            self.calls["query"] += 1
+        return FakeQueryJob(self, query, self._params(job_config))
+
+    def query_and_wait(self, query: str, job_config=None, **kwargs) -> FakeRowIterator:
+        return self.query(query, job_config).result()
+
+    def insert_rows_json(self, table, rows: List[dict], **kwargs) -> List[dict]:
+        self._sleep(self.insert_latency_ms)
+        name = self._table_name(table if isinstance(table, str) else table.table_id)
+        with self._lock:
+            self.calls["insert_rows_json"] += 1
+            self.tables.setdefault(name, []).extend(dict(row) for row in rows)
+            self.modified[name] = datetime.now(timezone.utc)
+        return []
+
+    def get_table(self, table_id: str):
+        name = self._table_name(table_id)
+        rows = self.tables.get(name, [])
+        return SimpleNamespace(
+            project=self.project, dataset_id="benchmark", table_id=name, modified=self.modified.get(name, self.created_at),
+            schema=[SimpleNamespace(name=column, field_type="STRING") for column in (rows[0] if rows else {})]
+        )
+
+    def create_table(self, table, exists_ok: bool = False, **kwargs):
+        table_id = table if isinstance(table, str) else table.table_id
+        with self._lock:
+            self.tables.setdefault(self._table_name(table_id), [])
+        return table
+
+    # Query evaluation
+
+    def _execute(self, query: str, params: dict, job: FakeQueryJob) -> FakeRowIterator:
+        statement = query.strip()
+        match = TABLE_PATTERN.search(statement)
+        if match is None or "APPENDS(" in statement.upper():
+            # Change history reads: nothing is appended behind the app's back here
+            return FakeRowIterator([], [])
+        name = self._table_name(match.group(1))
+
+        if statement.upper().startswith("UPDATE"):
+            return self._update(name, statement, params, job)
+        if "GROUP BY ROLLUP(YEAR, MONTH)" in statement.upper():
+            return self._range_statistics(name, params)
+        if not statement.upper().startswith("SELECT"):
+            # WITH ... aggregates, MERGE and multi-statement scripts
+            return FakeRowIterator([], [])
+
+        with self._lock:
+            rows = list(self.tables.get(name, []))
+            tombstones = list(self.tables.get(self.tombstones_table, []))
+
+        # Only look at the outer WHERE, not the subqueries against the tombstones
+        where = re.sub(r"\(\s*SELECT.*?\)", "", statement, flags=re.DOTALL)
+        for column, param in EQUALS_PATTERN.findall(where):
+            if param in params and not param.startswith("cursor"):
+                rows = [row for row in rows if row.get(column) == params[param]]
+        for column, param in IN_UNNEST_PATTERN.findall(where):
+            values = set(params.get(param) or [])
+            rows = [row for row in rows if row.get(column) in values]
+
+        if name == self.flights_table:
+            rows = self._active_flights(rows, tombstones, params)
+
+        limit = LIMIT_PATTERN.search(statement)
+        if limit is not None:
+            value = limit.group(1)
+            rows = rows[:int(params[value[1:]]) if value.startswith("@") else int(value)]
+
+        columns = self._columns(statement, name, rows)
+        return FakeRowIterator([FakeRow((column, row.get(column)) for column in columns) for row in rows], columns)
+
+    def _active_flights(self, rows: List[dict], tombstones: List[dict], params: dict) -> List[dict]:
+        deleted_flights = {(tombstone.get("flight_id"), tombstone.get("user_id")) for tombstone in tombstones if tombstone.get("flight_id")}
+        deleted_users = {tombstone.get("user_id") for tombstone in tombstones if not tombstone.get("flight_id")}
+        soft_deleted = {row.get("flight_id") for row in rows if row.get("deleted")}
+
+        active = {}
+        for row in rows:
+            flight_id = row.get("flight_id")
+            if (flight_id, row.get("user_id")) in deleted_flights or (flight_id, None) in deleted_flights or flight_id in soft_deleted or row.get("user_id") in deleted_users:
+                continue
+            active.setdefault(flight_id, row)
+
+        def key(row):
+            return (str(row.get("date") or ""), row.get("flight_id") or "")
+
+        result = sorted(active.values(), key=key)
+        if "cursor_flight_id" in params:
+            cursor = (str(params.get("cursor_date") or ""), params["cursor_flight_id"])
+            result = [row for row in result if key(row) > cursor]
+        return result
+
+    def _range_statistics(self, name: str, params: dict) -> FakeRowIterator:
+        # Same rows as the statistics query of services.statistics_service: totals and
+        # dimension counts for the whole range (level 2), per year (1) and per month (0)
+        with self._lock:
+            rows = [row for row in self.tables.get(name, []) if row.get("user_id") == params.get("user_id")]
+            tombstones = list(self.tables.get(self.tombstones_table, []))
+
+        totals = {}
+        counts = {}
+        for row in self._active_flights(rows, tombstones, {}):
+            date = str(row["date"]) if row.get("date") is not None else None
+            if date is not None and ((params.get("from_date") and date < str(params["from_date"])) or (params.get("to_date") and date > str(params["to_date"]))):
+                continue
+            hours = 0
+            if row.get("estimated_time"):
+                hour, minute = row["estimated_time"].split(":")
+                hours = int(hour) + int(minute) / 60
+            dimensions = [
+                ("top_airports", row.get("origin_iata")), ("top_airports", row.get("destination_iata")),
+                ("top_airlines", row.get("airline_name")), ("top_aircraft", row.get("aircraft")), ("top_routes", row.get("route"))
+            ]
+            year, month = (date[:4], date[:7]) if date else (None, None)
+            for group in ((2, None, None), (1, year, None), (0, year, month)):
+                bucket = totals.setdefault(group, {"flights": 0, "distance": 0, "co2": 0, "hours": 0})
+                bucket["flights"] += 1
+                bucket["distance"] += row.get("estimated_distance") or 0
+                bucket["co2"] += row.get("estimated_co2") or 0
+                bucket["hours"] += hours
+                for dimension, value in dimensions:
+                    if value is not None:
+                        values = counts.setdefault(group + (dimension,), {})
+                        values[value] = values.get(value, 0) + 1
+
+        columns = ["level", "year", "month", "dimension", "value", "flights", "distance", "co2", "hours"]
+        result = [(level, year, month, "totals", None, bucket["flights"], bucket["distance"], bucket["co2"], bucket["hours"]) for (level, year, month), bucket in totals.items()]
+        top_n = params.get("top_n")
+        for (level, year, month, dimension), values in counts.items():
+            ranked = sorted(values.items(), key=lambda item: (-item[1], item[0]))
+            result.extend((level, year, month, dimension, value, flights, None, None, None) for value, flights in ranked[:top_n])
+        return FakeRowIterator([FakeRow(zip(columns, row)) for row in result], columns)
+
+    def _columns(self, statement: str, name: str, rows: List[dict]) -> List[str]:
+        match = SELECT_PATTERN.search(statement)
+        items = [item.strip() for item in match.group(1).split(",")] if match else ["*"]
+        identifiers = [IDENTIFIER_PATTERN.match(item) for item in items]
+        if items != ["*"] and all(identifiers):
+            return [identifier.group(1) for identifier in identifiers]
+        with self._lock:
+            sample = rows[0] if rows else (self.tables.get(name) or [{}])[0]
+        return list(sample.keys())
+
+    def _update(self, name: str, statement: str, params: dict, job: FakeQueryJob) -> FakeRowIterator:
+        set_clause, _, where_clause = statement.partition(" WHERE ")
+        changes = {column: params.get(param) for column, param in EQUALS_PATTERN.findall(set_clause)}
+        conditions = {column: params.get(param) for column, param in EQUALS_PATTERN.findall(where_clause)}
+
+        affected = 0
+        with self._lock:
+            for row in self.tables.get(name, []):
+                if all(row.get(column) == value for column, value in conditions.items()):
+                    row.update(changes)
+                    affected += 1
+            self.modified[name] = datetime.now(timezone.utc)
+        job.num_dml_affected_rows = affected
+        return FakeRowIterator([], [])
+
+class StubServer:
+    # Local HTTP stand-in for FR24 and AviationStack. Both answer any query after
+    # latency_ms with a deterministic payload built from the airports in the dataset.
+
+    def __init__(self, airports: List[dict], airlines: List[dict], aircraft: List[str], fr24_latency_ms: float = 0, aviationstack_latency_ms: float = 0):
+        self.airports = airports
+        self.airlines = airlines
+        self.aircraft = aircraft
+        self.fr24_latency_ms = fr24_latency_ms
+        self.aviationstack_latency_ms = aviationstack_latency_ms
+        self.calls = {"fr24": 0, "aviationstack": 0}
+        self._server = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def fr24_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/fr24/api/historic/flight-positions/full"
+
+    @property
+    def aviationstack_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/aviationstack/v1/flights"
+
+    @staticmethod
+    def _pick(items: list, seed: str, salt: str):
+        digest = hashlib.sha256(f"{salt}|{seed}".encode("utf-8")).digest()
+        return items[int.from_bytes(digest[:4], "big") % len(items)]
+
+    def fr24_payload(self, flight_number: str, timestamp: str) -> dict:
+        origin = self._pick(self.airports, flight_number, "origin")
+        destination = self._pick([airport for airport in self.airports if airport is not origin], flight_number, "destination")
+        airline = self._pick(self.airlines, flight_number, "airline")
+        return {"data": [{
+            "fr24_id": hashlib.sha1(f"{flight_number}|{timestamp}".encode("utf-8")).hexdigest()[:8],
+            "flight": flight_number,
+            "callsign": flight_number,
+            "lat": origin["lat"],
+            "lon": origin["long"],
+            "track": 90,
+            "alt": 35000,
+            "gspeed": 450,
+            "vspeed": 0,
+            "squawk": "1000",
+            "timestamp": datetime.fromtimestamp(int(timestamp or 0), timezone.utc).isoformat(),
+            "source": "ADSB",
+            "hex": "ABCDEF",
+            "type": self._pick(self.aircraft, flight_number, "aircraft"),
+            "reg": "D-BENCH",
+            "painted_as": airline["airline_icao"],
+            "operating_as": airline["airline_icao"],
+            "orig_iata": origin["iata_code"],
+            "orig_icao": "X" + origin["iata_code"],
+            "dest_iata": destination["iata_code"],
+            "dest_icao": "X" + destination["iata_code"],
+            "eta": None
+        }]}
+
+    def aviationstack_payload(self, dep_iata: str, arr_iata: str) -> dict:
+        return {"data": [
+            {
+                "flight": {"iata": f"{airline['airline_icao'][:2]}{100 + index}"},
+                "airline": {"name": airline["airline_name"]},
+                "departure": {"iata": dep_iata, "timezone": "UTC", "scheduled": f"2024-01-01T{6 + index:02d}:00:00+00:00"},
+                "arrival": {"iata": arr_iata}
+            }
+            for index, airline in enumerate(self.airlines[:5])
+        ]}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                if parsed.path.startswith("/fr24/"):
+                    stub.calls["fr24"] += 1
+                    time.sleep(stub.fr24_latency_ms / 1000)
+                    payload = stub.fr24_payload(query.get("flights", ""), query.get("timestamp", "0"))
+                elif parsed.path.startswith("/aviationstack/"):
+                    stub.calls["aviationstack"] += 1
+                    time.sleep(stub.aviationstack_latency_ms / 1000)
+                    payload = stub.aviationstack_payload(query.get("dep_iata", ""), query.get("arr_iata", ""))
+                else:
+                    self.send_error(404)
+                    return
+
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="http-stubs", daemon=True).start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
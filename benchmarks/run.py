@@ -0,0 +1,323 @@
+from benchmarks.data import generate_dataset, PASSWORD
+from benchmarks.serve import add_dataset_arguments, history_sizes
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+import argparse
+import json
+import platform
+import random
+import requests
+import socket
+import subprocess
+import sys
+import time
+
+# Drives every endpoint at increasing concurrency against benchmarks.serve and reports
+# throughput and p50/p95/p99 latency per endpoint. Results are written as JSON so two
+# commits can be compared:
+#
+#     python -m benchmarks.run --output before.json
+#     python -m benchmarks.run --output after.json --baseline before.json
+#
+# Latency of the BigQuery stand-in and the HTTP stubs is set with --bq-latency-ms,
+# --insert-latency-ms, --fr24-latency-ms and --aviationstack-latency-ms.
+
+class Scenario:
+    def __init__(self, name: str, build: Callable[[random.Random], dict]):
+        self.name = name
+        self.build = build
+
+def build_scenarios(dataset: dict, tokens: Dict[str, str]) -> List[Scenario]:
+    users_by_size = {}
+    for user in dataset["users"]:
+        users_by_size.setdefault(user["history_size"], []).append(user)
+    airports = dataset["airports"]
+    airlines = dataset["airlines"]
+    aircraft = [row["aircraft_code"] for row in dataset["co2"]]
+
+    def auth(user: dict) -> dict:
+        return {"Authorization": f"Bearer {tokens[user['user_id']]}"}
+
+    scenarios = []
+
+    for size, users in sorted(users_by_size.items()):
+        def flights(rng, users=users):
+            user = rng.choice(users)
+            return {"method": "GET", "path": "/flights", "params": {"user_id": user["user_id"]}, "headers": auth(user)}
+
+        def flights_page(rng, users=users):
+            user = rng.choice(users)
+            return {"method": "GET", "path": "/flights", "params": {"user_id": user["user_id"], "limit": 50}, "headers": auth(user)}
+
+        def statistics(rng, users=users):
+            user = rng.choice(users)
+            return {"method": "GET", "path": "/statistics", "params": {"user_id": user["user_id"]}, "headers": auth(user)}
+
+        def statistics_range(rng, users=users):
+            user = rng.choice(users)
+            params = {"user_id": user["user_id"], "from_date": "2018-01-01", "to_date": "2019-12-31"}
+            return {"method": "GET", "path": "/statistics", "params": params, "headers": auth(user)}
+
+        scenarios.extend([
+            Scenario(f"GET /flights [history={size}]", flights),
+            Scenario(f"GET /flights?limit=50 [history={size}]", flights_page),
+            Scenario(f"GET /statistics [history={size}]", statistics),
+            Scenario(f"GET /statistics?from_date&to_date [history={size}]", statistics_range)
+        ])
+
+    all_users = dataset["users"]
+
+    def login(rng):
+        user = rng.choice(all_users)
+        return {"method": "POST", "path": "/login", "json": {"email": user["email"], "password": PASSWORD}}
+
+    def add_flight_manual(rng):
+        user = rng.choice(all_users)
+        origin, destination = rng.sample(airports, 2)
+        airline = rng.choice(airlines)
+        body = {
+            "user_id": user["user_id"],
+            "flight_number": f"{airline['airline_icao'][:2]}{rng.randrange(1, 9999)}",
+            "date": f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+            "airline_icao": airline["airline_icao"],
+            "airline_name": airline["airline_name"],
+            "aircraft": rng.choice(aircraft),
+            "origin_iata": origin["iata_code"],
+            "origin_name": origin["name"],
+            "destination_iata": destination["iata_code"],
+            "destination_name": destination["name"],
+            "departure_time": "10:00",
+            "timezone": "UTC"
+        }
+        return {"method": "POST", "path": "/add-flight-manual", "json": body, "headers": auth(user)}
+
+    def add_flight_api(rng):
+        # Random flight numbers and dates so most lookups miss the FR24 cache. FR24
+        # lookups are only made for the last 30 days.
+        user = rng.choice(all_users)
+        body = {
+            "user_id": user["user_id"],
+            "flight_number": f"{rng.choice(airlines)['airline_icao'][:2]}{rng.randrange(1, 9999)}",
+            "date": (date.today() - timedelta(days=rng.randrange(30))).isoformat(),
+            "departure_time": f"{rng.randrange(24):02d}:00",
+            "timezone": "UTC"
+        }
+        return {"method": "POST", "path": "/add-flight-api", "json": body, "headers": auth(user)}
+
+    def route_info(rng):
+        # Drawn from a small set of pairs so the route cache sees repeats
+        user = rng.choice(all_users)
+        origin, destination = airports[rng.randrange(20)], airports[20 + rng.randrange(20)]
+        params = {"dep_iata": origin["iata_code"], "arr_iata": destination["iata_code"]}
+        return {"method": "GET", "path": "/route-info", "params": params, "headers": auth(user)}
+
+    scenarios.extend([
+        Scenario("POST /login", login),
+        Scenario("POST /add-flight-manual", add_flight_manual),
+        Scenario("POST /add-flight-api", add_flight_api),
+        Scenario("GET /route-info", route_info)
+    ])
+    return scenarios
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(fraction * len(values)))], 2)
+
+def run_level(base_url: str, scenario: Scenario, concurrency: int, duration: float, warmup: float, seed: int) -> dict:
+    def worker(index: int):
+        rng = random.Random(f"{seed}|{scenario.name}|{concurrency}|{index}")
+        session = requests.Session()
+        latencies = []
+        errors = 0
+        started = perf_counter()
+        measure_from = started + warmup
+        deadline = measure_from + duration
+
+        while True:
+            now = perf_counter()
+            if now >= deadline:
+                break
+            request = scenario.build(rng)
+            try:
+                response = session.request(
+                    request["method"], base_url + request["path"],
+                    params=request.get("params"), json=request.get("json"), headers=request.get("headers"), timeout=120
+                )
+                failed = response.status_code >= 400
+            except requests.RequestException:
+                failed = True
+            finished = perf_counter()
+            if now >= measure_from:
+                latencies.append((finished - now) * 1000)
+                errors += failed
+        return latencies, errors
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(worker, range(concurrency)))
+
+    latencies = sorted(latency for worker_latencies, _ in outcomes for latency in worker_latencies)
+    errors = sum(worker_errors for _, worker_errors in outcomes)
+
+    return {
+        "scenario": scenario.name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / duration, 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": round(latencies[-1], 2) if latencies else None
+    }
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(args) -> subprocess.Popen:
+    command = [
+        sys.executable, "-m", "benchmarks.serve",
+        "--port", str(args.port),
+        "--bq-latency-ms", str(args.bq_latency_ms),
+        "--bq-jitter-ms", str(args.bq_jitter_ms),
+        "--insert-latency-ms", str(args.insert_latency_ms),
+        "--fr24-latency-ms", str(args.fr24_latency_ms),
+        "--aviationstack-latency-ms", str(args.aviationstack_latency_ms),
+        "--seed", str(args.seed),
+        "--users-per-size", str(args.users_per_size),
+        "--history-sizes", args.history_sizes
+    ]
+    if args.replica:
+        command.append("--replica")
+    return subprocess.Popen(command)
+
+def wait_until_ready(base_url: str, server: Optional[subprocess.Popen], timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"Benchmark server exited with code {server.returncode}")
+        try:
+            if requests.get(base_url + "/", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Benchmark server did not come up at {base_url}")
+
+def login_all(base_url: str, users: List[dict]) -> Dict[str, str]:
+    tokens = {}
+    for user in users:
+        response = requests.post(base_url + "/login", json={"email": user["email"], "password": PASSWORD}, timeout=60)
+        response.raise_for_status()
+        tokens[user["user_id"]] = response.json()["access_token"]
+    return tokens
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def print_results(results: List[dict]):
+    print(f"{'scenario':<52} {'conc':>5} {'reqs':>7} {'err':>5} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for result in results:
+        print(
+            f"{result['scenario']:<52} {result['concurrency']:>5} {result['requests']:>7} {result['errors']:>5} "
+            f"{result['throughput_rps']:>9} {str(result['p50_ms']):>9} {str(result['p95_ms']):>9} {str(result['p99_ms']):>9}"
+        )
+
+def compare(results: List[dict], baseline_path: str, max_regression: Optional[float]) -> bool:
+    # Returns False when a p95 got worse than max_regression percent
+    with open(baseline_path) as f:
+        baseline = {(result["scenario"], result["concurrency"]): result for result in json.load(f)["results"]}
+
+    ok = True
+    print(f"\nCompared with {baseline_path}")
+    print(f"{'scenario':<52} {'conc':>5} {'p95 before':>11} {'p95 after':>11} {'change':>8} {'rps change':>11}")
+    for result in results:
+        before = baseline.get((result["scenario"], result["concurrency"]))
+        if before is None or not before["p95_ms"] or result["p95_ms"] is None:
+            continue
+        change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+        rps_change = (result["throughput_rps"] - before["throughput_rps"]) / before["throughput_rps"] * 100 if before["throughput_rps"] else 0
+        flag = ""
+        if max_regression is not None and change > max_regression:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{result['scenario']:<52} {result['concurrency']:>5} {before['p95_ms']:>11} {result['p95_ms']:>11} {change:>+7.1f}% {rps_change:>+10.1f}%{flag}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API against in-memory BigQuery and HTTP stubs.")
+    parser.add_argument("--url", help="benchmark an already running benchmarks.serve instead of starting one")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=5, help="measured seconds per scenario and level")
+    parser.add_argument("--warmup", type=float, default=1, help="unmeasured seconds before each run")
+    parser.add_argument("--scenarios", default=None, help="only run scenarios whose name contains one of these comma-separated strings")
+    parser.add_argument("--bq-latency-ms", type=float, default=150)
+    parser.add_argument("--bq-jitter-ms", type=float, default=50)
+    parser.add_argument("--insert-latency-ms", type=float, default=50)
+    parser.add_argument("--fr24-latency-ms", type=float, default=200)
+    parser.add_argument("--aviationstack-latency-ms", type=float, default=200)
+    parser.add_argument("--replica", action="store_true", help="serve reads from the local SQLite replica")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=None, help="exit non-zero if a p95 grows by more than this percent")
+    add_dataset_arguments(parser)
+    args = parser.parse_args()
+
+    dataset = generate_dataset(args.seed, args.users_per_size, history_sizes(args.history_sizes))
+
+    server = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        args.port = args.port or free_port()
+        base_url = f"http://127.0.0.1:{args.port}"
+        server = start_server(args)
+
+    try:
+        wait_until_ready(base_url, server)
+        tokens = login_all(base_url, dataset["users"])
+        scenarios = build_scenarios(dataset, tokens)
+        if args.scenarios:
+            wanted = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+            scenarios = [scenario for scenario in scenarios if any(name in scenario.name for name in wanted)]
+
+        results = []
+        for scenario in scenarios:
+            for concurrency in [int(level) for level in args.concurrency.split(",")]:
+                result = run_level(base_url, scenario, concurrency, args.duration, args.warmup, args.seed)
+                results.append(result)
+                print(f"{scenario.name} @ {concurrency}: {result['throughput_rps']} rps, p95 {result['p95_ms']} ms", file=sys.stderr)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "settings": vars(args)
+        },
+        "results": results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print_results(results)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline and not compare(results, args.baseline, args.max_regression):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from benchmarks.data import generate_dataset, PASSWORD
+from benchmarks.fakes import FakeBigQueryClient, StubServer
+import argparse
+import os
+import sys
+import tempfile
+import types
+
+# Runs app.py against the in-memory BigQuery stand-in and the local FR24 and
+# AviationStack stubs. Started by benchmarks.run, or by hand to poke at the API:
+#
+#     python -m benchmarks.serve --port 8090 --bq-latency-ms 200
+
+TABLES = {
+    "USERS_TABLE": "users",
+    "FLIGHTS_TABLE": "flights",
+    "AIRPORTS_TABLE": "airports",
+    "AIRLINES_TABLE": "airlines",
+    "CO2_TABLE": "co2",
+    "TOMBSTONES_TABLE": "tombstones",
+    "USER_CHANGES_TABLE": "user_changes"
+}
+
+def add_dataset_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--users-per-size", type=int, default=5, help="users generated for every history size")
+    parser.add_argument("--history-sizes", default="10,100,1000", help="comma-separated flights per user")
+
+def history_sizes(value: str) -> list:
+    return [int(size) for size in value.split(",") if size.strip()]
+
+def install_fakes(args) -> StubServer:
+    # Must run before anything imports core.config or db.client
+    dataset = generate_dataset(args.seed, args.users_per_size, history_sizes(args.history_sizes))
+
+    stubs = StubServer(
+        dataset["airports"], dataset["airlines"], [row["aircraft_code"] for row in dataset["co2"]],
+        fr24_latency_ms=args.fr24_latency_ms, aviationstack_latency_ms=args.aviationstack_latency_ms
+    )
+    stubs.start()
+
+    workdir = tempfile.mkdtemp(prefix="skyledger-bench-")
+    os.environ.update(TABLES)
+    os.environ.update({
+        "SECRET_KEY": "benchmark-secret",
+        "ALGORITHM": "HS256",
+        "API_KEY": "benchmark",
+        "AS_API_KEY": "benchmark",
+        "FR24_API_URL": stubs.fr24_url,
+        "AS_API_URL": stubs.aviationstack_url,
+        "FR24_CACHE_PATH": os.path.join(workdir, "fr24_cache.sqlite3"),
+        "REPLICA_PATH": os.path.join(workdir, "replica.sqlite3"),
+        "REPLICA_ENABLED": "true" if args.replica else "false"
+    })
+
+    import bcrypt
+    from core.config import BCRYPT_ROUNDS
+
+    # One hash shared by every user, login still pays the full verify cost
+    password_hash = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
+    users = [{**{key: value for key, value in user.items() if key != "history_size"}, "password_hash": password_hash} for user in dataset["users"]]
+
+    fake = FakeBigQueryClient(
+        {
+            TABLES["USERS_TABLE"]: users,
+            TABLES["FLIGHTS_TABLE"]: dataset["flights"],
+            TABLES["AIRPORTS_TABLE"]: dataset["airports"],
+            TABLES["AIRLINES_TABLE"]: dataset["airlines"],
+            TABLES["CO2_TABLE"]: dataset["co2"],
+            TABLES["TOMBSTONES_TABLE"]: []
+        },
+        query_latency_ms=args.bq_latency_ms,
+        insert_latency_ms=args.insert_latency_ms,
+        jitter_ms=args.bq_jitter_ms,
+        flights_table=TABLES["FLIGHTS_TABLE"],
+        tombstones_table=TABLES["TOMBSTONES_TABLE"]
+    )
+
+    from db.instrumentation import InstrumentedClient
+
+    module = types.ModuleType("db.client")
+    module.client = InstrumentedClient(fake)
+    sys.modules["db.client"] = module
+    return stubs
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API against in-memory BigQuery and HTTP stubs.")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--bq-latency-ms", type=float, default=0)
+    parser.add_argument("--bq-jitter-ms", type=float, default=0)
+    parser.add_argument("--insert-latency-ms", type=float, default=0)
+    parser.add_argument("--fr24-latency-ms", type=float, default=0)
+    parser.add_argument("--aviationstack-latency-ms", type=float, default=0)
+    parser.add_argument("--replica", action="store_true", help="serve reads from the local SQLite replica")
+    add_dataset_arguments(parser)
+    args = parser.parse_args()
+
+    install_fakes(args)
+
+    import uvicorn
+    from app import app
+
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
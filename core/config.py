@@ -13,6 +13,8 @@ flights_table = os.getenv("FLIGHTS_TABLE")
 airport_table = os.getenv("AIRPORTS_TABLE")
 airline_table = os.getenv("AIRLINES_TABLE")
 co2_table = os.getenv("CO2_TABLE")
+tombstones_table = os.getenv("TOMBSTONES_TABLE", "tombstones")
+user_changes_table = os.getenv("USER_CHANGES_TABLE", "user_changes")
 
 # Authentication
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -22,4 +24,124 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 # External APIs
 AS_API_KEY = os.getenv("AS_API_KEY")
 AS_API_URL = os.getenv("AS_API_URL")
-API_KEY = os.getenv("API_KEY")
\ No newline at end of file
+API_KEY = os.getenv("API_KEY")
+FR24_API_URL = os.getenv("FR24_API_URL", "https://fr24api.flightradar24.com/api/historic/flight-positions/full")
+
+# Reference data cache (airports, airlines, aircraft CO2 factors)
+REFERENCE_CACHE_TTL_SECONDS = int(os.getenv("REFERENCE_CACHE_TTL_SECONDS", 3600))
+
+# Concurrent enrichment of flights fetched from FR24
+ENRICHMENT_MAX_WORKERS = int(os.getenv("ENRICHMENT_MAX_WORKERS", 16))
+
+# FlightRadar24 departure offset probing: "parallel", "hedged" or "sequential"
+FR24_PROBE_POLICY = os.getenv("FR24_PROBE_POLICY", "parallel")
+FR24_HEDGE_DELAY_SECONDS = float(os.getenv("FR24_HEDGE_DELAY_SECONDS", 0.5))
+FR24_TIMEOUT_SECONDS = float(os.getenv("FR24_TIMEOUT_SECONDS", 10))
+FR24_MAX_WORKERS = int(os.getenv("FR24_MAX_WORKERS", 16))
+
+# FlightRadar24 response cache (in-memory LRU in front of a local SQLite file)
+FR24_CACHE_PATH = os.getenv("FR24_CACHE_PATH", "/tmp/fr24_cache.sqlite3")
+FR24_CACHE_MAX_ENTRIES = int(os.getenv("FR24_CACHE_MAX_ENTRIES", 10000))
+FR24_NEGATIVE_TTL_SECONDS = int(os.getenv("FR24_NEGATIVE_TTL_SECONDS", 300))
+
+# AviationStack route schedule cache
+AS_TIMEOUT_SECONDS = float(os.getenv("AS_TIMEOUT_SECONDS", 10))
+ROUTE_CACHE_TTL_SECONDS = int(os.getenv("ROUTE_CACHE_TTL_SECONDS", 6 * 3600))
+ROUTE_CACHE_MAX_ENTRIES = int(os.getenv("ROUTE_CACHE_MAX_ENTRIES", 5000))
+
+# Per-user statistics aggregates, rebuilt from BigQuery after this many seconds
+STATISTICS_CACHE_TTL_SECONDS = int(os.getenv("STATISTICS_CACHE_TTL_SECONDS", 900))
+# Users whose aggregates are kept in memory, least recently used are dropped first
+STATISTICS_CACHE_MAX_USERS = int(os.getenv("STATISTICS_CACHE_MAX_USERS", 10000))
+
+# Rows fetched per BigQuery page when streaming GET /flights as NDJSON
+FLIGHTS_STREAM_PAGE_SIZE = int(os.getenv("FLIGHTS_STREAM_PAGE_SIZE", 500))
+
+# Bulk flight import
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", 5000))
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 500))
+IMPORT_TIMEOUT_SECONDS = float(os.getenv("IMPORT_TIMEOUT_SECONDS", 120))
+
+# Micro-batching of BigQuery row inserts across requests: "streaming" or "storage_write"
+WRITE_BACKEND = os.getenv("WRITE_BACKEND", "streaming")
+WRITE_BATCH_MAX_ROWS = int(os.getenv("WRITE_BATCH_MAX_ROWS", 500))
+WRITE_BATCH_MAX_LATENCY_MS = int(os.getenv("WRITE_BATCH_MAX_LATENCY_MS", 25))
+
+# Password hashing process pool
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", os.cpu_count() or 1))
+PASSWORD_POOL_MAX_QUEUE = int(os.getenv("PASSWORD_POOL_MAX_QUEUE", 64))
+
+# Verified JWT claims cache
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", 10000))
+
+# In-memory user directory, fully reloaded from BigQuery at this interval
+USER_DIRECTORY_REFRESH_SECONDS = int(os.getenv("USER_DIRECTORY_REFRESH_SECONDS", 300))
+# Password, email and account changes are logged by every instance and polled by the
+# directory at this interval; a login for a user changed since their entry was loaded
+# goes to BigQuery
+USER_DIRECTORY_CHANGES_SECONDS = int(os.getenv("USER_DIRECTORY_CHANGES_SECONDS", 5))
+
+# Longest a streamed row can take to leave the streaming buffer and show up in
+# APPENDS, change feeds read again from this far back
+STREAMING_BUFFER_SECONDS = int(os.getenv("STREAMING_BUFFER_SECONDS", 5400))
+
+# Async data-access layer: executor size, concurrent calls and deadline (seconds) per query class
+BIGQUERY_MAX_WORKERS = int(os.getenv("BIGQUERY_MAX_WORKERS", 64))
+QUERY_CLASS_LIMITS = {
+    "point": int(os.getenv("BIGQUERY_CONCURRENCY_POINT", 32)),
+    "scan": int(os.getenv("BIGQUERY_CONCURRENCY_SCAN", 16)),
+    "dml": int(os.getenv("BIGQUERY_CONCURRENCY_DML", 8)),
+    "insert": int(os.getenv("BIGQUERY_CONCURRENCY_INSERT", 32)),
+    "external": int(os.getenv("BIGQUERY_CONCURRENCY_EXTERNAL", 32))
+}
+QUERY_CLASS_DEADLINES = {
+    "point": float(os.getenv("BIGQUERY_DEADLINE_POINT", 10)),
+    "scan": float(os.getenv("BIGQUERY_DEADLINE_SCAN", 30)),
+    "dml": float(os.getenv("BIGQUERY_DEADLINE_DML", 60)),
+    "insert": float(os.getenv("BIGQUERY_DEADLINE_INSERT", 15)),
+    "external": float(os.getenv("BIGQUERY_DEADLINE_EXTERNAL", 30))
+}
+
+# Short query mode for small parameterised lookups (jobs.query without a job where possible)
+SHORT_QUERY_JOB_CREATION_OPTIONAL = os.getenv("SHORT_QUERY_JOB_CREATION_OPTIONAL", "true").lower() == "true"
+SHORT_QUERY_LATENCY_SAMPLES = int(os.getenv("SHORT_QUERY_LATENCY_SAMPLES", 1000))
+
+# Delete tombstones are applied to the flights and users tables once per interval.
+# DML cannot touch rows still in the streaming buffer, so only tombstones older than
+# the minimum age are applied. Only one instance should compact: enable the loop on a
+# single instance or run `python -m db.tombstones` from a scheduled job instead.
+TOMBSTONE_COMPACTION_ENABLED = os.getenv("TOMBSTONE_COMPACTION_ENABLED", "false").lower() == "true"
+TOMBSTONE_COMPACTION_INTERVAL_SECONDS = int(os.getenv("TOMBSTONE_COMPACTION_INTERVAL_SECONDS", 3600))
+TOMBSTONE_COMPACTION_MIN_AGE_SECONDS = int(os.getenv("TOMBSTONE_COMPACTION_MIN_AGE_SECONDS", 5400))
+
+# Optional local SQLite read replica of the users and flights tables. Reads are served
+# from it while its last snapshot is younger than the staleness bound.
+REPLICA_ENABLED = os.getenv("REPLICA_ENABLED", "false").lower() == "true"
+REPLICA_PATH = os.getenv("REPLICA_PATH", "/tmp/skyledger_replica.sqlite3")
+REPLICA_REFRESH_SECONDS = int(os.getenv("REPLICA_REFRESH_SECONDS", 60))
+# Between refreshes only the rows appended since the last one are fetched, a full
+# snapshot is re-imported once per reconcile interval
+REPLICA_RECONCILE_SECONDS = int(os.getenv("REPLICA_RECONCILE_SECONDS", 21600))
+REPLICA_MAX_STALENESS_SECONDS = int(os.getenv("REPLICA_MAX_STALENESS_SECONDS", 300))
+
+# Sampling profiler, switched on per endpoint, per share of requests or per request header
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+PROFILER_ENDPOINTS = [endpoint.strip() for endpoint in os.getenv("PROFILER_ENDPOINTS", "").split(",") if endpoint.strip()]
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", 0))
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", 5))
+PROFILER_HEADER = os.getenv("PROFILER_HEADER", "X-Profile")
+# Bounds on the collected profile; further labels and stacks are counted under "other"
+PROFILER_MAX_LABELS = int(os.getenv("PROFILER_MAX_LABELS", 100))
+PROFILER_MAX_STACKS = int(os.getenv("PROFILER_MAX_STACKS", 20000))
+
+# Users allowed to call the /admin endpoints
+ADMIN_USER_IDS = {user_id.strip() for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip()}
+
+# Great-circle distances memoized per airport pair
+ROUTE_DISTANCE_MAX_ENTRIES = int(os.getenv("ROUTE_DISTANCE_MAX_ENTRIES", 200000))
+
+# Grid cell size of the nearest-airport index, and how close the live position of a
+# flight must be to an airport to stand in for a missing origin or destination
+AIRPORT_INDEX_CELL_DEGREES = float(os.getenv("AIRPORT_INDEX_CELL_DEGREES", 1.0))
+AIRPORT_RESOLVE_RADIUS_KM = float(os.getenv("AIRPORT_RESOLVE_RADIUS_KM", 10))
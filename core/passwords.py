@@ -0,0 +1,73 @@
+from concurrent.futures import ProcessPoolExecutor
+from core.config import BCRYPT_ROUNDS, PASSWORD_POOL_WORKERS, PASSWORD_POOL_MAX_QUEUE
+import asyncio
+import bcrypt
+import multiprocessing
+import threading
+
+class PasswordPoolBusy(Exception):
+    pass
+
+# Run inside the worker processes, so they have to be plain module-level functions
+def _hash_password(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+def _verify_password(password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+def hash_rounds(hashed_password: str) -> int:
+    # bcrypt hashes look like $2b$12$<salt+hash>
+    try:
+        return int(hashed_password.split("$")[2])
+    except (IndexError, ValueError):
+        return 0
+
+class PasswordHasher:
+    # bcrypt work runs in a bounded process pool so it neither blocks the event loop
+    # nor holds the GIL. Once max_queue calls are in flight new ones are rejected
+    # with PasswordPoolBusy instead of queueing without limit.
+
+    def __init__(self, workers: int, max_queue: int, rounds: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.rounds = rounds
+        self._executor = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn keeps the workers free of the parent's threads and clients
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    async def _run(self, func, *args):
+        with self._lock:
+            if self._in_flight >= self.max_queue:
+                raise PasswordPoolBusy()
+            self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash_password, password, self.rounds)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(_verify_password, password, hashed_password)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        return hash_rounds(hashed_password) != self.rounds
+
+    def stop(self):
+        # Waits for the workers to exit, so their semaphores and pipes are released
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+password_hasher = PasswordHasher(PASSWORD_POOL_WORKERS, PASSWORD_POOL_MAX_QUEUE, BCRYPT_ROUNDS)
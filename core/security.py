@@ -1,19 +1,61 @@
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from typing import Optional
 import bcrypt
 import jwt as pyjwt
 import os
-from datetime import datetime, timedelta
-from core.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from datetime import datetime, timedelta, timezone
+from core.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, TOKEN_CACHE_MAX_ENTRIES, ADMIN_USER_IDS
+from core.token_cache import TokenCache
 
 security = HTTPBearer()
 
+token_cache = TokenCache(TOKEN_CACHE_MAX_ENTRIES, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
 def verify_password(plain_password: str, hashed_password: str):
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    token = credentials.credentials
+    digest = TokenCache.digest(token)
+
+    # Tokens already verified during this session skip the signature check
+    payload = token_cache.get(digest)
+    if payload is None:
+        payload = decode_token(token)
+        token_cache.put(digest, payload)
+
+    if token_cache.is_revoked(payload):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, 
+            detail="Token has been revoked"
+        )
+    return payload
+
+def verify_admin(payload: dict = Depends(verify_token)):
+    if payload.get("user_id") not in ADMIN_USER_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, 
+            detail="Admin access required"
+        )
+    return payload
+
+def is_admin_authorization(authorization: Optional[str]) -> bool:
+    # verify_admin for an Authorization header read outside a route, never raises
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        payload = verify_token(HTTPAuthorizationCredentials(scheme=scheme, credentials=token))
+    except HTTPException:
+        return False
+    return payload.get("user_id") in ADMIN_USER_IDS
+
+def revoke_user_tokens(user_id: str):
+    token_cache.revoke_user(user_id)
+
+def decode_token(token: str):
     try:
-        token = credentials.credentials
         payload = pyjwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
     except pyjwt.exceptions.ExpiredSignatureError:
@@ -34,7 +76,9 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
 
 def create_access_token(data: dict):
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    issued_at = datetime.now(timezone.utc)
+    expire = issued_at + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    # A float iat, so a token issued right after a revocation in the same second survives it
+    to_encode.update({"exp": expire, "iat": issued_at.timestamp()})
     encoded_jwt = pyjwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
\ No newline at end of file
@@ -0,0 +1,78 @@
+from cachetools import LRUCache
+from typing import Optional
+import hashlib
+import threading
+import time
+
+class TokenCache:
+    # Bounded LRU of verified JWT claims keyed by a SHA-256 digest of the token.
+    # Entries are only served until the token's own exp, and tokens issued before
+    # a user's revocation time are rejected even if their signature is valid. A
+    # revocation is forgotten once every token it covers has expired.
+
+    def __init__(self, max_entries: int, token_lifetime: float):
+        self._cache = LRUCache(maxsize=max_entries)
+        self._digests_by_user = {}
+        # Oldest revocation first
+        self._revoked_before = {}
+        self.token_lifetime = token_lifetime
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "revoked": 0}
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, digest: str) -> Optional[dict]:
+        with self._lock:
+            payload = self._cache.get(digest)
+            if payload is None:
+                self.counters["misses"] += 1
+                return None
+            if payload.get("exp") is not None and payload["exp"] <= time.time():
+                # Let the full decode raise the proper expiry error
+                del self._cache[digest]
+                self.counters["expired"] += 1
+                return None
+            self.counters["hits"] += 1
+            return payload
+
+    def put(self, digest: str, payload: dict):
+        with self._lock:
+            self._cache[digest] = payload
+            user_id = payload.get("user_id")
+            if user_id is not None:
+                self._digests_by_user.setdefault(user_id, set()).add(digest)
+
+    def is_revoked(self, payload: dict) -> bool:
+        with self._lock:
+            revoked_before = self._revoked_before.get(payload.get("user_id"))
+            if revoked_before is None:
+                return False
+            # iat carries sub-second precision, older tokens truncated to the second
+            # are rejected in the second of the revocation too
+            if payload.get("iat", 0) < revoked_before:
+                self.counters["revoked"] += 1
+                return True
+            return False
+
+    def revoke_user(self, user_id: str):
+        # Called when a user is deleted or changes their password
+        now = time.time()
+        with self._lock:
+            self._revoked_before.pop(user_id, None)
+            self._revoked_before[user_id] = now
+            for digest in self._digests_by_user.pop(user_id, set()):
+                self._cache.pop(digest, None)
+            for revoked_user, revoked_before in list(self._revoked_before.items()):
+                if revoked_before > now - self.token_lifetime:
+                    break
+                del self._revoked_before[revoked_user]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self._cache)
+        lookups = stats["hits"] + stats["misses"] + stats["expired"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0
+        return stats
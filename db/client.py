@@ -1,4 +1,5 @@
 from google.cloud import bigquery
 from core.config import project_id
+from db.instrumentation import InstrumentedClient
 
-client = bigquery.Client(project=project_id)
\ No newline at end of file
+client = InstrumentedClient(bigquery.Client(project=project_id))
\ No newline at end of file
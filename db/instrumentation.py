@@ -0,0 +1,84 @@
+from functools import lru_cache
+from time import perf_counter
+from utils.metrics import bigquery_query_duration, bigquery_queries, bigquery_bytes_processed, record_span
+import hashlib
+import re
+
+TABLE_PATTERN = re.compile(r"`([^`]+)`")
+
+@lru_cache(maxsize=1024)
+def query_template(query: str) -> str:
+    # Stable label for a query text, e.g. "SELECT users#1a2b3c4d". Queries are
+    # parameterised, so the text only varies with the code path that built it.
+    normalized = " ".join(query.split())
+    verb = normalized.split(" ", 1)[0].upper() if normalized else "EMPTY"
+    table = TABLE_PATTERN.search(normalized)
+    table_name = table.group(1).rsplit(".", 1)[-1] if table else "-"
+    return f"{verb} {table_name}#{hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:8]}"
+
+def _record(template: str, operation: str, started: float, result):
+    duration = perf_counter() - started
+    cache_hit = getattr(result, "cache_hit", None)
+    bytes_processed = getattr(result, "total_bytes_processed", None)
+
+    bigquery_query_duration.observe(duration, template=template, operation=operation)
+    bigquery_queries.inc(template=template, operation=operation, cache_hit="unknown" if cache_hit is None else str(bool(cache_hit)).lower())
+    if bytes_processed:
+        bigquery_bytes_processed.inc(bytes_processed, template=template)
+    record_span("bigquery", duration * 1000)
+
+class InstrumentedJob:
+    # QueryJob proxy that records the query once its result is read
+
+    def __init__(self, job, template: str, started: float):
+        self._job = job
+        self._template = template
+        self._started = started
+        self._recorded = False
+
+    def result(self, *args, **kwargs):
+        try:
+            return self._job.result(*args, **kwargs)
+        finally:
+            if not self._recorded:
+                self._recorded = True
+                _record(self._template, "query", self._started, self._job)
+
+    def __getattr__(self, name):
+        return getattr(self._job, name)
+
+class InstrumentedClient:
+    # Wraps bigquery.Client and records time, bytes processed and cache hits per
+    # query template. Everything else is passed through to the wrapped client.
+
+    def __init__(self, client):
+        object.__setattr__(self, "_client", client)
+
+    def query(self, query: str, *args, **kwargs):
+        started = perf_counter()
+        job = self._client.query(query, *args, **kwargs)
+        return InstrumentedJob(job, query_template(query), started)
+
+    def query_and_wait(self, query: str, *args, **kwargs):
+        started = perf_counter()
+        rows = None
+        try:
+            rows = self._client.query_and_wait(query, *args, **kwargs)
+            return rows
+        finally:
+            _record(query_template(query), "query_and_wait", started, rows)
+
+    def insert_rows_json(self, table, *args, **kwargs):
+        started = perf_counter()
+        try:
+            return self._client.insert_rows_json(table, *args, **kwargs)
+        finally:
+            table_id = table if isinstance(table, str) else getattr(table, "table_id", str(table))
+            _record(f"INSERT {table_id.rsplit('.', 1)[-1]}", "insert_rows_json", started, None)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def __setattr__(self, name, value):
+        # e.g. default_job_creation_mode has to reach the real client
+        setattr(self._client, name, value)
@@ -0,0 +1,51 @@
+from google.cloud import bigquery
+from core.config import dataset_id, flights_table
+from db.client import client
+from db.schema import FLIGHTS_SCHEMA, flights_table_definition, tombstones_table_definition, tombstones_table_id
+import argparse
+
+def migrate_flights(source_table: str, target_table: str, backfill: bool = True):
+    # Creates the partitioned and clustered flights table and copies the existing
+    # rows into it, casting every column to the managed schema
+    source_id = f"{client.project}.{dataset_id}.{source_table}"
+    target_id = f"{client.project}.{dataset_id}.{target_table}"
+
+    client.create_table(flights_table_definition(target_id), exists_ok=True)
+    client.create_table(tombstones_table_definition(tombstones_table_id(target_id)), exists_ok=True)
+    print(f"Table {target_id} is ready")
+
+    if not backfill:
+        return
+
+    source_columns = {field.name for field in client.get_table(source_id).schema}
+
+    columns = []
+    for field in FLIGHTS_SCHEMA:
+        bigquery_type = "BOOL" if field.field_type == "BOOLEAN" else field.field_type
+        if field.name not in source_columns:
+            columns.append(f"CAST(NULL AS {bigquery_type}) AS {field.name}")
+        elif field.field_type == "DATE":
+            columns.append(f"SAFE_CAST(CAST({field.name} AS STRING) AS DATE) AS {field.name}")
+        else:
+            columns.append(f"SAFE_CAST({field.name} AS {bigquery_type}) AS {field.name}")
+
+    query = f"""
+    INSERT INTO `{target_id}` ({', '.join(field.name for field in FLIGHTS_SCHEMA)})
+    SELECT {', '.join(columns)}
+    FROM `{source_id}`
+    WHERE flight_id IS NOT NULL AND user_id IS NOT NULL
+    """
+
+    job = client.query(query)
+    job.result()
+    print(f"Copied {job.num_dml_affected_rows} rows from {source_id}")
+    print(f"Point FLIGHTS_TABLE at {target_table} to start using it")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the partitioned and clustered flights table and backfill it.")
+    parser.add_argument("--source", default=flights_table, help="existing flights table (default: FLIGHTS_TABLE)")
+    parser.add_argument("--target", default=f"{flights_table}_clustered", help="table to create")
+    parser.add_argument("--no-backfill", action="store_true", help="only create the table")
+    args = parser.parse_args()
+
+    migrate_flights(args.source, args.target, backfill=not args.no_backfill)
@@ -1,21 +1,133 @@
 from db.client import client
-from core.config import dataset_id, user_table
+from db.user_directory import user_directory, USER_COLUMNS
+from db.short_query import short_queries
+from db.replica import replica
+from db.schema import active_flights_query, deleted_users_filter
+from core.config import dataset_id, user_table, flights_table
 from google.cloud import bigquery
+from datetime import date
+from typing import List, Optional, Tuple
+import time
 
 def get_user(email: str):
+    # Directory entries are used while no password or email change and no delete
+    # has been logged for the user since they were read, see db.user_directory
+    user = user_directory.get_current(email)
+    if user is not None:
+        return user
+
+    table_id = f"{client.project}.{dataset_id}.{user_table}"
+    query = f"SELECT {', '.join(USER_COLUMNS)} FROM `{table_id}` WHERE email = @email AND {deleted_users_filter(table_id)} LIMIT 1"
+
+    started_at = time.time()
+    user_data = short_queries.fetch("user_by_email", query, {"email": email})
+    user_data_dict = [row._asdict() for row in user_data]
+    if len(user_data_dict) == 0:
+        return None
+    else:
+        # Created or changed on another instance since the directory last loaded
+        user_directory.put(user_data_dict[0], loaded_at=started_at)
+        replica.put_user(user_data_dict[0])
+        return user_data_dict[0]
+
+def email_exists(email: str) -> bool:
+    # Signup check. A current directory entry settles it; an email the directory has
+    # not seen may have signed up on another instance since its last reload, so a
+    # miss is always confirmed against the users table.
+    return get_user(email) is not None
+
+FLIGHT_COLUMNS = [
+    "flight_id", "user_id", "flight_number", "date", "departure_time", "timezone",
+    "estimated_co2", "airline_icao", "airline_name", "aircraft", "registration",
+    "estimated_time", "estimated_distance", "origin_iata", "origin_name",
+    "destination_iata", "destination_name", "route",
+    "dep_lat", "dep_long", "arr_lat", "arr_long", "deleted"
+]
+
+def get_active_flights(user_id: str, fields: Optional[List[str]] = None, limit: Optional[int] = None, cursor: Optional[Tuple[str, str]] = None, page_size: Optional[int] = None):
+    # Keyset pagination on (date, flight_id); fields must come from FLIGHT_COLUMNS
+    table_id = f"{client.project}.{dataset_id}.{flights_table}"
+
+    if fields:
+        columns = list(fields)
+        # The cursor is built from these two
+        for key in ("flight_id", "date"):
+            if key not in columns:
+                columns.append(key)
+        select = ", ".join(f"`{column}`" for column in columns)
+    else:
+        columns = None
+        select = "*"
+
+    if replica.is_fresh():
+        # One extra row tells us whether there is a next page
+        return replica.get_flights(user_id, columns, limit + 1 if limit is not None else None, cursor)
+
+    query_parameters = [
+        bigquery.ScalarQueryParameter("user_id", "STRING", user_id)
+    ]
+
+    # Dates are compared as DATE values so the partition filter can prune. NULL
+    # dates sort first, and a cursor on one carries an empty date.
+    cursor_filter = ""
+    if cursor is not None:
+        query_parameters.append(bigquery.ScalarQueryParameter("cursor_flight_id", "STRING", cursor[1]))
+        if cursor[0]:
+            cursor_filter = """
+        AND date >= @cursor_date
+        AND (date > @cursor_date OR (date = @cursor_date AND flight_id > @cursor_flight_id))
+        """
+            query_parameters.append(bigquery.ScalarQueryParameter("cursor_date", "DATE", date.fromisoformat(cursor[0])))
+        else:
+            cursor_filter = """
+        AND (date IS NOT NULL OR flight_id > @cursor_flight_id)
+        """
+
+    limit_clause = ""
+    if limit is not None:
+        # One extra row tells us whether there is a next page
+        limit_clause = "LIMIT @limit"
+        query_parameters.append(bigquery.ScalarQueryParameter("limit", "INT64", limit + 1))
+
+    query = active_flights_query(
+        table_id,
+        select=select,
+        where=cursor_filter,
+        order_by="ORDER BY date, flight_id",
+        limit=limit_clause
+    )
+
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+    return client.query(query, job_config=job_config).result(page_size=page_size)
+
+def update_password_hash(user_id: str, password_hash: str):
     table_id = f"{client.project}.{dataset_id}.{user_table}"
-    query = f"SELECT * FROM `{table_id}` WHERE email = @email"
+    query = f"UPDATE `{table_id}` SET password_hash = @password_hash WHERE user_id = @user_id"
 
     job_config = bigquery.QueryJobConfig(
         query_parameters=[
-            bigquery.ScalarQueryParameter("email", "STRING", email)
+            bigquery.ScalarQueryParameter("password_hash", "STRING", password_hash),
+            bigquery.ScalarQueryParameter("user_id", "STRING", user_id)
         ]
     )
 
-    query_job = client.query(query, job_config=job_config)
-    user_data = query_job.result()
-    user_data_dict = [dict(row) for row in user_data]
-    if len(user_data_dict) == 0:
-        return None
-    else:
-        return user_data_dict[0]
\ No newline at end of file
+    client.query(query, job_config=job_config).result()
+    user_directory.update(user_id, password_hash=password_hash)
+    user_directory.record_change(user_id, "password")
+    replica.update_user(user_id, password_hash=password_hash)
+
+def update_user_email(user_id: str, email: str):
+    table_id = f"{client.project}.{dataset_id}.{user_table}"
+    query = f"UPDATE `{table_id}` SET email = @email WHERE user_id = @user_id"
+
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("email", "STRING", email),
+            bigquery.ScalarQueryParameter("user_id", "STRING", user_id)
+        ]
+    )
+
+    client.query(query, job_config=job_config).result()
+    user_directory.update(user_id, email=email)
+    user_directory.record_change(user_id, "email")
+    replica.update_user(user_id, email=email)
@@ -0,0 +1,187 @@
+from google.cloud import bigquery
+from core.config import dataset_id, flights_table, co2_table
+from db.client import client
+from services.aircraft_families import AIRCRAFT_FALLBACKS, candidate_codes, resolve_factors
+from utils.time import AVERAGE_SPEED_KMH
+from typing import List, Optional
+import argparse
+import json
+import time
+
+def load_resolved_factors(client: bigquery.Client, co2_table_id: str) -> dict:
+    # Every code of the CO2 table plus every code with a fallback, resolved through
+    # the fallback chains. The table is small enough to read in full.
+    rows = client.query(f"SELECT aircraft_code, co2_per_hour_per_passenger FROM `{co2_table_id}` WHERE aircraft_code IS NOT NULL").result()
+    factors = {}
+    for row in rows:
+        if row.aircraft_code not in factors and row.co2_per_hour_per_passenger is not None:
+            factors[row.aircraft_code] = row.co2_per_hour_per_passenger
+    return resolve_factors(sorted(set(factors) | set(AIRCRAFT_FALLBACKS)), factors)
+
+def _duration_as_time(hours: str) -> str:
+    # SQL twin of utils.time.format_duration_as_time
+    return f"FORMAT('%02d:%02d', CAST(TRUNC({hours}) AS INT64), CAST(TRUNC(({hours} - TRUNC({hours})) * 60) AS INT64))"
+
+def changes_query(flights_table_id: str) -> str:
+    # One row per flight whose estimate differs from what the current factors give.
+    #
+    # Durations are taken the way insert took them: from the distance when
+    # estimated_time is the HH:MM it derived from that distance (stored distances are
+    # truncated to whole km, so either end of that km matches), from estimated_time
+    # otherwise. Differences below what the truncated distance can explain are not
+    # changes.
+    #
+    # The table does not record whether the user supplied estimated_co2, so a stored
+    # value only counts as an estimate when it is consistent with the usual factor of
+    # its aircraft, i.e. the one most of its flights were estimated with. Other
+    # values are left alone, flights without a value are always filled in.
+    derived = "flights.estimated_distance / @average_speed"
+    upper = "(flights.estimated_distance + 1) / @average_speed"
+    return f"""
+    WITH durations AS (
+        SELECT
+            flights.flight_id,
+            flights.aircraft,
+            flights.estimated_co2,
+            IF(
+                flights.estimated_time IS NULL
+                OR flights.estimated_time IN ({_duration_as_time(derived)}, {_duration_as_time(upper)}),
+                {derived},
+                SAFE_CAST(SPLIT(flights.estimated_time, ':')[SAFE_OFFSET(0)] AS INT64)
+                + SAFE_CAST(SPLIT(flights.estimated_time, ':')[SAFE_OFFSET(1)] AS INT64) / 60
+            ) AS duration
+        FROM `{flights_table_id}` AS flights
+        WHERE @recompute_all
+            OR flights.aircraft IN UNNEST(@aircraft)
+            OR IFNULL(flights.estimated_co2, 0) = 0
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY flights.flight_id) = 1
+    ),
+    usual AS (
+        SELECT aircraft, APPROX_TOP_COUNT(ROUND(estimated_co2 / duration, 1), 1)[OFFSET(0)].value AS factor
+        FROM durations
+        WHERE estimated_co2 > 0 AND duration > 0
+        GROUP BY aircraft
+    )
+    SELECT flight_id, aircraft, old_co2, new_co2
+    FROM (
+        SELECT
+            durations.flight_id,
+            durations.aircraft,
+            durations.estimated_co2 AS old_co2,
+            ROUND(factors.factor * durations.duration, 2) AS new_co2,
+            factors.factor / @average_speed + 0.01 AS tolerance,
+            usual.factor * durations.duration AS usual_co2
+        FROM durations
+        JOIN UNNEST(@factors) AS factors ON factors.aircraft = durations.aircraft
+        LEFT JOIN usual ON usual.aircraft = durations.aircraft
+    )
+    WHERE new_co2 IS NOT NULL
+    AND (
+        IFNULL(old_co2, 0) = 0
+        OR (ABS(old_co2 - new_co2) > tolerance AND ABS(old_co2 - usual_co2) <= 0.01 * old_co2 + tolerance)
+    )
+    """
+
+def recompute_emissions(aircraft: Optional[List[str]] = None, recompute_all: bool = False, dry_run: bool = False, examples: int = 3) -> dict:
+    # Re-estimates estimated_co2 in one set-based statement: flights still at 0 or
+    # NULL, flights of the given aircraft codes (after their factor changed), or
+    # every flight with recompute_all, skipping values the user supplied. A dry
+    # run returns the diff per aircraft instead of writing it. BigQuery rejects the
+    # MERGE while any matched row is still in the streaming buffer, rerun it later
+    # in that case. Reads pick the new values up once the statistics aggregates and
+    # the replica have been rebuilt.
+    flights_table_id = f"{client.project}.{dataset_id}.{flights_table}"
+    co2_table_id = f"{client.project}.{dataset_id}.{co2_table}"
+
+    started = time.perf_counter()
+    factors = load_resolved_factors(client, co2_table_id)
+    if not factors:
+        raise ValueError(f"No CO2 factors found in {co2_table_id}")
+
+    # A changed A320 factor also changes every code that falls back to it (A20N)
+    changed = set(aircraft or [])
+    affected = sorted(code for code in factors if changed.intersection(candidate_codes(code)))
+
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ArrayQueryParameter("factors", "STRUCT", [
+                bigquery.StructQueryParameter(
+                    None,
+                    bigquery.ScalarQueryParameter("aircraft", "STRING", code),
+                    bigquery.ScalarQueryParameter("factor", "FLOAT64", factor)
+                )
+                for code, factor in sorted(factors.items())
+            ]),
+            bigquery.ArrayQueryParameter("aircraft", "STRING", affected),
+            bigquery.ScalarQueryParameter("recompute_all", "BOOL", recompute_all),
+            bigquery.ScalarQueryParameter("average_speed", "FLOAT64", AVERAGE_SPEED_KMH),
+            bigquery.ScalarQueryParameter("examples", "INT64", examples)
+        ]
+    )
+
+    changes = changes_query(flights_table_id)
+    if dry_run:
+        query = f"""
+        SELECT
+            aircraft,
+            COUNT(*) AS flights,
+            ROUND(SUM(IFNULL(old_co2, 0)), 2) AS old_total,
+            ROUND(SUM(new_co2), 2) AS new_total,
+            ARRAY_AGG(STRUCT(flight_id, old_co2, new_co2) ORDER BY ABS(new_co2 - IFNULL(old_co2, 0)) DESC LIMIT @examples) AS examples
+        FROM ({changes})
+        GROUP BY aircraft
+        ORDER BY flights DESC, aircraft
+        """
+    else:
+        query = f"""
+        MERGE `{flights_table_id}` AS flights
+        USING ({changes}) AS changes
+        ON flights.flight_id = changes.flight_id
+        WHEN MATCHED THEN UPDATE SET estimated_co2 = changes.new_co2
+        """
+
+    job = client.query(query, job_config=job_config)
+    rows = list(job.result())
+    elapsed = time.perf_counter() - started
+
+    if dry_run:
+        diff = [
+            {
+                "aircraft": row.aircraft,
+                "flights": row.flights,
+                "old_total": row.old_total,
+                "new_total": row.new_total,
+                "examples": [dict(example) for example in row.examples]
+            }
+            for row in rows
+        ]
+        flights = sum(entry["flights"] for entry in diff)
+    else:
+        diff = None
+        flights = job.num_dml_affected_rows or 0
+
+    return {
+        "dry_run": dry_run,
+        "resolved_aircraft_codes": len(factors),
+        "flights": flights,
+        "seconds": round(elapsed, 3),
+        "flights_per_second": round(flights / elapsed, 1) if elapsed else None,
+        "bytes_processed": job.total_bytes_processed,
+        "diff": diff
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-estimate estimated_co2 of stored flights from the current CO2 factors.")
+    parser.add_argument("--aircraft", default="", help="comma-separated aircraft codes whose factor changed")
+    parser.add_argument("--all", action="store_true", help="recompute every flight with a known factor")
+    parser.add_argument("--dry-run", action="store_true", help="print the changes per aircraft without writing them")
+    parser.add_argument("--examples", type=int, default=3, help="flights shown per aircraft in a dry run")
+    args = parser.parse_args()
+
+    report = recompute_emissions(
+        aircraft=[code.strip() for code in args.aircraft.split(",") if code.strip()],
+        recompute_all=args.all,
+        dry_run=args.dry_run,
+        examples=args.examples
+    )
+    print(json.dumps(report, indent=2, default=str))
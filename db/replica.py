@@ -0,0 +1,375 @@
+from google.cloud import bigquery
+from core.config import dataset_id, user_table, flights_table, REPLICA_ENABLED, REPLICA_PATH, REPLICA_REFRESH_SECONDS, REPLICA_RECONCILE_SECONDS, REPLICA_MAX_STALENESS_SECONDS, STREAMING_BUFFER_SECONDS
+from db.client import client
+from db.schema import FLIGHTS_SCHEMA, ACTIVE_FLIGHT_QUALIFY, deleted_users_filter, tombstones_table_id
+from db.user_directory import USER_COLUMNS
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+import sqlite3
+import threading
+import time
+
+REPLICA_FLIGHT_COLUMNS = [field.name for field in FLIGHTS_SCHEMA]
+# Rows per locked batch while a snapshot is loaded, reads run in between
+IMPORT_BATCH_ROWS = 5000
+
+class LocalReplica:
+    # Optional SQLite copy of the users table and the active flights. A snapshot is
+    # imported from BigQuery at startup and the app's own write paths apply their
+    # changes directly. Every refresh_seconds the rows other instances appended since
+    # the last sync (users, flights, tombstones) are fetched and applied; changes
+    # made by DML (password or email updates, CO2 recomputes, compaction) are picked
+    # up when a full snapshot is re-imported every reconcile_seconds. Reads use it
+    # only while the last sync is younger than max_staleness_seconds, BigQuery stays
+    # the system of record.
+
+    def __init__(self, client: bigquery.Client, dataset_id: str, user_table: str, flights_table: str, path: str, enabled: bool, refresh_seconds: int, reconcile_seconds: int, max_staleness_seconds: int):
+        self.client = client
+        self.user_table_id = f"{client.project}.{dataset_id}.{user_table}"
+        self.flights_table_id = f"{client.project}.{dataset_id}.{flights_table}"
+        self.tombstones_table_id = tombstones_table_id(self.flights_table_id)
+        self.path = path
+        self.enabled = enabled
+        self.refresh_seconds = refresh_seconds
+        self.reconcile_seconds = reconcile_seconds
+        self.max_staleness_seconds = max_staleness_seconds
+
+        self.synced_at = None
+        self.reconciled_at = None
+        self.catch_ups = 0
+        self.reads = 0
+        self._writes = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._db = None
+
+        if enabled:
+            self._open()
+
+    def _open(self):
+        try:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.row_factory = sqlite3.Row
+            self._create_tables("users", "flights", "")
+            self._db.commit()
+        except Exception as e:
+            # Reads keep going to BigQuery
+            self._db = None
+            self.enabled = False
+            print(f"Error opening read replica at {self.path}: {str(e)}")
+
+    def _create_tables(self, users: str, flights: str, index_suffix: str):
+        # Index names are global in SQLite and survive a table rename, hence the suffix
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS {users} ({', '.join(USER_COLUMNS)}, PRIMARY KEY (user_id))")
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS users_email{index_suffix} ON {users} (email)")
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS {flights} ({', '.join(REPLICA_FLIGHT_COLUMNS)}, PRIMARY KEY (flight_id))")
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS flights_user_date{index_suffix} ON {flights} (user_id, date, flight_id)")
+
+    @staticmethod
+    def _value(value):
+        # BigQuery dates and timestamps are kept as ISO strings, which sort like the
+        # DATE keys used for pagination
+        if hasattr(value, "isoformat"):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def _flight(row: sqlite3.Row) -> dict:
+        flight = dict(row)
+        if flight.get("deleted") is not None:
+            flight["deleted"] = bool(flight["deleted"])
+        return flight
+
+    def is_fresh(self) -> bool:
+        return self._db is not None and self.synced_at is not None and time.time() - self.synced_at <= self.max_staleness_seconds
+
+    # Snapshot import
+
+    def _tombstoned_filter(self) -> str:
+        # A flight tombstone only applies to the flight of the user it names
+        return f"""NOT EXISTS (
+            SELECT 1 FROM `{self.tombstones_table_id}` AS tombstone
+            WHERE tombstone.flight_id = flights.flight_id AND (tombstone.user_id IS NULL OR tombstone.user_id = flights.user_id)
+        )"""
+
+    def _fetch_snapshot(self) -> Tuple[list, list]:
+        users = self.client.query(
+            f"SELECT {', '.join(USER_COLUMNS)} FROM `{self.user_table_id}` WHERE {deleted_users_filter(self.user_table_id)}"
+        ).result()
+
+        flights = self.client.query(f"""
+        SELECT {', '.join(REPLICA_FLIGHT_COLUMNS)} FROM `{self.flights_table_id}` AS flights
+        WHERE {self._tombstoned_filter()}
+        AND {deleted_users_filter(self.flights_table_id)}
+        {ACTIVE_FLIGHT_QUALIFY}
+        """).result()
+
+        return [dict(row) for row in users], [dict(row) for row in flights]
+
+    def _replay_writes(self, started_at: float):
+        # Local writes made after the fetch started may be missing from what it returned
+        for written_at, operation, args in self._writes:
+            if written_at >= started_at:
+                operation(*args)
+
+    def _synced(self, started_at: float):
+        self._writes = [write for write in self._writes if write[0] >= started_at]
+        self.synced_at = started_at
+
+    def import_snapshot(self, users: Iterable[dict], flights: Iterable[dict], started_at: Optional[float] = None):
+        # Replaces the replica contents; also used to seed it directly in tests and
+        # benchmarks. Rows go into staging tables a batch at a time, so reads keep
+        # being served from the current tables, which are swapped out at the end.
+        if self._db is None:
+            return
+        started_at = started_at if started_at is not None else time.time()
+        user_rows = [tuple(self._value(user.get(column)) for column in USER_COLUMNS) for user in users]
+        flight_rows = [tuple(self._value(flight.get(column)) for column in REPLICA_FLIGHT_COLUMNS) for flight in flights]
+
+        try:
+            with self._lock:
+                self._db.execute("DROP TABLE IF EXISTS users_next")
+                self._db.execute("DROP TABLE IF EXISTS flights_next")
+                self._create_tables("users_next", "flights_next", f"_{time.time_ns()}")
+                self._db.commit()
+            for table, columns, rows in (("users_next", USER_COLUMNS, user_rows), ("flights_next", REPLICA_FLIGHT_COLUMNS, flight_rows)):
+                for start in range(0, len(rows), IMPORT_BATCH_ROWS):
+                    with self._lock:
+                        self._db.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({', '.join('?' for _ in columns)})", rows[start:start + IMPORT_BATCH_ROWS])
+                        self._db.commit()
+
+            with self._lock:
+                try:
+                    if not self._db.in_transaction:
+                        self._db.execute("BEGIN")
+                    self._db.execute("DROP TABLE users")
+                    self._db.execute("DROP TABLE flights")
+                    self._db.execute("ALTER TABLE users_next RENAME TO users")
+                    self._db.execute("ALTER TABLE flights_next RENAME TO flights")
+                    self._replay_writes(started_at)
+                    self._db.commit()
+                except Exception:
+                    self._db.rollback()
+                    raise
+                self._synced(started_at)
+        except Exception:
+            with self._lock:
+                self._db.execute("DROP TABLE IF EXISTS users_next")
+                self._db.execute("DROP TABLE IF EXISTS flights_next")
+                self._db.commit()
+            raise
+
+    def _fetch_appends(self, since: float) -> Tuple[list, list, list]:
+        # Rows appended to the users, flights and tombstone tables since a point in
+        # time, read through the APPENDS change history function
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter("since", "TIMESTAMP", datetime.fromtimestamp(since, timezone.utc))
+            ]
+        )
+        users = self.client.query(f"""
+        SELECT {', '.join(USER_COLUMNS)} FROM APPENDS(TABLE `{self.user_table_id}`, @since, NULL)
+        WHERE {deleted_users_filter(self.user_table_id)}
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY user_id) = 1
+        """, job_config=job_config).result()
+        # One row per flight, a soft-deleted copy wins
+        flights = self.client.query(f"""
+        SELECT {', '.join(REPLICA_FLIGHT_COLUMNS)} FROM APPENDS(TABLE `{self.flights_table_id}`, @since, NULL) AS flights
+        WHERE {self._tombstoned_filter()}
+        AND {deleted_users_filter(self.flights_table_id)}
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY flight_id ORDER BY IFNULL(deleted, FALSE) DESC) = 1
+        """, job_config=job_config).result()
+        tombstones = self.client.query(
+            f"SELECT flight_id, user_id FROM APPENDS(TABLE `{self.tombstones_table_id}`, @since, NULL)",
+            job_config=job_config
+        ).result()
+        return [dict(row) for row in users], [dict(row) for row in flights], [dict(row) for row in tombstones]
+
+    def catch_up(self, users: Iterable[dict], flights: Iterable[dict], tombstones: Iterable[dict], started_at: Optional[float] = None):
+        # Applies rows appended by other instances on top of the current contents
+        if self._db is None:
+            return
+        started_at = started_at if started_at is not None else time.time()
+        with self._lock:
+            try:
+                for user in users:
+                    # Appended rows are the users as created, never newer than a
+                    # row already held
+                    self._add_user(user)
+                for flight in flights:
+                    if flight.get("deleted"):
+                        self._remove_flight(flight["flight_id"])
+                    else:
+                        self._put_flight(flight)
+                for tombstone in tombstones:
+                    if tombstone.get("flight_id"):
+                        self._remove_flight(tombstone["flight_id"], tombstone.get("user_id"))
+                    elif tombstone.get("user_id"):
+                        self._remove_user(tombstone["user_id"])
+                self._replay_writes(started_at)
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+            self._synced(started_at)
+            self.catch_ups += 1
+
+    def refresh(self):
+        started_at = time.time()
+        if self.synced_at is None or self.reconciled_at is None or started_at - self.reconciled_at >= self.reconcile_seconds:
+            users, flights = self._fetch_snapshot()
+            self.import_snapshot(users, flights, started_at)
+            self.reconciled_at = started_at
+        else:
+            # Streamed rows can stay in the streaming buffer, out of APPENDS, for up to
+            # STREAMING_BUFFER_SECONDS, so every catch-up reads that far back. The
+            # rows seen before are applied again, which changes nothing.
+            self.catch_up(*self._fetch_appends(self.synced_at - STREAMING_BUFFER_SECONDS), started_at)
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing read replica: {str(e)}")
+            if self._stop.wait(self.refresh_seconds):
+                return
+
+    def start(self):
+        if self._db is None or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="read-replica-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # Write paths
+
+    def _write(self, operation, *args):
+        if self._db is None:
+            return
+        with self._lock:
+            try:
+                operation(*args)
+                self._db.commit()
+            except Exception as e:
+                self._db.rollback()
+                print(f"Error writing to read replica: {str(e)}")
+                return
+            self._writes.append((time.time(), operation, args))
+
+    def _put_flight(self, flight: dict):
+        self._db.execute(
+            f"INSERT OR REPLACE INTO flights VALUES ({', '.join('?' for _ in REPLICA_FLIGHT_COLUMNS)})",
+            tuple(self._value(flight.get(column)) for column in REPLICA_FLIGHT_COLUMNS)
+        )
+
+    def _remove_flight(self, flight_id: str, user_id: Optional[str] = None):
+        if user_id is None:
+            self._db.execute("DELETE FROM flights WHERE flight_id = ?", (flight_id,))
+        else:
+            self._db.execute("DELETE FROM flights WHERE flight_id = ? AND user_id = ?", (flight_id, user_id))
+
+    def _put_user(self, user: dict):
+        self._db.execute(
+            f"INSERT OR REPLACE INTO users VALUES ({', '.join('?' for _ in USER_COLUMNS)})",
+            tuple(self._value(user.get(column)) for column in USER_COLUMNS)
+        )
+
+    def _add_user(self, user: dict):
+        self._db.execute(
+            f"INSERT OR IGNORE INTO users VALUES ({', '.join('?' for _ in USER_COLUMNS)})",
+            tuple(self._value(user.get(column)) for column in USER_COLUMNS)
+        )
+
+    def _update_user(self, user_id: str, changes: dict):
+        columns = [column for column in changes if column in USER_COLUMNS]
+        if columns:
+            self._db.execute(
+                f"UPDATE users SET {', '.join(f'{column} = ?' for column in columns)} WHERE user_id = ?",
+                tuple(self._value(changes[column]) for column in columns) + (user_id,)
+            )
+
+    def _remove_user(self, user_id: str):
+        self._db.execute("DELETE FROM flights WHERE user_id = ?", (user_id,))
+        self._db.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+
+    def put_flight(self, flight: dict):
+        self._write(self._put_flight, flight)
+
+    def remove_flight(self, flight_id: str, user_id: Optional[str] = None):
+        self._write(self._remove_flight, flight_id, user_id)
+
+    def put_user(self, user: dict):
+        self._write(self._put_user, user)
+
+    def update_user(self, user_id: str, **changes):
+        self._write(self._update_user, user_id, changes)
+
+    def remove_user(self, user_id: str):
+        self._write(self._remove_user, user_id)
+
+    # Reads, callers check is_fresh() first
+
+    def flight_owner(self, flight_id: str) -> Optional[str]:
+        # Owners never change, so even a stale copy answers this
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT user_id FROM flights WHERE flight_id = ?", (flight_id,)).fetchone()
+            self.reads += 1
+        return row["user_id"] if row is not None else None
+
+    def get_flights(
+        self,
+        user_id: str,
+        columns: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[Tuple[str, str]] = None,
+        from_date: Optional[str] = None,
+        to_date: Optional[str] = None
+    ) -> List[dict]:
+        # Same ordering and keyset as get_active_flights; columns must come from FLIGHT_COLUMNS
+        query = f"SELECT {', '.join(columns or REPLICA_FLIGHT_COLUMNS)} FROM flights WHERE user_id = ?"
+        params = [user_id]
+
+        if cursor is not None:
+            query += " AND (IFNULL(date, '') > ? OR (IFNULL(date, '') = ? AND flight_id > ?))"
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        if from_date is not None:
+            query += " AND date >= ?"
+            params.append(from_date)
+        if to_date is not None:
+            query += " AND date <= ?"
+            params.append(to_date)
+
+        query += " ORDER BY IFNULL(date, ''), flight_id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+            self.reads += 1
+        return [self._flight(row) for row in rows]
+
+    def stats(self) -> dict:
+        stats = {
+            "enabled": self._db is not None,
+            "fresh": self.is_fresh(),
+            "synced_at": self.synced_at,
+            "reconciled_at": self.reconciled_at,
+            "catch_ups": self.catch_ups,
+            "age_seconds": round(time.time() - self.synced_at, 1) if self.synced_at is not None else None,
+            "reads": self.reads
+        }
+        if self._db is not None:
+            with self._lock:
+                stats["users"] = self._db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+                stats["flights"] = self._db.execute("SELECT COUNT(*) FROM flights").fetchone()[0]
+        return stats
+
+replica = LocalReplica(client, dataset_id, user_table, flights_table, REPLICA_PATH, REPLICA_ENABLED, REPLICA_REFRESH_SECONDS, REPLICA_RECONCILE_SECONDS, REPLICA_MAX_STALENESS_SECONDS)
@@ -0,0 +1,119 @@
+from google.cloud import bigquery
+from concurrent.futures import ThreadPoolExecutor
+from core.config import BIGQUERY_MAX_WORKERS, QUERY_CLASS_LIMITS, QUERY_CLASS_DEADLINES
+from db.client import client
+from db.write_batcher import write_batcher
+from utils.metrics import in_context, record_span
+from time import perf_counter
+from typing import Dict, List, Optional
+import asyncio
+import fastapi
+
+class QueryTimeout(Exception):
+    pass
+
+class ClientDisconnected(Exception):
+    pass
+
+class AsyncRepository:
+    # Awaitable wrapper around the blocking BigQuery client. Calls run on a dedicated
+    # executor instead of Starlette's shared threadpool, each query class has its own
+    # concurrency limit and deadline, and a query is cancelled in BigQuery when its
+    # deadline passes or the client disconnects.
+    #
+    # Query classes: "point" (single-row lookups), "scan" (per-user reads),
+    # "dml" (UPDATE/DELETE), "insert" (row inserts), "external" (other blocking work).
+
+    def __init__(self, client: bigquery.Client, max_workers: int, limits: Dict[str, int], deadlines: Dict[str, float]):
+        self.client = client
+        self.deadlines = deadlines
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bigquery")
+        self._semaphores = {query_class: asyncio.Semaphore(limit) for query_class, limit in limits.items()}
+
+    async def _watch_disconnect(self, request: fastapi.Request, task: asyncio.Task, disconnected: asyncio.Event):
+        while not task.done():
+            if await request.is_disconnected():
+                disconnected.set()
+                task.cancel()
+                return
+            await asyncio.sleep(0.5)
+
+    async def _guarded(self, start, query_class: str, timeout: Optional[float], request: Optional[fastapi.Request]):
+        # Deadline covers the time spent waiting for a slot as well. start() is only
+        # called once a slot is free, and the slot stays taken until the work it
+        # started has finished: a caller giving up does not stop an executor thread.
+        timeout = timeout if timeout is not None else self.deadlines[query_class]
+        semaphore = self._semaphores[query_class]
+
+        def release(work: asyncio.Future):
+            semaphore.release()
+            if not work.cancelled():
+                # Retrieved so an abandoned failure is not logged as never retrieved
+                work.exception()
+
+        async def limited():
+            await semaphore.acquire()
+            try:
+                work = asyncio.ensure_future(start())
+            except BaseException:
+                semaphore.release()
+                raise
+            work.add_done_callback(release)
+            return await asyncio.shield(work)
+
+        task = asyncio.ensure_future(limited())
+        disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(self._watch_disconnect(request, task, disconnected)) if request is not None else None
+        try:
+            return await asyncio.wait_for(task, timeout)
+        except asyncio.TimeoutError:
+            raise QueryTimeout(f"{query_class} call exceeded its {timeout:.0f}s deadline")
+        except asyncio.CancelledError:
+            if disconnected.is_set():
+                raise ClientDisconnected()
+            raise
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+    async def run(self, func, *args, query_class: str = "external", timeout: Optional[float] = None, request: Optional[fastapi.Request] = None):
+        # Run any blocking callable under the limits of query_class
+        loop = asyncio.get_running_loop()
+        return await self._guarded(lambda: loop.run_in_executor(self._executor, in_context(lambda: func(*args))), query_class, timeout, request)
+
+    async def query(self, query: str, job_config: Optional[bigquery.QueryJobConfig] = None, query_class: str = "point", timeout: Optional[float] = None, request: Optional[fastapi.Request] = None) -> List[dict]:
+        loop = asyncio.get_running_loop()
+        job = None
+        abandoned = False
+
+        async def execute():
+            nonlocal job
+            job = await loop.run_in_executor(self._executor, lambda: self.client.query(query, job_config=job_config))
+            if abandoned:
+                # The caller gave up while the job was being submitted
+                await loop.run_in_executor(self._executor, job.cancel)
+                return []
+            return await loop.run_in_executor(self._executor, in_context(lambda: [dict(row) for row in job.result()]))
+
+        try:
+            return await self._guarded(execute, query_class, timeout, request)
+        except (QueryTimeout, ClientDisconnected, asyncio.CancelledError):
+            abandoned = True
+            if job is not None:
+                # Stop paying for work nobody is waiting for
+                loop.run_in_executor(self._executor, job.cancel)
+            raise
+
+    async def insert_rows_json(self, table_id: str, rows: List[dict], timeout: Optional[float] = None, request: Optional[fastapi.Request] = None) -> List[dict]:
+        started = perf_counter()
+        try:
+            return await self.run(write_batcher.insert_rows_json, table_id, rows, query_class="insert", timeout=timeout, request=request)
+        finally:
+            # The rows are written from the batcher thread, so the wait is timed here,
+            # named apart from the "insert" stage endpoints report themselves
+            record_span("insert-rows", (perf_counter() - started) * 1000)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+repository = AsyncRepository(client, BIGQUERY_MAX_WORKERS, QUERY_CLASS_LIMITS, QUERY_CLASS_DEADLINES)
@@ -0,0 +1,109 @@
+from google.cloud import bigquery
+from core.config import tombstones_table, user_changes_table
+
+# Managed layout of the flights table. Partitioning by flight month and clustering on
+# user_id, flight_id means a per-user read only touches that user's blocks. Months
+# rather than days keep multi-year histories far below the 4,000 partitions a single
+# job (backfill, compaction MERGE, CO2 recompute) may write.
+FLIGHTS_SCHEMA = [
+    bigquery.SchemaField("flight_id", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("user_id", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("flight_number", "STRING"),
+    bigquery.SchemaField("date", "DATE"),
+    bigquery.SchemaField("departure_time", "STRING"),
+    bigquery.SchemaField("timezone", "STRING"),
+    bigquery.SchemaField("estimated_co2", "FLOAT64"),
+    bigquery.SchemaField("airline_icao", "STRING"),
+    bigquery.SchemaField("airline_name", "STRING"),
+    bigquery.SchemaField("aircraft", "STRING"),
+    bigquery.SchemaField("registration", "STRING"),
+    bigquery.SchemaField("estimated_time", "STRING"),
+    bigquery.SchemaField("estimated_distance", "FLOAT64"),
+    bigquery.SchemaField("origin_iata", "STRING"),
+    bigquery.SchemaField("origin_name", "STRING"),
+    bigquery.SchemaField("destination_iata", "STRING"),
+    bigquery.SchemaField("destination_name", "STRING"),
+    bigquery.SchemaField("route", "STRING"),
+    bigquery.SchemaField("dep_lat", "FLOAT64"),
+    bigquery.SchemaField("dep_long", "FLOAT64"),
+    bigquery.SchemaField("arr_lat", "FLOAT64"),
+    bigquery.SchemaField("arr_long", "FLOAT64"),
+    bigquery.SchemaField("deleted", "BOOL")
+]
+
+FLIGHTS_PARTITION_FIELD = "date"
+FLIGHTS_CLUSTERING_FIELDS = ["user_id", "flight_id"]
+
+def flights_table_definition(table_id: str) -> bigquery.Table:
+    table = bigquery.Table(table_id, schema=FLIGHTS_SCHEMA)
+    table.time_partitioning = bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.MONTH, field=FLIGHTS_PARTITION_FIELD)
+    table.clustering_fields = FLIGHTS_CLUSTERING_FIELDS
+    return table
+
+# Pending deletes. A row with only user_id set deletes that user and all of their flights.
+# Flight rows carry the user_id of the caller and only apply to a flight that user owns;
+# soft ones are flagged deleted instead of removed.
+TOMBSTONES_SCHEMA = [
+    bigquery.SchemaField("flight_id", "STRING"),
+    bigquery.SchemaField("user_id", "STRING"),
+    bigquery.SchemaField("deleted_at", "TIMESTAMP", mode="REQUIRED"),
+    bigquery.SchemaField("soft", "BOOL")
+]
+
+def tombstones_table_definition(table_id: str) -> bigquery.Table:
+    table = bigquery.Table(table_id, schema=TOMBSTONES_SCHEMA)
+    table.clustering_fields = ["user_id", "flight_id"]
+    return table
+
+def tombstones_table_id(table_id: str) -> str:
+    # Lives in the same dataset as the table it applies to
+    return f"{table_id.rsplit('.', 1)[0]}.{tombstones_table}"
+
+# Credential changes (password, email), appended after the UPDATE has run so that a
+# user directory snapshot taken before the change always sees a newer entry here
+USER_CHANGES_SCHEMA = [
+    bigquery.SchemaField("user_id", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("change", "STRING"),
+    bigquery.SchemaField("changed_at", "TIMESTAMP", mode="REQUIRED")
+]
+
+def user_changes_table_definition(table_id: str) -> bigquery.Table:
+    table = bigquery.Table(table_id, schema=USER_CHANGES_SCHEMA)
+    table.clustering_fields = ["user_id"]
+    return table
+
+def user_changes_table_id(table_id: str) -> str:
+    return f"{table_id.rsplit('.', 1)[0]}.{user_changes_table}"
+
+def deleted_users_filter(table_id: str) -> str:
+    return f"user_id NOT IN (SELECT user_id FROM `{tombstones_table_id(table_id)}` WHERE flight_id IS NULL AND user_id IS NOT NULL)"
+
+# Keeps one row per flight_id and drops flights with a soft-deleted copy
+ACTIVE_FLIGHT_QUALIFY = """QUALIFY LOGICAL_OR(IFNULL(deleted, FALSE)) OVER (PARTITION BY flight_id) IS FALSE
+    AND ROW_NUMBER() OVER (PARTITION BY flight_id) = 1"""
+
+def active_flights_query(table_id: str, select: str = "*", where: str = "", order_by: str = "", limit: str = "") -> str:
+    # Resolves deletes in a single scan of the user's rows: a flight is active when
+    # none of its rows is flagged deleted or tombstoned, and only one row per
+    # flight_id is kept. The tombstones compaction has not applied yet are read
+    # once, only the user's (and any written before the owner was recorded), into
+    # one row that the QUALIFY pass checks every flight against. Extra filters can
+    # go in where since every copy of a flight shares its date and flight_id.
+    tombstones_id = tombstones_table_id(table_id)
+    return f"""
+    SELECT {"flights.*" if select == "*" else select} FROM `{table_id}` AS flights
+    CROSS JOIN (
+        SELECT
+            ARRAY_AGG(DISTINCT flight_id IGNORE NULLS) AS tombstoned_flight_ids,
+            IFNULL(LOGICAL_OR(flight_id IS NULL), FALSE) AS user_tombstoned
+        FROM `{tombstones_id}`
+        WHERE user_id = @user_id OR (user_id IS NULL AND flight_id IS NOT NULL)
+    ) AS tombstones
+    WHERE flights.user_id = @user_id
+    AND NOT tombstones.user_tombstoned
+    {where}
+    QUALIFY LOGICAL_OR(IFNULL(deleted, FALSE) OR flight_id IN UNNEST(tombstones.tombstoned_flight_ids)) OVER (PARTITION BY flight_id) IS FALSE
+        AND ROW_NUMBER() OVER (PARTITION BY flight_id) = 1
+    {order_by}
+    {limit}
+    """
@@ -0,0 +1,103 @@
+from google.cloud import bigquery
+from core.config import SHORT_QUERY_JOB_CREATION_OPTIONAL, SHORT_QUERY_LATENCY_SAMPLES
+from db.client import client
+from collections import deque, namedtuple
+from datetime import date, datetime
+from time import perf_counter
+from typing import Dict, List, Optional
+import os
+import threading
+
+SCALAR_TYPES = [
+    (bool, "BOOL"),
+    (int, "INT64"),
+    (float, "FLOAT64"),
+    (datetime, "TIMESTAMP"),
+    (date, "DATE"),
+    (str, "STRING")
+]
+
+def scalar_type(value) -> str:
+    # bool has to be checked before int
+    for python_type, bigquery_type in SCALAR_TYPES:
+        if isinstance(value, python_type):
+            return bigquery_type
+    return "STRING"
+
+def build_parameters(params: Optional[dict]) -> List:
+    # Named query parameters from a plain dict; lists, tuples and sets become arrays
+    # for use with IN UNNEST(@name)
+    parameters = []
+    for name, value in (params or {}).items():
+        if isinstance(value, (list, tuple, set)):
+            values = list(value)
+            element_type = scalar_type(values[0]) if values else "STRING"
+            parameters.append(bigquery.ArrayQueryParameter(name, element_type, values))
+        else:
+            parameters.append(bigquery.ScalarQueryParameter(name, scalar_type(value) if value is not None else "STRING", value))
+    return parameters
+
+class ShortQueryExecutor:
+    # Runs small lookups through jobs.query (query_and_wait), which returns the first
+    # page inline and, with job creation optional, skips creating a job entirely.
+    # Rows come back as namedtuples and latency is sampled per query template.
+
+    def __init__(self, client: bigquery.Client, job_creation_optional: bool, samples: int):
+        self.client = client
+        self.samples = samples
+        self._latencies: Dict[str, deque] = {}
+        self._row_types = {}
+        self._lock = threading.Lock()
+
+        if job_creation_optional:
+            if hasattr(client, "default_job_creation_mode"):
+                client.default_job_creation_mode = "JOB_CREATION_OPTIONAL"
+            else:
+                # Older client versions gate stateless queries behind this flag
+                os.environ.setdefault("QUERY_PREVIEW_ENABLED", "TRUE")
+
+    def _row_type(self, template: str, fields: tuple):
+        key = (template, fields)
+        if key not in self._row_types:
+            self._row_types[key] = namedtuple("Row", fields, rename=True)
+        return self._row_types[key]
+
+    def fetch(self, template: str, query: str, params: Optional[dict] = None, client: Optional[bigquery.Client] = None) -> List[tuple]:
+        client = client or self.client
+        job_config = bigquery.QueryJobConfig(query_parameters=build_parameters(params))
+
+        start = perf_counter()
+        try:
+            rows = client.query_and_wait(query, job_config=job_config)
+            row_type = self._row_type(template, tuple(field.name for field in rows.schema))
+            return [row_type(*row.values()) for row in rows]
+        finally:
+            self._record(template, (perf_counter() - start) * 1000)
+
+    def fetch_one(self, template: str, query: str, params: Optional[dict] = None, client: Optional[bigquery.Client] = None) -> Optional[tuple]:
+        rows = self.fetch(template, query, params, client)
+        return rows[0] if rows else None
+
+    def _record(self, template: str, duration_ms: float):
+        with self._lock:
+            if template not in self._latencies:
+                self._latencies[template] = deque(maxlen=self.samples)
+            self._latencies[template].append(duration_ms)
+
+    def latency_stats(self) -> dict:
+        with self._lock:
+            samples = {template: sorted(latencies) for template, latencies in self._latencies.items()}
+
+        def percentile(values: list, fraction: float) -> float:
+            return round(values[min(len(values) - 1, int(fraction * len(values)))], 2)
+
+        return {
+            template: {
+                "samples": len(values),
+                "p50_ms": percentile(values, 0.50),
+                "p99_ms": percentile(values, 0.99)
+            }
+            for template, values in samples.items() if values
+        }
+
+short_queries = ShortQueryExecutor(client, SHORT_QUERY_JOB_CREATION_OPTIONAL, SHORT_QUERY_LATENCY_SAMPLES)
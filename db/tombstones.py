@@ -0,0 +1,151 @@
+from google.cloud import bigquery
+from core.config import dataset_id, user_table, flights_table, TOMBSTONE_COMPACTION_ENABLED, TOMBSTONE_COMPACTION_INTERVAL_SECONDS, TOMBSTONE_COMPACTION_MIN_AGE_SECONDS, STREAMING_BUFFER_SECONDS
+from db.client import client
+from db.schema import tombstones_table_definition, tombstones_table_id
+from datetime import datetime, timezone
+from typing import Optional
+import json
+import threading
+
+class TombstoneLog:
+    # Deletes are appended to the tombstone table instead of running a DML statement
+    # per request. Reads skip tombstoned flights and users (see db.schema), and a
+    # compaction applies everything old enough in one transaction: deletes remove
+    # rows, soft deletes flag every copy deleted = TRUE so the flight can still be
+    # restored, and copies superseded by a soft-deleted copy are pruned. It runs in
+    # the background on the one instance that enables it, or from a scheduled job.
+
+    def __init__(self, client: bigquery.Client, dataset_id: str, flights_table: str, user_table: str, enabled: bool, interval_seconds: int, min_age_seconds: int):
+        self.client = client
+        self.flights_table_id = f"{client.project}.{dataset_id}.{flights_table}"
+        self.user_table_id = f"{client.project}.{dataset_id}.{user_table}"
+        self.table_id = tombstones_table_id(self.flights_table_id)
+        self.enabled = enabled
+        self.interval_seconds = interval_seconds
+        self.min_age_seconds = min_age_seconds
+
+        self.compactions = 0
+        self.last_compacted_at = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def ensure_table(self):
+        definition = tombstones_table_definition(self.table_id)
+        table = self.client.create_table(definition, exists_ok=True)
+        # Tables created before a column was added get it appended
+        known = {field.name for field in table.schema}
+        missing = [field for field in definition.schema if field.name not in known]
+        if missing:
+            table.schema = list(table.schema) + missing
+            self.client.update_table(table, ["schema"])
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def flight(self, flight_id: str, user_id: Optional[str], soft: bool = False) -> dict:
+        return {"flight_id": flight_id, "user_id": user_id, "deleted_at": self._now(), "soft": soft}
+
+    def user(self, user_id: str) -> dict:
+        return {"flight_id": None, "user_id": user_id, "deleted_at": self._now(), "soft": False}
+
+    def compact(self):
+        query = f"""
+        DECLARE cutoff TIMESTAMP DEFAULT TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @min_age_seconds SECOND);
+
+        BEGIN TRANSACTION;
+
+        -- A flight is only soft deleted when no hard delete applies to it as well
+        MERGE `{self.flights_table_id}` AS flights
+        USING (
+            SELECT flight_id, LOGICAL_AND(soft) AS soft
+            FROM (
+                -- A flight tombstone only applies to the flight of the user it names
+                SELECT tombstone.flight_id, IFNULL(tombstone.soft, FALSE) AS soft FROM `{self.table_id}` AS tombstone
+                JOIN `{self.flights_table_id}` AS owned
+                ON owned.flight_id = tombstone.flight_id AND (tombstone.user_id IS NULL OR tombstone.user_id = owned.user_id)
+                WHERE tombstone.flight_id IS NOT NULL AND tombstone.deleted_at <= cutoff
+                UNION ALL
+                SELECT owned.flight_id, FALSE AS soft FROM `{self.flights_table_id}` AS owned
+                JOIN `{self.table_id}` AS tombstone ON owned.user_id = tombstone.user_id
+                WHERE tombstone.flight_id IS NULL AND tombstone.deleted_at <= cutoff
+            )
+            GROUP BY flight_id
+        ) AS doomed
+        ON flights.flight_id = doomed.flight_id
+        WHEN MATCHED AND doomed.soft THEN UPDATE SET deleted = TRUE
+        WHEN MATCHED THEN DELETE;
+
+        -- Live copies of a flight that also has a soft-deleted copy (written by the
+        -- old soft delete, which streamed a full deleted copy) are superseded by it
+        DELETE FROM `{self.flights_table_id}`
+        WHERE IFNULL(deleted, FALSE) = FALSE
+        AND flight_id IN (SELECT flight_id FROM `{self.flights_table_id}` WHERE deleted = TRUE);
+
+        DELETE FROM `{self.user_table_id}`
+        WHERE user_id IN (
+            SELECT user_id FROM `{self.table_id}`
+            WHERE flight_id IS NULL AND deleted_at <= cutoff
+        );
+
+        -- Applied tombstones are kept for another streaming buffer bound, the change
+        -- feeds of the replica and the user directory read appends that far back
+        DELETE FROM `{self.table_id}` WHERE deleted_at <= TIMESTAMP_SUB(cutoff, INTERVAL @streaming_buffer_seconds SECOND);
+
+        COMMIT TRANSACTION;
+        """
+
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter("min_age_seconds", "INT64", self.min_age_seconds),
+                bigquery.ScalarQueryParameter("streaming_buffer_seconds", "INT64", STREAMING_BUFFER_SECONDS)
+            ]
+        )
+        self.client.query(query, job_config=job_config).result()
+
+        self.compactions += 1
+        self.last_compacted_at = self._now()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.compact()
+                self.last_error = None
+            except Exception as e:
+                # Tombstones stay in the log and are picked up by the next run
+                self.last_error = str(e)
+                print(f"Error compacting tombstones: {str(e)}")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        try:
+            # Reads reference the table, so it has to exist before serving
+            self.ensure_table()
+        except Exception as e:
+            print(f"Error creating tombstone table: {str(e)}")
+        if not self.enabled:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="tombstone-compaction", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "compactions": self.compactions,
+            "last_compacted_at": self.last_compacted_at,
+            "last_error": self.last_error
+        }
+
+tombstone_log = TombstoneLog(client, dataset_id, flights_table, user_table, TOMBSTONE_COMPACTION_ENABLED, TOMBSTONE_COMPACTION_INTERVAL_SECONDS, TOMBSTONE_COMPACTION_MIN_AGE_SECONDS)
+
+if __name__ == "__main__":
+    # One compaction, for a scheduled job
+    tombstone_log.ensure_table()
+    tombstone_log.compact()
+    print(json.dumps(tombstone_log.stats(), indent=2, default=str))
@@ -0,0 +1,204 @@
+from google.cloud import bigquery
+from core.config import dataset_id, user_table, USER_DIRECTORY_REFRESH_SECONDS, USER_DIRECTORY_CHANGES_SECONDS, STREAMING_BUFFER_SECONDS
+from db.client import client
+from db.schema import deleted_users_filter, tombstones_table_id, user_changes_table_definition, user_changes_table_id
+from db.write_batcher import write_batcher
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import threading
+import time
+
+USER_COLUMNS = ["user_id", "name", "surname", "email", "password_hash", "created_at"]
+# Change times come from other instances' clocks
+CLOCK_SKEW_SECONDS = 5
+# Logins stop trusting the directory when the change feed falls further behind
+CHANGES_MAX_LAG_SECONDS = 60
+
+class UserDirectory:
+    # Users indexed by email and user_id, loaded at startup and reloaded every
+    # refresh_seconds. The write endpoints update it directly (write-through).
+    #
+    # Password and email changes are appended to the user changes table, deletes to
+    # the tombstone table, and every changes_seconds the directory reads what was
+    # appended to both. The latest change per user is its credential version: an
+    # entry loaded before it is not used for logins until it has been read again.
+
+    def __init__(self, client: bigquery.Client, dataset_id: str, user_table: str, refresh_seconds: int, changes_seconds: int):
+        self.client = client
+        self.dataset_id = dataset_id
+        self.user_table = user_table
+        self.user_table_id = f"{client.project}.{dataset_id}.{user_table}"
+        self.changes_table_id = user_changes_table_id(self.user_table_id)
+        self.tombstones_table_id = tombstones_table_id(self.user_table_id)
+        self.refresh_seconds = refresh_seconds
+        self.changes_seconds = changes_seconds
+        self.by_email: Dict[str, dict] = {}
+        self.by_id: Dict[str, dict] = {}
+        self.reloaded_at = None
+        self.changes_synced_at = None
+        # When each entry was read, and when each user last changed
+        self.loaded_at: Dict[str, float] = {}
+        self.versions: Dict[str, float] = {}
+        self._writes = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def ensure_table(self):
+        self.client.create_table(user_changes_table_definition(self.changes_table_id), exists_ok=True)
+
+    def reload(self):
+        started_at = time.time()
+        rows = self.client.query(f"SELECT {', '.join(USER_COLUMNS)} FROM `{self.user_table_id}` WHERE {deleted_users_filter(self.user_table_id)}").result()
+
+        by_email = {}
+        by_id = {}
+        for row in rows:
+            user = dict(row)
+            by_email[user["email"]] = user
+            by_id[user["user_id"]] = user
+
+        with self._lock:
+            self.by_email = by_email
+            self.by_id = by_id
+            self.loaded_at = dict.fromkeys(by_id, started_at)
+            # Writes made while the snapshot was loading may be missing from it
+            for written_at, operation, args in self._writes:
+                if written_at >= started_at:
+                    operation(*args)
+            self._writes = [write for write in self._writes if write[0] >= started_at]
+            # Changes older than the snapshot are in it
+            self.versions = {user_id: version for user_id, version in self.versions.items() if version >= started_at - CLOCK_SKEW_SECONDS}
+            self.changes_synced_at = max(self.changes_synced_at or 0, started_at)
+            self.reloaded_at = started_at
+
+    def poll_changes(self):
+        # Streamed rows can take a while to show up in APPENDS, so the feed is read
+        # again from the streaming buffer bound before the last poll. Reading a
+        # change twice only sets the same version again.
+        started_at = time.time()
+        since = (self.changes_synced_at or started_at) - STREAMING_BUFFER_SECONDS
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter("since", "TIMESTAMP", datetime.fromtimestamp(since, timezone.utc))
+            ]
+        )
+        rows = self.client.query(f"""
+        SELECT user_id, MAX(changed_at) AS changed_at
+        FROM (
+            SELECT user_id, changed_at FROM APPENDS(TABLE `{self.changes_table_id}`, @since, NULL)
+            UNION ALL
+            SELECT user_id, deleted_at AS changed_at FROM APPENDS(TABLE `{self.tombstones_table_id}`, @since, NULL)
+            WHERE flight_id IS NULL AND user_id IS NOT NULL
+        )
+        GROUP BY user_id
+        """, job_config=job_config).result()
+
+        changes = {row["user_id"]: row["changed_at"].timestamp() for row in rows}
+        with self._lock:
+            for user_id, version in changes.items():
+                if version > self.versions.get(user_id, 0):
+                    self.versions[user_id] = version
+            self.changes_synced_at = started_at
+
+    def _run(self):
+        try:
+            # The change feed reads it
+            self.ensure_table()
+        except Exception as e:
+            print(f"Error creating user changes table: {str(e)}")
+        while True:
+            try:
+                if self.reloaded_at is None or time.time() - self.reloaded_at >= self.refresh_seconds:
+                    self.reload()
+                else:
+                    self.poll_changes()
+            except Exception as e:
+                print(f"Error refreshing user directory: {str(e)}")
+            if self._stop.wait(self.changes_seconds):
+                return
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="user-directory-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def get_by_email(self, email: str) -> Optional[dict]:
+        return self.by_email.get(email)
+
+    def get_by_id(self, user_id: str) -> Optional[dict]:
+        return self.by_id.get(user_id)
+
+    def get_current(self, email: str) -> Optional[dict]:
+        # The entry for email when it holds the user's latest credentials: read after
+        # their last logged change, within the refresh window, while the change feed
+        # is keeping up. None means ask BigQuery.
+        now = time.time()
+        with self._lock:
+            user = self.by_email.get(email)
+            if user is None or self.changes_synced_at is None or now - self.changes_synced_at > CHANGES_MAX_LAG_SECONDS:
+                return None
+            loaded_at = self.loaded_at.get(user["user_id"], 0)
+            # Two intervals, so an entry is not dropped while its reload is running
+            if now - loaded_at > 2 * self.refresh_seconds:
+                return None
+            if self.versions.get(user["user_id"], 0) >= loaded_at - CLOCK_SKEW_SECONDS:
+                return None
+            return user
+
+    def _write(self, operation, *args):
+        with self._lock:
+            operation(*args)
+            self._writes.append((time.time(), operation, args))
+
+    def _put(self, user: dict, loaded_at: float):
+        previous = self.by_id.get(user["user_id"])
+        if previous is not None and previous["email"] != user["email"]:
+            self.by_email.pop(previous["email"], None)
+        self.by_id[user["user_id"]] = user
+        self.by_email[user["email"]] = user
+        self.loaded_at[user["user_id"]] = loaded_at
+
+    def _update(self, user_id: str, changes: dict):
+        user = self.by_id.get(user_id)
+        if user is not None:
+            self._put({**user, **changes}, time.time())
+
+    def _remove(self, user_id: str):
+        user = self.by_id.pop(user_id, None)
+        self.loaded_at.pop(user_id, None)
+        if user is not None:
+            self.by_email.pop(user["email"], None)
+
+    def put(self, user: dict, loaded_at: Optional[float] = None):
+        # loaded_at is when the row was read, for rows fetched from BigQuery
+        self._write(self._put, {column: user.get(column) for column in USER_COLUMNS}, loaded_at if loaded_at is not None else time.time())
+
+    def update(self, user_id: str, **changes):
+        self._write(self._update, user_id, changes)
+
+    def remove(self, user_id: str):
+        self._write(self._remove, user_id)
+
+    def record_change(self, user_id: str, change: str):
+        # Called once the UPDATE has run, other instances pick it up from the feed
+        row = {"user_id": user_id, "change": change, "changed_at": datetime.now(timezone.utc).isoformat()}
+        errors = write_batcher.insert_rows_json(self.changes_table_id, [row])
+        if errors:
+            print(f"Error logging {change} change of user {user_id}: {errors}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self.by_id),
+                "reloaded_at": self.reloaded_at,
+                "changes_synced_at": self.changes_synced_at,
+                "changed_users": len(self.versions)
+            }
+
+user_directory = UserDirectory(client, dataset_id, user_table, USER_DIRECTORY_REFRESH_SECONDS, USER_DIRECTORY_CHANGES_SECONDS)
@@ -0,0 +1,270 @@
+from google.cloud import bigquery
+from concurrent.futures import Future
+from core.config import WRITE_BACKEND, WRITE_BATCH_MAX_ROWS, WRITE_BATCH_MAX_LATENCY_MS
+from db.client import client
+from datetime import date, datetime, timezone
+from typing import Dict, List
+import threading
+import time
+
+class StreamingInsertBackend:
+    # tabledata.insertAll, errors come back as [{"index": i, "errors": [...]}]. A batch
+    # mixes rows of several requests, so invalid rows are skipped rather than failing
+    # everyone else's rows with "stopped".
+    def __init__(self, client: bigquery.Client):
+        self.client = client
+
+    def insert(self, table_id: str, rows: List[dict]) -> List[dict]:
+        return self.client.insert_rows_json(table_id, rows, skip_invalid_rows=True)
+
+class StorageWriteBackend:
+    # Appends to the table's default stream through the BigQuery Storage Write API.
+    # Needs the optional google-cloud-bigquery-storage package.
+
+    TYPE_MAP = {
+        "STRING": "TYPE_STRING",
+        "INTEGER": "TYPE_INT64",
+        "INT64": "TYPE_INT64",
+        "FLOAT": "TYPE_DOUBLE",
+        "FLOAT64": "TYPE_DOUBLE",
+        "BOOLEAN": "TYPE_BOOL",
+        "BOOL": "TYPE_BOOL",
+        "DATE": "TYPE_INT32",
+        "TIMESTAMP": "TYPE_INT64",
+        # Sent in their canonical string form
+        "NUMERIC": "TYPE_STRING",
+        "BIGNUMERIC": "TYPE_STRING",
+        "DATETIME": "TYPE_STRING"
+    }
+
+    def __init__(self, client: bigquery.Client):
+        from google.cloud import bigquery_storage_v1
+        from google.cloud.bigquery_storage_v1 import types
+        from google.protobuf import descriptor_pb2
+
+        self.client = client
+        self.types = types
+        self.descriptor_pb2 = descriptor_pb2
+        self.write_client = bigquery_storage_v1.BigQueryWriteClient()
+        self._schemas = {}
+
+    def _schema(self, table_id: str):
+        if table_id not in self._schemas:
+            from google.protobuf import descriptor_pool, message_factory
+
+            table = self.client.get_table(table_id)
+            descriptor = self.descriptor_pb2.DescriptorProto(name="Row")
+            for number, field in enumerate(table.schema, start=1):
+                descriptor.field.add(
+                    name=field.name,
+                    number=number,
+                    type=getattr(self.descriptor_pb2.FieldDescriptorProto, self.TYPE_MAP.get(field.field_type, "TYPE_STRING")),
+                    label=self.descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL
+                )
+
+            file_proto = self.descriptor_pb2.FileDescriptorProto(name=f"{table.table_id}.proto", package=table.table_id)
+            file_proto.message_type.add().CopyFrom(descriptor)
+            pool = descriptor_pool.DescriptorPool()
+            pool.Add(file_proto)
+            message_class = message_factory.GetMessageClass(pool.FindMessageTypeByName(f"{table.table_id}.Row"))
+
+            path = f"projects/{table.project}/datasets/{table.dataset_id}/tables/{table.table_id}"
+            self._schemas[table_id] = (path, descriptor, message_class, {field.name: field.field_type for field in table.schema})
+        return self._schemas[table_id]
+
+    @staticmethod
+    def _convert(value, field_type: str):
+        if value is None:
+            return None
+        if field_type == "DATE":
+            value = date.fromisoformat(str(value)[:10])
+            return (value - date(1970, 1, 1)).days
+        if field_type == "TIMESTAMP":
+            value = datetime.fromisoformat(str(value))
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            return int(value.timestamp() * 1_000_000)
+        if field_type == "DATETIME":
+            return datetime.fromisoformat(str(value)).replace(tzinfo=None).isoformat(sep=" ")
+        if field_type not in StorageWriteBackend.TYPE_MAP or field_type in ("NUMERIC", "BIGNUMERIC"):
+            return str(value)
+        return value
+
+    def insert(self, table_id: str, rows: List[dict]) -> List[dict]:
+        path, descriptor, message_class, field_types = self._schema(table_id)
+
+        proto_rows = self.types.ProtoRows()
+        for row in rows:
+            message = message_class()
+            for name, value in row.items():
+                converted = self._convert(value, field_types.get(name, "STRING"))
+                if converted is not None and name in field_types:
+                    setattr(message, name, converted)
+            proto_rows.serialized_rows.append(message.SerializeToString())
+
+        request = self.types.AppendRowsRequest(
+            write_stream=f"{path}/streams/_default",
+            proto_rows=self.types.AppendRowsRequest.ProtoData(
+                writer_schema=self.types.ProtoSchema(proto_descriptor=descriptor),
+                rows=proto_rows
+            )
+        )
+
+        # Nothing is appended when any row fails, so the rows without an error of
+        # their own are reported as "stopped" for the batcher to send again
+        invalid = {}
+        message = None
+        for response in self.write_client.append_rows(iter([request])):
+            for row_error in response.row_errors:
+                invalid[row_error.index] = row_error.message
+            if response.error.code:
+                message = response.error.message
+        if not invalid and message is None:
+            return []
+        return [
+            {"index": index, "errors": [{"reason": "invalid", "message": invalid[index]}]} if index in invalid
+            else {"index": index, "errors": [{"reason": "stopped", "message": message or "Another row in the batch was invalid"}]}
+            for index in range(len(rows))
+        ]
+
+class WriteBatcher:
+    # Coalesces single-row inserts from concurrent requests into one call per table.
+    # A table is flushed once it has max_rows pending or its oldest row has waited
+    # max_latency_ms. Each caller still gets the errors for its own rows.
+
+    def __init__(self, backend, max_rows: int, max_latency_ms: int):
+        self.backend = backend
+        self.max_rows = max_rows
+        self.max_latency = max_latency_ms / 1000
+        self._pending: Dict[str, list] = {}
+        self._oldest: Dict[str, float] = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="write-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Flushes whatever is still pending before returning
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def submit(self, table_id: str, row: dict) -> Future:
+        future = Future()
+        with self._condition:
+            running = self._thread is not None and self._thread.is_alive() and not self._stopping
+            if running:
+                queue = self._pending.setdefault(table_id, [])
+                if not queue:
+                    self._oldest[table_id] = time.monotonic()
+                    self._condition.notify()
+                queue.append((row, future))
+                if len(queue) >= self.max_rows:
+                    self._condition.notify()
+
+        if not running:
+            # Not started (e.g. scripts) or shutting down, write straight through
+            self._flush(table_id, [(row, future)])
+        return future
+
+    def insert_rows_json(self, table_id: str, rows: List[dict]) -> List[dict]:
+        # Same contract as bigquery.Client.insert_rows_json
+        futures = [self.submit(table_id, row) for row in rows]
+        errors = []
+        for index, future in enumerate(futures):
+            row_errors = future.result()
+            if row_errors:
+                errors.append({"index": index, "errors": row_errors})
+        return errors
+
+    def _due_tables(self, now: float) -> List[str]:
+        return [
+            table_id for table_id, queue in self._pending.items()
+            if queue and (self._stopping or len(queue) >= self.max_rows or now - self._oldest[table_id] >= self.max_latency)
+        ]
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    due = self._due_tables(now)
+                    if due or (self._stopping and not any(self._pending.values())):
+                        break
+                    waits = [self.max_latency - (now - self._oldest[table_id]) for table_id, queue in self._pending.items() if queue]
+                    self._condition.wait(timeout=min(waits) if waits else None)
+
+                if not due:
+                    return
+
+                batches = []
+                for table_id in due:
+                    queue = self._pending[table_id]
+                    batches.append((table_id, queue[:self.max_rows]))
+                    self._pending[table_id] = queue[self.max_rows:]
+                    self._oldest[table_id] = time.monotonic()
+
+            for table_id, batch in batches:
+                self._flush(table_id, batch)
+
+    def _flush(self, table_id: str, batch: list):
+        try:
+            errors = self.backend.insert(table_id, [row for row, _ in batch])
+        except (TypeError, ValueError) as e:
+            # Raised while encoding a row, so only one caller's row is at fault: split
+            # the batch until that row is on its own
+            if len(batch) > 1:
+                middle = len(batch) // 2
+                self._flush(table_id, batch[:middle])
+                self._flush(table_id, batch[middle:])
+            else:
+                batch[0][1].set_exception(e)
+            return
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        row_errors = {}
+        for error in errors:
+            row_errors.setdefault(error["index"], []).extend(error.get("errors", []))
+
+        # Rows only "stopped" because of another caller's row are sent again: without
+        # the invalid rows when the backend named them, otherwise in halves until the
+        # bad row is on its own
+        stopped = [
+            index for index, item_errors in row_errors.items()
+            if item_errors and all(item.get("reason") == "stopped" for item in item_errors)
+        ]
+        if stopped and len(stopped) < len(batch):
+            for index, (_, future) in enumerate(batch):
+                if index not in stopped:
+                    future.set_result(row_errors.get(index, []))
+            self._flush(table_id, [batch[index] for index in sorted(stopped)])
+            return
+        if stopped and len(batch) > 1:
+            middle = len(batch) // 2
+            self._flush(table_id, batch[:middle])
+            self._flush(table_id, batch[middle:])
+            return
+
+        for index, (_, future) in enumerate(batch):
+            future.set_result(row_errors.get(index, []))
+
+def create_backend(name: str, client: bigquery.Client):
+    if name == "storage_write":
+        try:
+            return StorageWriteBackend(client)
+        except ImportError:
+            print("google-cloud-bigquery-storage is not installed, falling back to streaming inserts")
+    return StreamingInsertBackend(client)
+
+write_batcher = WriteBatcher(create_backend(WRITE_BACKEND, client), WRITE_BATCH_MAX_ROWS, WRITE_BATCH_MAX_LATENCY_MS)
@@ -1,4 +1,5 @@
 
 from .flight import ManualFlight, RetrieveFlight, APIFlightData, ProcessedFlightData, FlightID
 from .user import User, UserLogin, UserID, UserUpdatePassword, UserUpdateEmail
-from .common import AirportInfo, AirlineInfo, CO2Emissions, RouteInfo
\ No newline at end of file
+from .common import AirportInfo, AirlineInfo, CO2Emissions, RouteInfo
+from .admin import ProfilerSettings
\ No newline at end of file
@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+from typing import List
+
+class ProfilerSettings(BaseModel):
+    enabled: bool
+    endpoints: List[str] = []
+    sample_rate: float = 0
+    interval_ms: float = 5
\ No newline at end of file
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from core.security import verify_admin
+from models import ProfilerSettings
+from utils.profiler import profiler
+from typing import Optional
+
+router = APIRouter()
+
+@router.get("/admin/profiler", summary="Get profiler status", description="Current profiler settings, number of profiled requests and samples collected per label.")
+async def get_profiler(admin: dict = Depends(verify_admin)):
+    return profiler.stats()
+
+@router.put("/admin/profiler", summary="Configure the profiler", description="Turn the sampling profiler on or off and choose which requests it samples: a list of endpoint paths and/or a share of all requests (0 to 1). While enabled, any request sent with the profile header and an admin token is sampled as well.")
+async def configure_profiler(settings: ProfilerSettings, admin: dict = Depends(verify_admin)):
+    profiler.configure(settings.enabled, settings.endpoints, settings.sample_rate, settings.interval_ms)
+    return profiler.stats()
+
+@router.get("/admin/profiler/folded", summary="Download collected stacks", description="Sampled stacks in the folded format (one 'label;frame;...;frame count' line per stack), ready for flamegraph.pl or speedscope. Optionally limited to one label and cleared after download.")
+async def download_profile(label: Optional[str] = None, reset: bool = False, admin: dict = Depends(verify_admin)):
+    folded = profiler.export(label)
+    if reset:
+        profiler.reset()
+    return PlainTextResponse(folded, headers={"Content-Disposition": 'attachment; filename="profile.folded"'})
+
+@router.delete("/admin/profiler/folded", summary="Clear collected stacks", description="Drop all stacks collected so far.")
+async def clear_profile(admin: dict = Depends(verify_admin)):
+    profiler.reset()
+    return {"message": "Profile cleared"}
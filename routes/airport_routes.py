@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends
+import fastapi
+from core.security import verify_token
+from services.airport_index import airport_index
+from typing import Optional
+
+router = APIRouter()
+
+MAX_NEARBY_AIRPORTS = 100
+
+@router.get("/airports/nearby", summary="Find nearby airports", description="Airports closest to a position, nearest first, with their great-circle distance in km. With radius_km only airports within that distance are returned, otherwise the limit nearest ones.")
+async def get_nearby_airports(lat: float, lon: float, radius_km: Optional[float] = None, limit: int = 5, token: str = Depends(verify_token)):
+    if not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": "lat must be within [-90, 90] and lon within [-180, 180]"})
+
+    if not 1 <= limit <= MAX_NEARBY_AIRPORTS:
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": f"limit must be between 1 and {MAX_NEARBY_AIRPORTS}"})
+
+    if radius_km is not None and radius_km <= 0:
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": "radius_km must be a positive number"})
+
+    if radius_km is None:
+        found = airport_index.nearest(lat, lon, limit)
+    else:
+        found = airport_index.within(lat, lon, radius_km, limit)
+
+    return [{**airport.model_dump(), "distance_km": distance} for airport, distance in found]
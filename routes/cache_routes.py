@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends
+from core.security import verify_token, token_cache
+from api.get_flight import flight_cache
+from services.route_service import route_cache_stats
+from services.route_distance import route_distances
+from services.airport_index import airport_index
+from services.search_index import reference_search
+from db.short_query import short_queries
+from db.tombstones import tombstone_log
+from db.replica import replica
+from db.user_directory import user_directory
+
+router = APIRouter()
+
+@router.get("/cache-stats", summary="Get cache statistics", description="Hit and miss counters for the response caches of this instance.")
+async def get_cache_stats(token: str = Depends(verify_token)):
+    return {
+        "fr24": flight_cache.stats(),
+        "route_info": route_cache_stats(),
+        "route_distances": route_distances.stats(),
+        "airport_index": airport_index.stats(),
+        "search": reference_search.stats(),
+        "tokens": token_cache.stats(),
+        "users": user_directory.stats(),
+        "replica": replica.stats()
+    }
+
+
+@router.get("/query-stats", summary="Get query latency statistics", description="p50 and p99 latency of the short point-lookup queries of this instance, per query template.")
+async def get_query_stats(token: str = Depends(verify_token)):
+    return short_queries.latency_stats()
+
+
+@router.get("/tombstone-stats", summary="Get tombstone compaction statistics", description="Number of compactions run by this instance, when the last one finished and the last error, if any.")
+async def get_tombstone_stats(token: str = Depends(verify_token)):
+    return tombstone_log.stats()
@@ -1,55 +1,103 @@
 from fastapi import APIRouter, Depends
+from fastapi.encoders import jsonable_encoder
 import fastapi
 from db.client import client
-from core.config import dataset_id, airport_table, flights_table, airline_table, co2_table
+from core.config import dataset_id, airport_table, flights_table
 from api.get_flight import get_flight_data
-from services.emissions_service import calculate_flight_emissions
 from services.airport_service import get_airport_info
-from services.airline_service import get_airline_info
-from utils.geo import compute_distance
-from utils.time import format_duration_as_time, estimate_flight_duration
+from services.enrichment import enrich_api_flight, UnknownAirport
+from services.airport_index import resolve_missing_airports
+from services.statistics_service import statistics_store
+from utils.time import format_duration_as_time
+from utils.timing import StageTimer
 from core.security import verify_token
-from models.flight import ManualFlight, RetrieveFlight, FlightID
-from google.cloud import bigquery
+from models.flight import ManualFlight, RetrieveFlight, FlightID, APIFlightData
+from db.queries import get_active_flights, FLIGHT_COLUMNS
+from utils.pagination import encode_cursor, decode_cursor
+from core.config import FLIGHTS_STREAM_PAGE_SIZE, IMPORT_MAX_ROWS, IMPORT_TIMEOUT_SECONDS
+from services.import_service import parse_import, import_flights
+from db.repository import repository, QueryTimeout, ClientDisconnected
+from db.tombstones import tombstone_log
+from db.replica import replica
+from typing import Optional
+import json
 import uuid
 
 router = APIRouter()
 
-@router.get("/flights", summary="Get flights", description="Get all flights for a user.")
-def get_flights(user_id: str, token: str = Depends(verify_token)):
-    if user_id:
-        table_id = f"{client.project}.{dataset_id}.{flights_table}"
+@router.get("/flights", summary="Get flights", description="Get all flights for a user. Pass limit to page through them by date, following the cursor returned in the X-Next-Cursor header. fields takes a comma-separated list of columns to return. With format=ndjson (or Accept: application/x-ndjson) rows are streamed one per line, followed by a {\"next_cursor\": ...} line when there are more pages.")
+async def get_flights(request: fastapi.Request, user_id: str, limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None, format: Optional[str] = None, token: str = Depends(verify_token)):
+    if not user_id:
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": "User ID is required"})
 
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("user_id", "STRING", user_id)
-            ]
-        )
+    if limit is not None and limit < 1:
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": "limit must be a positive number"})
+
+    selected_fields = None
+    if fields:
+        selected_fields = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown_fields = [field for field in selected_fields if field not in FLIGHT_COLUMNS]
+        if unknown_fields:
+            return fastapi.responses.JSONResponse(status_code=400, content={"errors": f"Unknown fields: {', '.join(unknown_fields)}"})
 
-        query = f"""
-        SELECT * FROM `{table_id}` 
-        WHERE user_id = @user_id 
-        AND (deleted = FALSE OR deleted IS NULL)
-        AND flight_id NOT IN (
-            SELECT flight_id 
-            FROM `{table_id}` 
-            WHERE user_id = @user_id 
-            AND deleted = TRUE
+    try:
+        decoded_cursor = decode_cursor(cursor)
+    except ValueError as e:
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": str(e)})
+
+    stream = format == "ndjson" or "application/x-ndjson" in request.headers.get("accept", "")
+
+    if not stream:
+        # Materialise the rows on the BigQuery executor rather than the event loop
+        flights_list = await repository.run(
+            lambda: [dict(row) for row in get_active_flights(user_id, selected_fields, limit, decoded_cursor)],
+            query_class="scan", request=request
         )
-        """
-        
-        query_job = client.query(query, job_config=job_config)
-        flights = query_job.result()
-        flights_list = [dict(row) for row in flights]
-        return flights_list
     else:
-        return fastapi.responses.JSONResponse(status_code=400, content={"errors": "User ID is required"})
-    
+        flights = await repository.run(
+            get_active_flights, user_id, selected_fields, limit, decoded_cursor, FLIGHTS_STREAM_PAGE_SIZE,
+            query_class="scan", request=request
+        )
+
+    def project(row: dict) -> dict:
+        if selected_fields is None:
+            return row
+        return {field: row.get(field) for field in selected_fields}
+
+    if stream:
+        def generate():
+            # Rows are written as each BigQuery page arrives
+            count = 0
+            for row in flights:
+                flight = dict(row)
+                if limit is not None and count == limit:
+                    yield json.dumps({"next_cursor": encode_cursor(flight_date, flight_id)}) + "\n"
+                    return
+                flight_date, flight_id = flight.get("date"), flight.get("flight_id")
+                count += 1
+                yield json.dumps(project(flight), default=str) + "\n"
+
+        return fastapi.responses.StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    headers = {}
+    if limit is not None and len(flights_list) > limit:
+        flights_list = flights_list[:limit]
+        last = flights_list[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last.get("date"), last.get("flight_id"))
+
+    if selected_fields is None and not headers:
+        return flights_list
+
+    return fastapi.responses.JSONResponse(
+        content=jsonable_encoder([project(flight) for flight in flights_list]),
+        headers=headers
+    )
+
 @router.post("/add-flight-manual", summary="Add a flight manually", description="Add a flight manually with a flight number, date, estimated co2, airline, aircraft, registration, estimated time, estimated distance, origin, destination, route, departure time, and timezone.")
-def add_flight(flight: ManualFlight, token: str = Depends(verify_token)):
+async def add_flight(flight: ManualFlight, token: str = Depends(verify_token)):
     flight_id = str(uuid.uuid4())
 
-    airport_info = get_airport_info(client, dataset_id, airport_table, [flight.origin_iata, flight.destination_iata])
+    airport_info = await repository.run(get_airport_info, client, dataset_id, airport_table, [flight.origin_iata, flight.destination_iata], query_class="point")
 
     flight_data = {
         "flight_id": flight_id,
@@ -77,15 +125,18 @@ def add_flight(flight: ManualFlight, token: str = Depends(verify_token)):
     }
 
     table_id = f"{client.project}.{dataset_id}.{flights_table}"
-    errors = client.insert_rows_json(table_id, [flight_data])
+    errors = await repository.insert_rows_json(table_id, [flight_data])
 
     if errors:
         return fastapi.responses.JSONResponse(status_code=400, content={"errors": errors})
 
+    statistics_store.add_flight(flight_data)
+    replica.put_flight(flight_data)
+
     return fastapi.responses.JSONResponse(status_code=201, content={"message": "Flight added successfully!"})
 
 @router.post("/add-flight-api", summary="Add a flight from API", description="Add a flight from API with a flight number, date, departure time, and timezone.")
-def add_flight_api(flight: RetrieveFlight, token: str = Depends(verify_token)):
+async def add_flight_api(flight: RetrieveFlight, token: str = Depends(verify_token)):
     user_id = flight.user_id
     flight_number = flight.flight_number
     date = flight.date
@@ -93,27 +144,41 @@ def add_flight_api(flight: RetrieveFlight, token: str = Depends(verify_token)):
     timezone = flight.timezone
     flight_id = str(uuid.uuid4())
 
-    # This is returning a APIFlightData object
-    api_flight_data = get_flight_data(flight.flight_number, flight.date, flight.departure_time, flight.timezone)
+    timer = StageTimer()
 
-    # This is returning a dictionary of AirportInfo objects
-    airport_info = get_airport_info(client, dataset_id, airport_table, [api_flight_data.orig_iata, api_flight_data.dest_iata])
+    # An APIFlightData object, {} when FR24 has no such flight, or an error dict
+    with timer.stage("fr24"):
+        api_flight_data = await repository.run(get_flight_data, flight.flight_number, flight.date, flight.departure_time, flight.timezone, query_class="external")
 
-    # Compute distance between origin and destination
-    origin = airport_info[api_flight_data.orig_iata]
-    destination = airport_info[api_flight_data.dest_iata]
+    if not isinstance(api_flight_data, APIFlightData):
+        if not api_flight_data:
+            return fastapi.responses.JSONResponse(status_code=404, content={"errors": "Flight not found"})
+        # The provider could not be reached, or the date is outside what it covers
+        status_code = 503 if api_flight_data.get("error") == "Flight data unavailable" else 422
+        return fastapi.responses.JSONResponse(status_code=status_code, content={"errors": api_flight_data.get("message") or api_flight_data.get("error")})
 
-    estimated_distance = compute_distance(origin.lat, origin.long, destination.lat, destination.long)
+    if not api_flight_data.orig_iata or not api_flight_data.dest_iata:
+        # Fill the missing end from the airport the aircraft is currently at
+        resolved = resolve_missing_airports(api_flight_data)
+        if resolved is None:
+            return fastapi.responses.JSONResponse(status_code=422, content={"errors": "The origin or destination airport of this flight is unknown"})
+        api_flight_data = resolved
 
-    # Estimated times
-    computational_time = estimate_flight_duration(estimated_distance)
-    db_estimated_time = format_duration_as_time(computational_time)
+    # Airport, airline and emissions lookups run concurrently
+    with timer.stage("enrichment"):
+        try:
+            enriched = await repository.run(enrich_api_flight, client, api_flight_data, timer, query_class="point")
+        except UnknownAirport as e:
+            return fastapi.responses.JSONResponse(status_code=422, content={"errors": str(e)})
 
-    # This is returning a AirlineInfo object
-    airline_info = get_airline_info(client, dataset_id, airline_table, api_flight_data.operating_as)
+    origin = enriched["origin"]
+    destination = enriched["destination"]
+    estimated_distance = enriched["estimated_distance"]
+    airline_info = enriched["airline_info"]
+    estimated_emissions = enriched["estimated_emissions"]
 
-    # This is returning a CO2Emissions object
-    estimated_emissions = calculate_flight_emissions(client, dataset_id, co2_table, api_flight_data.type, computational_time)
+    # Estimated times
+    db_estimated_time = format_duration_as_time(enriched["computational_time"])
 
     # Add flight to database
     insert_flight_data = {
@@ -142,70 +207,100 @@ def add_flight_api(flight: RetrieveFlight, token: str = Depends(verify_token)):
     }
 
     table_id = f"{client.project}.{dataset_id}.{flights_table}"
-    errors = client.insert_rows_json(table_id, [insert_flight_data])
+    with timer.stage("insert"):
+        errors = await repository.insert_rows_json(table_id, [insert_flight_data])
+
+    headers = {"Server-Timing": timer.server_timing()}
 
     if errors:
-        return fastapi.responses.JSONResponse(status_code=400, content={"errors": errors})
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": errors}, headers=headers)
 
-    return fastapi.responses.JSONResponse(status_code=201, content={"message": "Flight added successfully!"})
+    statistics_store.add_flight(insert_flight_data)
+    replica.put_flight(insert_flight_data)
+
+    return fastapi.responses.JSONResponse(status_code=201, content={"message": "Flight added successfully!"}, headers=headers)
+
+@router.post("/import-flights", summary="Import flights in bulk", description="Import many flights at once from a CSV (Content-Type: text/csv) or JSON-lines (Content-Type: application/x-ndjson) upload. Each record takes the same fields as /add-flight-manual; missing distance, time, emissions and names are filled in from the reference tables. Returns the number of inserted flights and the errors per row.")
+async def import_flights_bulk(request: fastapi.Request, user_id: str, token: str = Depends(verify_token)):
+    if not user_id:
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": "User ID is required"})
+
+    content_type = request.headers.get("content-type", "")
+    body = await request.body()
+
+    try:
+        records = parse_import(body, content_type)
+    except UnicodeDecodeError:
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": "Upload must be UTF-8 encoded"})
+
+    if not records:
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": "No flights found in upload"})
+
+    if len(records) > IMPORT_MAX_ROWS:
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": f"At most {IMPORT_MAX_ROWS} flights can be imported at once"})
+
+    # Lookups and inserts are blocking, keep them off the event loop
+    result = await repository.run(import_flights, client, user_id, records, query_class="external", timeout=IMPORT_TIMEOUT_SECONDS)
+
+    for flight_data in result["inserted"]:
+        statistics_store.add_flight(flight_data)
+        replica.put_flight(flight_data)
+
+    status_code = 201 if result["inserted"] else 400
+    return fastapi.responses.JSONResponse(
+        status_code=status_code,
+        content={"inserted": len(result["inserted"]), "failed": len(result["errors"]), "errors": result["errors"]}
+    )
+
+def flight_owner(flight_id: str, token: dict) -> Optional[str]:
+    # Deletes are recorded for the caller. The caches that know the flight's owner
+    # are checked so someone else's flight answers 404 right away; otherwise the
+    # tombstone is only ever applied to a flight of the caller (see db.tombstones).
+    user_id = token.get("user_id")
+    known_owner = statistics_store.flight_owner(flight_id) or replica.flight_owner(flight_id)
+    if known_owner is not None and known_owner != user_id:
+        return None
+    return user_id
 
 @router.delete("/delete-flight", summary="Delete a flight", description="Delete a flight with a flight ID.")
-def delete_flight(flight_id: FlightID, token: str = Depends(verify_token)):
+async def delete_flight(flight_id: FlightID, token: dict = Depends(verify_token)):
     if flight_id:
+        owner = flight_owner(flight_id.flight_id, token)
+        if owner is None:
+            return fastapi.responses.JSONResponse(status_code=404, content={"message": f"Flight with ID {flight_id.flight_id} not found"})
+
         try:
-            table_id = f"{client.project}.{dataset_id}.{flights_table}"
+            # Applied to the flights table by the next tombstone compaction
+            errors = await repository.insert_rows_json(tombstone_log.table_id, [tombstone_log.flight(flight_id.flight_id, owner)])
+        except (QueryTimeout, ClientDisconnected):
+            # Answered 504/499 by the app's exception handlers
+            raise
+        except Exception as e:
+            errors = str(e) or repr(e)
 
-            job_config = bigquery.QueryJobConfig(
-                query_parameters=[
-                    bigquery.ScalarQueryParameter("flight_id", "STRING", flight_id.flight_id)
-                ]
-            )
+        if errors:
+            return fastapi.responses.JSONResponse(status_code=500, content={"message": f"Error deleting flight: {errors}"})
 
-            query = f"DELETE FROM `{table_id}` WHERE flight_id = @flight_id"
-            query_job = client.query(query, job_config=job_config)
-            query_job.result()
-        except Exception as e:
-            return fastapi.responses.JSONResponse(status_code=500, content={"message": f"Error deleting flight: {str(e)}"})
+        statistics_store.remove_flight(flight_id.flight_id, owner)
+        replica.remove_flight(flight_id.flight_id, owner)
 
         return fastapi.responses.JSONResponse(status_code=200, content={"message": "Flight deleted successfully!"})
     else:
         return fastapi.responses.JSONResponse(status_code=400, content={"errors": "Flight ID is required"})
     
 @router.post("/soft-delete-flight", summary="Soft delete a flight", description="Soft delete a flight with a flight ID.")
-def soft_delete_flight(flight_id: FlightID, token: str = Depends(verify_token)):
+async def soft_delete_flight(flight_id: FlightID, token: dict = Depends(verify_token)):
     if flight_id:
         try:
-            table_id = f"{client.project}.{dataset_id}.{flights_table}"
-            
-            job_config = bigquery.QueryJobConfig(
-                query_parameters=[
-                    bigquery.ScalarQueryParameter("flight_id", "STRING", flight_id.flight_id)
-                ]
-            )
-            
-            query = f"SELECT * FROM `{table_id}` WHERE flight_id = @flight_id"
-            query_job = client.query(query, job_config=job_config)
-            results = list(query_job.result())
-            
-            if not results:
+            owner = flight_owner(flight_id.flight_id, token)
+            if owner is None:
                 return fastapi.responses.JSONResponse(
                     status_code=404, 
                     content={"error": f"Flight with ID {flight_id.flight_id} not found"}
                 )
             
-            flight_dict = dict(results[0])
-            
-            for key, value in flight_dict.items():
-                if hasattr(value, 'isoformat') and callable(getattr(value, 'isoformat')):
-                    flight_dict[key] = value.isoformat()
-                elif isinstance(value, (complex, set, frozenset)):
-                    flight_dict[key] = str(value)
-            
-            flight_dict["deleted"] = True
-            
-            rows_to_insert = [flight_dict]
-            
-            errors = client.insert_rows_json(table_id, rows_to_insert)
+            # Flagged deleted = TRUE by the next tombstone compaction, not removed
+            errors = await repository.insert_rows_json(tombstone_log.table_id, [tombstone_log.flight(flight_id.flight_id, owner, soft=True)])
             
             if errors:
                 return fastapi.responses.JSONResponse(
@@ -213,8 +308,13 @@ def soft_delete_flight(flight_id: FlightID, token: str = Depends(verify_token)):
                     content={"error": f"Error inserting data: {errors}"}
                 )
             
+            statistics_store.remove_flight(flight_id.flight_id, owner)
+            replica.remove_flight(flight_id.flight_id, owner)
+
             return {"message": f"Flight with ID {flight_id.flight_id} has been soft-deleted successfully"}
             
+        except (QueryTimeout, ClientDisconnected):
+            raise
         except Exception as e:
             import traceback
             error_trace = traceback.format_exc()
@@ -0,0 +1,9 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from utils.metrics import registry
+
+router = APIRouter()
+
+@router.get("/metrics", summary="Get metrics", description="Request latency per endpoint, BigQuery time, bytes and cache hits per query template and upstream HTTP latency per provider, in Prometheus text format.", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
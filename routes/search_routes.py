@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends
+import fastapi
+from core.security import verify_token
+from services.search_index import reference_search
+
+router = APIRouter()
+
+MAX_SEARCH_RESULTS = 50
+
+@router.get("/search/airports", summary="Search airports", description="Typeahead search over airport IATA codes and names. Matches codes and word prefixes first and tolerates typos, best matches first.")
+async def search_airports(q: str, limit: int = 10, token: str = Depends(verify_token)):
+    if not 1 <= limit <= MAX_SEARCH_RESULTS:
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": f"limit must be between 1 and {MAX_SEARCH_RESULTS}"})
+    return reference_search.airports().search(q, limit)
+
+@router.get("/search/airlines", summary="Search airlines", description="Typeahead search over airline ICAO codes and names. Matches codes and word prefixes first and tolerates typos, best matches first.")
+async def search_airlines(q: str, limit: int = 10, token: str = Depends(verify_token)):
+    if not 1 <= limit <= MAX_SEARCH_RESULTS:
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": f"limit must be between 1 and {MAX_SEARCH_RESULTS}"})
+    return reference_search.airlines().search(q, limit)
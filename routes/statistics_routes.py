@@ -2,117 +2,45 @@ from fastapi import APIRouter, Depends
 from core.security import verify_token
 from core.config import dataset_id, flights_table
 from db.client import client
-from utils.time import convert_time
-from google.cloud import bigquery
+from db.repository import repository, QueryTimeout, ClientDisconnected
+from services.statistics_service import statistics_store, query_statistics
+from datetime import datetime
+from typing import Optional
 import fastapi
 
 router = APIRouter()
 
-@router.get("/statistics", summary="Get statistics", description="Get statistics for a user based on their flights. Used for dashboard.")
-def get_statistics(user_id: str, token: str = Depends(verify_token)):
-    if user_id:
-        table_id = f"{client.project}.{dataset_id}.{flights_table}"
-
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("user_id", "STRING", user_id)
-            ]
-        )
+@router.get("/statistics", summary="Get statistics", description="Get statistics for a user based on their flights. Used for dashboard. Optionally limit the top lists to top_n entries and the flights to a from_date/to_date range (YYYY-MM-DD).")
+async def get_statistics(request: fastapi.Request, user_id: str, top_n: Optional[int] = None, from_date: Optional[str] = None, to_date: Optional[str] = None, token: str = Depends(verify_token)):
+    if not user_id:
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": "User ID is required"})
 
-        query = f"""
-        SELECT * FROM `{table_id}` 
-        WHERE user_id = @user_id 
-        AND (deleted = FALSE OR deleted IS NULL)
-        AND flight_id NOT IN (
-            SELECT flight_id 
-            FROM `{table_id}` 
-            WHERE user_id = @user_id 
-            AND deleted = TRUE
-        )
-        """
-        
-        query_job = client.query(query, job_config=job_config)
-        flights = query_job.result()
-        flights_dict = [dict(row) for row in flights]
+    if top_n is not None and top_n < 1:
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": "top_n must be a positive number"})
 
-        total_distance = sum(flight["estimated_distance"] if flight["estimated_distance"] is not None else 0 for flight in flights_dict)
-        total_flights = len(flights_dict)
-        total_carbon = sum(flight["estimated_co2"] if flight["estimated_co2"] is not None else 0 for flight in flights_dict)
-        total_time = sum(convert_time(flight["estimated_time"]) if flight["estimated_time"] is not None else 0 for flight in flights_dict)
+    try:
+        for value in (from_date, to_date):
+            if value is not None:
+                datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": "Dates must use the YYYY-MM-DD format"})
 
-        yearly_stats = {}
-        
-        top_airports = {}
-        top_airlines = {}
-        top_aircraft = {}
-        top_routes = {}
+    if from_date is None and to_date is None:
+        # Full history is served from the per-user aggregate, kept up to date by the flight write endpoints
+        return await repository.run(statistics_store.get_statistics, user_id, top_n, query_class="scan", request=request)
 
-        for flight in flights_dict:
-            origin = flight.get('origin_iata')
-            destination = flight.get('destination_iata')
-            airline = flight.get('airline_name')
-            aircraft = flight.get('aircraft')
-            route = flight.get('route')
-            
-            date = flight.get('date')
-            year = None
-            if date is not None:
-                year = str(date)[:4]
-            
-            if year is not None:
-                if year not in yearly_stats:
-                    yearly_stats[year] = {
-                        "total_distance": 0,
-                        "total_flights": 0,
-                        "total_carbon": 0,
-                        "total_time": 0,
-                        "top_airports": {},
-                        "top_airlines": {},
-                        "top_aircraft": {},
-                        "top_routes": {}
-                    }
-                
-                yearly_stats[year]["total_flights"] += 1
-                yearly_stats[year]["total_distance"] += flight.get("estimated_distance", 0) or 0
-                yearly_stats[year]["total_carbon"] += flight.get("estimated_co2", 0) or 0
-                yearly_stats[year]["total_time"] += convert_time(flight.get("estimated_time", 0)) if flight.get("estimated_time") is not None else 0
-                
-                if origin is not None:
-                    yearly_stats[year]["top_airports"][origin] = yearly_stats[year]["top_airports"].get(origin, 0) + 1
-                if destination is not None:
-                    yearly_stats[year]["top_airports"][destination] = yearly_stats[year]["top_airports"].get(destination, 0) + 1
-                if airline is not None:
-                    yearly_stats[year]["top_airlines"][airline] = yearly_stats[year]["top_airlines"].get(airline, 0) + 1
-                if aircraft is not None:
-                    yearly_stats[year]["top_aircraft"][aircraft] = yearly_stats[year]["top_aircraft"].get(aircraft, 0) + 1
-                if route is not None:
-                    yearly_stats[year]["top_routes"][route] = yearly_stats[year]["top_routes"].get(route, 0) + 1
+    # Date ranges are aggregated in BigQuery
+    return await repository.run(query_statistics, client, dataset_id, flights_table, user_id, top_n, from_date, to_date, query_class="scan", request=request)
 
-            if origin is not None:
-                top_airports[origin] = top_airports.get(origin, 0) + 1
-            if destination is not None:
-                top_airports[destination] = top_airports.get(destination, 0) + 1
-            if airline is not None:
-                top_airlines[airline] = top_airlines.get(airline, 0) + 1
-            if aircraft is not None:
-                top_aircraft[aircraft] = top_aircraft.get(aircraft, 0) + 1
-            if route is not None:
-                top_routes[route] = top_routes.get(route, 0) + 1
-        
-        for year in yearly_stats:
-            yearly_stats[year]["total_carbon"] = round(yearly_stats[year]["total_carbon"], 2)
-            yearly_stats[year]["total_time"] = convert_time(yearly_stats[year]["total_time"])
-
-        return {
-            "total_distance": total_distance,
-            "total_flights": total_flights,
-            "total_carbon": round(total_carbon, 2),
-            "total_time": convert_time(total_time),
-            "top_airports": top_airports,
-            "top_airlines": top_airlines,
-            "top_aircraft": top_aircraft,
-            "top_routes": top_routes,
-            "yearly_statistics": yearly_stats
-        }
+@router.post("/statistics/rebuild", summary="Rebuild statistics", description="Rebuild a user's statistics aggregate from the flights table.")
+async def rebuild_statistics(user_id: str, token: str = Depends(verify_token)):
+    if user_id:
+        try:
+            await repository.run(statistics_store.rebuild, user_id, query_class="scan")
+        except (QueryTimeout, ClientDisconnected):
+            raise
+        except Exception as e:
+            return fastapi.responses.JSONResponse(status_code=500, content={"message": f"Error rebuilding statistics: {str(e)}"})
+        return fastapi.responses.JSONResponse(status_code=200, content={"message": "Statistics rebuilt successfully!"})
     else:
-        return fastapi.responses.JSONResponse(status_code=400, content={"errors": "User ID is required"})
\ No newline at end of file
+        return fastapi.responses.JSONResponse(status_code=400, content={"errors": "User ID is required"})
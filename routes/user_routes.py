@@ -1,25 +1,48 @@
 from fastapi import APIRouter, Depends
 from core.security import verify_token
-from core.config import dataset_id, user_table, flights_table
+from core.config import dataset_id, user_table
 from db.client import client
-from db.queries import get_user
+from db.repository import repository, QueryTimeout, ClientDisconnected
+from db.queries import get_user, email_exists, update_password_hash, update_user_email
+from db.user_directory import user_directory
+from db.tombstones import tombstone_log
+from db.replica import replica
+from services.statistics_service import statistics_store
 from models import User, UserLogin, UserUpdatePassword, UserUpdateEmail, UserID
-from core.security import create_access_token, verify_password
-from google.cloud import bigquery
+from core.security import create_access_token, revoke_user_tokens
+from core.passwords import password_hasher, PasswordPoolBusy
+from fastapi import BackgroundTasks
 import uuid
-import bcrypt
 from datetime import datetime
 import fastapi
 
 router = APIRouter()
 
+def busy_response():
+    return fastapi.responses.JSONResponse(
+        status_code=503,
+        content={"errors": "Too many password requests, try again shortly"},
+        headers={"Retry-After": "1"}
+    )
+
+async def rehash_password(user_id: str, password: str):
+    # Upgrade hashes made with a different cost factor after a successful login
+    try:
+        new_hash = await password_hasher.hash(password)
+        await repository.run(update_password_hash, user_id, new_hash, query_class="dml")
+    except Exception as e:
+        print(f"Error rehashing password: {str(e)}")
+
 @router.post("/new-user", summary="Create a new user", description="Create a new user with a name, surname, email, and password.")
-def new_user(user: User):
-    if get_user(user.email):
+async def new_user(user: User):
+    if await repository.run(email_exists, user.email, query_class="point"):
         return fastapi.responses.JSONResponse(status_code=400, content={"errors": "User already exists"})
 
     user_id = str(uuid.uuid4())
-    hashed_password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except PasswordPoolBusy:
+        return busy_response()
 
     user_data = {
         "user_id": user_id,
@@ -31,58 +54,58 @@ def new_user(user: User):
     }
 
     table_id = f"{client.project}.{dataset_id}.{user_table}"
-    errors = client.insert_rows_json(table_id, [user_data])
+    errors = await repository.insert_rows_json(table_id, [user_data])
 
     if errors:
         return fastapi.responses.JSONResponse(status_code=400, content={"errors": errors})
 
+    user_directory.put(user_data)
+    replica.put_user(user_data)
+
     return fastapi.responses.JSONResponse(status_code=201, content={"message": "User created successfully!"})
 
 @router.delete("/delete-user", summary="Delete a user", description="Delete a user and all associated flights.")
-def delete_user(user: UserID, token: str = Depends(verify_token)):
-    flights_table_id = f"{client.project}.{dataset_id}.{flights_table}"
-    
-    flights_query = f"DELETE FROM `{flights_table_id}` WHERE user_id = @user_id"
-    
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("user_id", "STRING", user.user_id)
-        ]
-    )
-
+async def delete_user(user: UserID, token: str = Depends(verify_token)):
+    # The user row and their flights are removed by the next tombstone compaction
     try:
-        flights_query_job = client.query(flights_query, job_config=job_config)
-        flights_query_job.result()
+        errors = await repository.insert_rows_json(tombstone_log.table_id, [tombstone_log.user(user.user_id)])
+    except (QueryTimeout, ClientDisconnected):
+        # Answered 504/499 by the app's exception handlers
+        raise
     except Exception as e:
-        return fastapi.responses.JSONResponse(
-            status_code=500, 
-            content={"message": f"Error deleting associated flights: {str(e)}"}
-        )
+        errors = str(e) or repr(e)
 
-    user_table_id = f"{client.project}.{dataset_id}.{user_table}"
-    
-    user_query = f"DELETE FROM `{user_table_id}` WHERE user_id = @user_id"
-    
-    try:
-        user_query_job = client.query(user_query, job_config=job_config)
-        user_query_job.result()
-    except Exception as e:
+    if errors:
         return fastapi.responses.JSONResponse(
             status_code=500, 
-            content={"message": f"Error deleting user: {str(e)}"}
+            content={"message": f"Error deleting user: {errors}"}
         )
 
+    statistics_store.invalidate(user.user_id)
+    revoke_user_tokens(user.user_id)
+    user_directory.remove(user.user_id)
+    replica.remove_user(user.user_id)
+
     return fastapi.responses.JSONResponse(
         status_code=200, 
         content={"message": "User and associated flights deleted successfully!"}
     )
     
 @router.post("/login", summary="Login a user", description="Login a user with an email and password.")
-def login(user: UserLogin):
-    user_fetched = get_user(user.email)
-    if user_fetched is None or verify_password(user.password, user_fetched["password_hash"]) is False:
+async def login(user: UserLogin, background_tasks: BackgroundTasks):
+    # Served from the user directory unless the user changed since their entry was read
+    user_fetched = await repository.run(get_user, user.email, query_class="point")
+    try:
+        valid = user_fetched is not None and await password_hasher.verify(user.password, user_fetched["password_hash"])
+    except PasswordPoolBusy:
+        return busy_response()
+
+    if not valid:
         return fastapi.responses.JSONResponse(status_code=400, content={"errors": "User not found or invalid credentials"})
     else:
+        if password_hasher.needs_rehash(user_fetched["password_hash"]):
+            background_tasks.add_task(rehash_password, user_fetched["user_id"], user.password)
+
         jwt_data = {
             "user_id": user_fetched["user_id"],
             "email": user_fetched["email"],
@@ -93,45 +116,32 @@ def login(user: UserLogin):
         return fastapi.responses.JSONResponse(status_code=200, content={"access_token": access_token})
     
 @router.post("/update-password", summary="Update a user's password", description="Update a user's password with a new password.")
-def update_password(user: UserUpdatePassword, token: str = Depends(verify_token)):
+async def update_password(user: UserUpdatePassword, token: str = Depends(verify_token)):
     if user.user_id:
-        hashed_password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-        table_id = f"{client.project}.{dataset_id}.{user_table}"
-
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("user_id", "STRING", user.user_id)
-            ]
-        )
+        try:
+            hashed_password = await password_hasher.hash(user.password)
+        except PasswordPoolBusy:
+            return busy_response()
 
-        query = f"UPDATE `{table_id}` SET password_hash = '{hashed_password}' WHERE user_id = @user_id"
-        
         try:
-            query_job = client.query(query, job_config=job_config)
-            query_job.result()
+            await repository.run(update_password_hash, user.user_id, hashed_password, query_class="dml")
+            revoke_user_tokens(user.user_id)
             return fastapi.responses.JSONResponse(status_code=200, content={"message": "Password updated successfully!"})
+        except (QueryTimeout, ClientDisconnected):
+            raise
         except Exception as e:
             return fastapi.responses.JSONResponse(status_code=500, content={"message": f"Error updating password: {str(e)}"})
     else:
         return fastapi.responses.JSONResponse(status_code=400, content={"message": "User ID is required"})
     
 @router.post("/update-email", summary="Update a user's email", description="Update a user's email with a new email.")
-def update_email(user: UserUpdateEmail, token: str = Depends(verify_token)):
+async def update_email(user: UserUpdateEmail, token: str = Depends(verify_token)):
     if user.user_id:
-        table_id = f"{client.project}.{dataset_id}.{user_table}"
-
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("user_id", "STRING", user.user_id)
-            ]
-        )
-        query = f"UPDATE `{table_id}` SET email = '{user.email}' WHERE user_id = @user_id"
-        
         try:
-            query_job = client.query(query, job_config=job_config)
-            query_job.result()
+            await repository.run(update_user_email, user.user_id, user.email, query_class="dml")
             return fastapi.responses.JSONResponse(status_code=200, content={"message": "Email updated successfully!"})
+        except (QueryTimeout, ClientDisconnected):
+            raise
         except Exception as e:
             return fastapi.responses.JSONResponse(status_code=500, content={"message": f"Error updating email: {str(e)}"})
     else:
@@ -0,0 +1,58 @@
+from typing import Dict, List
+
+# ICAO type designators whose CO2 factor can stand in for a missing one, closest
+# first: the same airframe with older engines, then the nearest family member.
+# Chains are followed transitively, e.g. B3XM -> B39M -> B739 -> B738.
+AIRCRAFT_FALLBACKS: Dict[str, List[str]] = {
+    # Airbus A220 / A320 family
+    "BCS1": ["BCS3"], "BCS3": ["BCS1"],
+    "A19N": ["A319"], "A20N": ["A320"], "A21N": ["A321"],
+    "A318": ["A319"], "A319": ["A320"], "A320": ["A321"], "A321": ["A320"],
+    # Airbus widebodies
+    "A332": ["A333"], "A333": ["A332"], "A337": ["A332"], "A338": ["A332"], "A339": ["A333"],
+    "A342": ["A343"], "A343": ["A346"], "A345": ["A346"], "A346": ["A343"],
+    "A359": ["A35K"], "A35K": ["A359"],
+    # Boeing 737
+    "B37M": ["B737"], "B38M": ["B738"], "B39M": ["B739"], "B3XM": ["B39M"],
+    "B733": ["B734"], "B734": ["B733"], "B735": ["B736"], "B736": ["B737"], "B737": ["B738"], "B738": ["B737"], "B739": ["B738"],
+    # Boeing widebodies
+    "B752": ["B753"], "B753": ["B752"],
+    "B762": ["B763"], "B763": ["B764"], "B764": ["B763"],
+    "B772": ["B77L"], "B77L": ["B772"], "B773": ["B77W"], "B77W": ["B773"], "B778": ["B77W"], "B779": ["B77W"],
+    "B788": ["B789"], "B789": ["B788"], "B78X": ["B789"],
+    "B744": ["B748"], "B748": ["B744"],
+    # Regional jets and turboprops
+    "E170": ["E175"], "E175": ["E170"], "E190": ["E195"], "E195": ["E190"],
+    "E275": ["E175"], "E290": ["E190"], "E295": ["E195"],
+    "CRJ2": ["CRJ7"], "CRJ7": ["CRJ9"], "CRJ9": ["CRJ7"], "CRJX": ["CRJ9"],
+    "AT43": ["AT45"], "AT45": ["AT43"], "AT72": ["AT76"], "AT75": ["AT76"], "AT76": ["AT72"],
+    "DH8A": ["DH8B"], "DH8B": ["DH8C"], "DH8C": ["DH8D"], "DH8D": ["DH8C"],
+}
+
+def _chain(code: str) -> List[str]:
+    # Breadth first, so direct fallbacks are tried before their own fallbacks
+    chain = []
+    queue = list(AIRCRAFT_FALLBACKS.get(code, []))
+    while queue:
+        candidate = queue.pop(0)
+        if candidate == code or candidate in chain:
+            continue
+        chain.append(candidate)
+        queue.extend(AIRCRAFT_FALLBACKS.get(candidate, []))
+    return chain
+
+FALLBACK_CHAINS: Dict[str, List[str]] = {code: _chain(code) for code in AIRCRAFT_FALLBACKS}
+
+def candidate_codes(aircraft_code: str) -> List[str]:
+    # The code itself, then its fallbacks in order
+    return [aircraft_code] + FALLBACK_CHAINS.get(aircraft_code, [])
+
+def resolve_factors(aircraft_codes, co2_factors: Dict[str, float]) -> Dict[str, float]:
+    # CO2 factor per aircraft code, taken from the first candidate with a known factor
+    resolved = {}
+    for code in aircraft_codes:
+        for candidate in candidate_codes(code):
+            if candidate in co2_factors:
+                resolved[code] = co2_factors[candidate]
+                break
+    return resolved
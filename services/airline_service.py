@@ -1,32 +1,63 @@
 from models.common import AirlineInfo
 from google.cloud import bigquery
+from services.reference_data import reference_cache
+from db.short_query import short_queries
+from typing import Dict
 
 def get_airline_info(client: bigquery.Client, dataset_id:str, airline_table: str, icao_code: str) -> AirlineInfo:
+    cached = reference_cache.get_airline(icao_code)
+    if cached is not None:
+        return cached
+
     try:
         table_id = f"{client.project}.{dataset_id}.{airline_table}"
         
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("icao_code", "STRING", icao_code)
-            ]
-        )
-        
         query = f"""
         SELECT airline_name
         FROM `{table_id}`
         WHERE airline_icao = @icao_code
+        LIMIT 1
         """
 
-        result = client.query(query, job_config=job_config).result()
-        
-        results_list = list(result)
+        results_list = short_queries.fetch("airline_by_icao", query, {"icao_code": icao_code}, client=client)
         
         if not results_list:
             return AirlineInfo(airline_name="Unknown")
         
         first_row = results_list[0]
         
-        return AirlineInfo(airline_name=first_row.airline_name)
+        airline_info = AirlineInfo(airline_name=first_row.airline_name)
+        reference_cache.put_airline(icao_code, airline_info)
+        return airline_info
     except Exception as e:
         print(f"Error getting airline info: {str(e)}")
-        return AirlineInfo(airline_name="Unknown")
\ No newline at end of file
+        return AirlineInfo(airline_name="Unknown")
+
+def get_airlines_info(client: bigquery.Client, dataset_id: str, airline_table: str, icao_codes: list[str]) -> Dict[str, AirlineInfo]:
+    # Bulk variant, codes missing from the cache are resolved with a single query
+    airlines = {}
+    missing_codes = set()
+    for code in icao_codes:
+        cached = reference_cache.get_airline(code)
+        if cached is not None:
+            airlines[code] = cached
+        elif code:
+            missing_codes.add(code)
+
+    if not missing_codes:
+        return airlines
+
+    table_id = f"{client.project}.{dataset_id}.{airline_table}"
+
+    query = f"""
+    SELECT airline_icao, airline_name
+    FROM `{table_id}`
+    WHERE airline_icao IN UNNEST(@icao_codes)
+    """
+
+    for row in short_queries.fetch("airlines_by_icao", query, {"icao_codes": sorted(missing_codes)}, client=client):
+        if row.airline_icao not in airlines:
+            airline_info = AirlineInfo(airline_name=row.airline_name)
+            reference_cache.put_airline(row.airline_icao, airline_info)
+            airlines[row.airline_icao] = airline_info
+    return airlines
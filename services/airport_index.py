@@ -0,0 +1,134 @@
+from core.config import AIRPORT_INDEX_CELL_DEGREES, AIRPORT_RESOLVE_RADIUS_KM
+from models.common import AirportInfo
+from models.flight import APIFlightData
+from services.reference_data import reference_cache
+from utils.geo import compute_distances
+from typing import Dict, List, Optional, Tuple
+import math
+import numpy as np
+import threading
+
+EARTH_RADIUS_KM = 6371.0
+
+class AirportGrid:
+    # Airports bucketed into cells of cell_degrees latitude by longitude. A radius
+    # query only measures the airports in the cells overlapping the bounding box of
+    # the search circle, widened towards the poles and wrapped at the antimeridian.
+
+    def __init__(self, airports: List[AirportInfo], cell_degrees: float):
+        self.airports = airports
+        self.cell_degrees = cell_degrees
+        self.lon_cells = max(1, math.ceil(360 / cell_degrees))
+        self.lats = np.array([airport.lat for airport in airports], dtype=np.float64)
+        self.longs = np.array([airport.long for airport in airports], dtype=np.float64)
+
+        cells: Dict[Tuple[int, int], list] = {}
+        for index, airport in enumerate(airports):
+            cells.setdefault(self._cell(airport.lat, airport.long), []).append(index)
+        self.cells = {cell: np.array(indexes, dtype=np.int64) for cell, indexes in cells.items()}
+
+    def _cell(self, lat: float, long: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_degrees), math.floor((long + 180) / self.cell_degrees) % self.lon_cells
+
+    def _candidates(self, lat: float, long: float, radius_km: float) -> np.ndarray:
+        angle = radius_km / EARTH_RADIUS_KM
+        if angle >= math.pi:
+            return np.arange(len(self.airports))
+
+        min_lat, max_lat = lat - math.degrees(angle), lat + math.degrees(angle)
+        if min_lat <= -90 or max_lat >= 90 or math.sin(angle) >= math.cos(math.radians(lat)):
+            # The circle reaches a pole, every longitude is in range
+            lon_columns = range(self.lon_cells)
+        else:
+            half_width = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(lat))))
+            first = math.floor((long - half_width + 180) / self.cell_degrees)
+            last = math.floor((long + half_width + 180) / self.cell_degrees)
+            lon_columns = {column % self.lon_cells for column in range(first, min(last, first + self.lon_cells - 1) + 1)}
+
+        first_row = math.floor(max(min_lat, -90) / self.cell_degrees)
+        last_row = math.floor(min(max_lat, 90) / self.cell_degrees)
+        found = [
+            self.cells[(row, column)]
+            for row in range(first_row, last_row + 1)
+            for column in lon_columns
+            if (row, column) in self.cells
+        ]
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def within(self, lat: float, long: float, radius_km: float, limit: Optional[int] = None) -> List[Tuple[AirportInfo, float]]:
+        candidates = self._candidates(lat, long, radius_km)
+        if not len(candidates):
+            return []
+        distances = compute_distances(
+            np.full(len(candidates), lat), np.full(len(candidates), long), self.lats[candidates], self.longs[candidates]
+        )
+        inside = distances <= radius_km
+        candidates, distances = candidates[inside], distances[inside]
+        order = np.argsort(distances, kind="stable")[:limit]
+        return [(self.airports[index], float(distance)) for index, distance in zip(candidates[order].tolist(), distances[order].tolist())]
+
+    def nearest(self, lat: float, long: float, k: int) -> List[Tuple[AirportInfo, float]]:
+        # Radius queries are exact, so once one holds k airports the k nearest are in it
+        radius_km = max(self.cell_degrees * 111.0, 1.0)
+        while True:
+            found = self.within(lat, long, radius_km, k)
+            if len(found) >= min(k, len(self.airports)) or radius_km >= math.pi * EARTH_RADIUS_KM:
+                return found
+            radius_km *= 4
+
+class AirportIndex:
+    # Spatial index over the cached airports table. It is rebuilt on the reference
+    # cache's refresh thread whenever a new copy of the table has been loaded, then
+    # swapped in, so lookups never build it. Until the first load it is empty.
+
+    def __init__(self, cell_degrees: float):
+        self.cell_degrees = cell_degrees
+        self._grid = AirportGrid([], cell_degrees)
+        self._lock = threading.Lock()
+        reference_cache.on_reload(self._reload)
+
+    def _reload(self, table: str):
+        if table == reference_cache.airport_table:
+            self.rebuild()
+
+    def rebuild(self):
+        grid = AirportGrid(list(reference_cache.airports_by_iata.values()), self.cell_degrees)
+        with self._lock:
+            self._grid = grid
+
+    def grid(self) -> AirportGrid:
+        with self._lock:
+            return self._grid
+
+    def within(self, lat: float, long: float, radius_km: float, limit: Optional[int] = None) -> List[Tuple[AirportInfo, float]]:
+        return self.grid().within(lat, long, radius_km, limit)
+
+    def nearest(self, lat: float, long: float, k: int = 1) -> List[Tuple[AirportInfo, float]]:
+        return self.grid().nearest(lat, long, k)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "airports": len(self._grid.airports),
+                "cells": len(self._grid.cells),
+                "cell_degrees": self.cell_degrees
+            }
+
+airport_index = AirportIndex(AIRPORT_INDEX_CELL_DEGREES)
+
+def resolve_missing_airports(api_flight_data: APIFlightData, radius_km: float = AIRPORT_RESOLVE_RADIUS_KM) -> Optional[APIFlightData]:
+    # FR24 sometimes leaves orig_iata or dest_iata empty. The live position can only
+    # name the missing end while the aircraft is at an airport other than the known
+    # one: the origin before take-off, the destination after landing. Returns None
+    # when that is not the case.
+    if api_flight_data.orig_iata and api_flight_data.dest_iata:
+        return api_flight_data
+    if not api_flight_data.orig_iata and not api_flight_data.dest_iata:
+        return None
+
+    nearby = airport_index.within(api_flight_data.lat, api_flight_data.lon, radius_km, 1)
+    if not nearby or nearby[0][0].iata_code in (api_flight_data.orig_iata, api_flight_data.dest_iata):
+        return None
+
+    field = "dest_iata" if api_flight_data.orig_iata else "orig_iata"
+    return api_flight_data.model_copy(update={field: nearby[0][0].iata_code})
@@ -1,15 +1,31 @@
 from google.cloud import bigquery
 from models.common import AirportInfo
+from services.reference_data import reference_cache
+from db.short_query import short_queries
 from typing import Dict
 
 def get_airport_info(client: bigquery.Client, dataset_id: str, airport_table: str, iata_codes: list[str]) -> Dict[str, AirportInfo]:
+    airport_info = {}
+    missing_codes = []
+    for code in iata_codes:
+        airport = reference_cache.get_airport(code)
+        if airport is not None:
+            airport_info[code] = airport
+        elif code and code not in missing_codes:
+            missing_codes.append(code)
+
+    if not missing_codes:
+        return airport_info
+
     table_id = f"{client.project}.{dataset_id}.{airport_table}"
-    # Convert list of codes to comma-separated string of quoted values
-    iata_codes_str = "', '".join(iata_codes)
     query = f"""
     SELECT iata_code, name, lat, long 
     FROM `{table_id}` 
-    WHERE iata_code IN ('{iata_codes_str}')
+    WHERE iata_code IN UNNEST(@iata_codes)
     """
-    results = client.query(query).result()
-    return {row.iata_code: AirportInfo(**dict(row)) for row in results}
\ No newline at end of file
+    results = short_queries.fetch("airports_by_iata", query, {"iata_codes": missing_codes}, client=client)
+    for row in results:
+        airport = AirportInfo(**row._asdict())
+        reference_cache.put_airport(airport)
+        airport_info[row.iata_code] = airport
+    return airport_info
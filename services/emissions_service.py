@@ -1,5 +1,9 @@
 from google.cloud import bigquery
 from models.common import CO2Emissions
+from services.reference_data import reference_cache
+from services.aircraft_families import candidate_codes, resolve_factors
+from db.short_query import short_queries
+from typing import Dict
 
 def calculate_flight_emissions(
     client: bigquery.Client, 
@@ -8,33 +12,65 @@ def calculate_flight_emissions(
     aircraft_code: str, 
     flight_duration_hours: float
 ) -> CO2Emissions:
-    
+    # Codes missing from the CO2 table fall back to their family (A20N -> A320)
     try:
-        table_id = f"{client.project}.{dataset_id}.{co2_table}"
-        
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("aircraft_code", "STRING", aircraft_code)
-            ]
-        )
-        
-        query = f"""
-        SELECT co2_per_hour_per_passenger 
-        FROM `{table_id}` 
-        WHERE aircraft_code = @aircraft_code
-        """
-        
-        result = client.query(query, job_config=job_config).result()
-        
-        results_list = list(result)
-        
-        if not results_list:
+        emissions_per_hour = get_resolved_co2_factors(client, dataset_id, co2_table, [aircraft_code]).get(aircraft_code)
+        if emissions_per_hour is None:
             return CO2Emissions(co2_emission_for_flight=0)
-        
-        first_row = results_list[0]
-        
-        emissions_per_hour = first_row[0]
         return CO2Emissions(co2_emission_for_flight=round(emissions_per_hour * flight_duration_hours, 2))
     except Exception as e:
         print(f"Error calculating emissions: {str(e)}")
-        return CO2Emissions(co2_emission_for_flight=0)
\ No newline at end of file
+        return CO2Emissions(co2_emission_for_flight=0)
+
+def get_co2_factors(client: bigquery.Client, dataset_id: str, co2_table: str, aircraft_codes: list[str]) -> Dict[str, float]:
+    # CO2 per hour per passenger for each known aircraft code, one query for all cache
+    # misses. Codes the table does not have are remembered until the next reload.
+    factors = {}
+    missing_codes = set()
+    for code in aircraft_codes:
+        factor = reference_cache.get_co2_factor(code)
+        if factor is not None:
+            factors[code] = factor
+        elif code:
+            missing_codes.add(code)
+
+    if not missing_codes:
+        return factors
+
+    table_id = f"{client.project}.{dataset_id}.{co2_table}"
+
+    query = f"""
+    SELECT aircraft_code, co2_per_hour_per_passenger
+    FROM `{table_id}`
+    WHERE aircraft_code IN UNNEST(@aircraft_codes)
+    """
+
+    for row in short_queries.fetch("co2_by_aircraft_codes", query, {"aircraft_codes": sorted(missing_codes)}, client=client):
+        if row.aircraft_code not in factors and row.co2_per_hour_per_passenger is not None:
+            reference_cache.put_co2_factor(row.aircraft_code, row.co2_per_hour_per_passenger)
+            factors[row.aircraft_code] = row.co2_per_hour_per_passenger
+    for code in missing_codes.difference(factors):
+        reference_cache.put_co2_unknown(code)
+    return factors
+
+def get_resolved_co2_factors(client: bigquery.Client, dataset_id: str, co2_table: str, aircraft_codes: list[str]) -> Dict[str, float]:
+    # Like get_co2_factors, with each code resolved through its fallback chain. The
+    # chain is walked against the cache first and stops at the first cached factor;
+    # BigQuery is only asked about the candidates of codes that did not resolve.
+    codes = [code for code in aircraft_codes if code]
+    factors = {}
+    unresolved = set()
+    for code in codes:
+        for candidate in candidate_codes(code):
+            factor = reference_cache.get_co2_factor(candidate)
+            if factor is not None:
+                factors[candidate] = factor
+                break
+            if not reference_cache.is_co2_unknown(candidate):
+                unresolved.add(code)
+                break
+
+    candidates = sorted({candidate for code in unresolved for candidate in candidate_codes(code) if not reference_cache.is_co2_unknown(candidate)})
+    if candidates:
+        factors.update(get_co2_factors(client, dataset_id, co2_table, candidates))
+    return resolve_factors(codes, factors)
@@ -0,0 +1,53 @@
+from google.cloud import bigquery
+from concurrent.futures import ThreadPoolExecutor
+from core.config import dataset_id, airport_table, airline_table, co2_table, ENRICHMENT_MAX_WORKERS
+from models.flight import APIFlightData
+from services.airport_service import get_airport_info
+from services.airline_service import get_airline_info
+from services.emissions_service import calculate_flight_emissions
+from services.route_distance import route_distances
+from utils.time import estimate_flight_duration
+from utils.timing import StageTimer
+from utils.metrics import in_context
+
+# Shared, bounded pool so a burst of requests cannot spawn unbounded threads
+executor = ThreadPoolExecutor(max_workers=ENRICHMENT_MAX_WORKERS, thread_name_prefix="enrichment")
+
+class UnknownAirport(LookupError):
+    pass
+
+def enrich_api_flight(client: bigquery.Client, api_flight_data: APIFlightData, timer: StageTimer) -> dict:
+    # Airports and airline only depend on the FR24 result, so they run side by side.
+    # Emissions need the distance and start as soon as the airports are known.
+    airport_future = executor.submit(
+        in_context(timer.timed("airports", get_airport_info)),
+        client, dataset_id, airport_table, [api_flight_data.orig_iata, api_flight_data.dest_iata]
+    )
+    airline_future = executor.submit(
+        in_context(timer.timed("airline", get_airline_info)),
+        client, dataset_id, airline_table, api_flight_data.operating_as
+    )
+
+    airport_info = airport_future.result()
+    origin = airport_info.get(api_flight_data.orig_iata)
+    destination = airport_info.get(api_flight_data.dest_iata)
+    if origin is None or destination is None:
+        unknown = [code for code, airport in ((api_flight_data.orig_iata, origin), (api_flight_data.dest_iata, destination)) if airport is None]
+        raise UnknownAirport(f"Unknown airport: {', '.join(unknown)}")
+
+    estimated_distance = route_distances.distance(origin, destination)
+    computational_time = estimate_flight_duration(estimated_distance)
+
+    emissions_future = executor.submit(
+        in_context(timer.timed("emissions", calculate_flight_emissions)),
+        client, dataset_id, co2_table, api_flight_data.type, computational_time
+    )
+
+    return {
+        "origin": origin,
+        "destination": destination,
+        "estimated_distance": estimated_distance,
+        "computational_time": computational_time,
+        "airline_info": airline_future.result(),
+        "estimated_emissions": emissions_future.result()
+    }
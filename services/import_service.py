@@ -0,0 +1,156 @@
+from google.cloud import bigquery
+from pydantic import ValidationError
+from core.config import dataset_id, airport_table, airline_table, co2_table, flights_table, IMPORT_CHUNK_SIZE
+from models.flight import ManualFlight
+from services.airport_service import get_airport_info
+from services.airline_service import get_airlines_info
+from services.emissions_service import get_resolved_co2_factors
+from services.route_distance import route_distances, co2_factor_array, estimate_emissions
+from utils.time import estimate_flight_duration, format_duration_as_time, convert_time
+from typing import List, Tuple
+import csv
+import io
+import json
+import math
+import numpy as np
+import uuid
+
+def parse_import(body: bytes, content_type: str) -> List[Tuple[int, dict]]:
+    # Returns (line number, raw record) pairs from a CSV or JSON-lines upload
+    text = body.decode("utf-8-sig")
+    records = []
+
+    if "csv" in content_type:
+        reader = csv.DictReader(io.StringIO(text))
+        for line_number, record in enumerate(reader, start=2):
+            # Empty CSV cells mean "not provided"
+            records.append((line_number, {key: (value if value != "" else None) for key, value in record.items() if key}))
+    else:
+        for line_number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                records.append((line_number, json.loads(line)))
+            except json.JSONDecodeError as e:
+                records.append((line_number, {"__error__": f"Invalid JSON: {str(e)}"}))
+
+    return records
+
+def import_flights(client: bigquery.Client, user_id: str, records: List[Tuple[int, dict]]) -> dict:
+    row_errors = []
+    flights = []
+
+    for line_number, record in records:
+        if not isinstance(record, dict):
+            row_errors.append({"row": line_number, "errors": ["Each line must be a JSON object"]})
+            continue
+        if "__error__" in record:
+            row_errors.append({"row": line_number, "errors": [record["__error__"]]})
+            continue
+        record["user_id"] = user_id
+        try:
+            flights.append((line_number, ManualFlight.model_validate(record)))
+        except ValidationError as e:
+            row_errors.append({"row": line_number, "errors": [error["msg"] + f" ({'.'.join(str(part) for part in error['loc'])})" for error in e.errors()]})
+
+    # Every reference code in the upload is resolved once, up front
+    airport_codes = sorted({code for _, flight in flights for code in (flight.origin_iata, flight.destination_iata) if code})
+    airline_codes = sorted({flight.airline_icao for _, flight in flights if flight.airline_icao})
+    aircraft_codes = sorted({flight.aircraft for _, flight in flights if flight.aircraft})
+
+    airports = get_airport_info(client, dataset_id, airport_table, airport_codes) if airport_codes else {}
+    airlines = get_airlines_info(client, dataset_id, airline_table, airline_codes) if airline_codes else {}
+    co2_factors = get_resolved_co2_factors(client, dataset_id, co2_table, aircraft_codes) if aircraft_codes else {}
+
+    legs = []
+    for line_number, flight in flights:
+        origin = airports.get(flight.origin_iata)
+        destination = airports.get(flight.destination_iata)
+        if origin is None or destination is None:
+            unknown = [code for code, airport in ((flight.origin_iata, origin), (flight.destination_iata, destination)) if airport is None]
+            row_errors.append({"row": line_number, "errors": [f"Unknown airport: {code}" for code in unknown]})
+            continue
+
+        duration = np.nan
+        if flight.estimated_time is not None:
+            try:
+                duration = convert_time(flight.estimated_time)
+            except ValueError:
+                row_errors.append({"row": line_number, "errors": ["estimated_time must use the HH:MM format"]})
+                continue
+        legs.append((line_number, flight, origin, destination, duration))
+
+    # Distances, durations and emissions for the whole upload in one pass
+    distances = route_distances.distances([leg[2] for leg in legs], [leg[3] for leg in legs])
+    estimated_distances = [
+        flight.estimated_distance if flight.estimated_distance is not None else int(distance)
+        for (_, flight, _, _, _), distance in zip(legs, distances.tolist())
+    ]
+    durations = np.array([leg[4] for leg in legs], dtype=np.float64)
+    durations = np.where(np.isnan(durations), estimate_flight_duration(np.array(estimated_distances, dtype=np.float64)), durations)
+    emissions = estimate_emissions(durations, co2_factor_array([leg[1].aircraft for leg in legs], co2_factors))
+
+    rows = []
+    for (line_number, flight, origin, destination, _), estimated_distance, duration, co2 in zip(legs, estimated_distances, durations.tolist(), emissions.tolist()):
+        estimated_time = flight.estimated_time if flight.estimated_time is not None else format_duration_as_time(duration)
+
+        estimated_co2 = flight.estimated_co2
+        if estimated_co2 is None and not math.isnan(co2):
+            estimated_co2 = co2
+
+        airline_name = flight.airline_name
+        if airline_name is None and flight.airline_icao in airlines:
+            airline_name = airlines[flight.airline_icao].airline_name
+
+        rows.append((line_number, {
+            "flight_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "flight_number": flight.flight_number,
+            "date": flight.date,
+            "estimated_co2": estimated_co2,
+            "airline_icao": flight.airline_icao,
+            "airline_name": airline_name,
+            "aircraft": flight.aircraft,
+            "registration": flight.registration,
+            "estimated_time": estimated_time,
+            "estimated_distance": estimated_distance,
+            "origin_iata": flight.origin_iata,
+            "origin_name": flight.origin_name or origin.name,
+            "destination_iata": flight.destination_iata,
+            "destination_name": flight.destination_name or destination.name,
+            "route": flight.route or f"{flight.origin_iata} - {flight.destination_iata}",
+            "departure_time": flight.departure_time,
+            "timezone": flight.timezone,
+            "dep_lat": origin.lat,
+            "dep_long": origin.long,
+            "arr_lat": destination.lat,
+            "arr_long": destination.long
+        }))
+
+    table_id = f"{client.project}.{dataset_id}.{flights_table}"
+    inserted = []
+
+    for start in range(0, len(rows), IMPORT_CHUNK_SIZE):
+        chunk = rows[start:start + IMPORT_CHUNK_SIZE]
+        try:
+            errors = client.insert_rows_json(table_id, [row for _, row in chunk])
+        except Exception as e:
+            row_errors.extend({"row": line_number, "errors": [str(e)]} for line_number, _ in chunk)
+            continue
+
+        # Streaming insert errors point at the row index within the chunk
+        failed = {}
+        for error in errors:
+            failed[error["index"]] = [item.get("message", str(item)) for item in error.get("errors", [])]
+        for index, (line_number, row) in enumerate(chunk):
+            if index in failed:
+                row_errors.append({"row": line_number, "errors": failed[index]})
+            else:
+                inserted.append(row)
+
+    row_errors.sort(key=lambda error: error["row"])
+
+    return {
+        "inserted": inserted,
+        "errors": row_errors
+    }
@@ -0,0 +1,140 @@
+from google.cloud import bigquery
+from models.common import AirportInfo, AirlineInfo
+from core.config import dataset_id, airport_table, airline_table, co2_table, REFERENCE_CACHE_TTL_SECONDS
+from db.client import client
+from typing import Callable, Dict, List, Optional, Set
+import threading
+
+class ReferenceDataCache:
+    # In-memory copy of the airport, airline and CO2 tables, indexed by IATA code,
+    # airline ICAO code and aircraft code. Tables are reloaded in the background
+    # whenever BigQuery reports a newer modification time, and the callbacks
+    # registered with on_reload are then run on the refresh thread, so indexes over
+    # a table can be rebuilt there rather than on a request.
+
+    def __init__(self, client: bigquery.Client, dataset_id: str, airport_table: str, airline_table: str, co2_table: str, ttl_seconds: int):
+        self.client = client
+        self.dataset_id = dataset_id
+        self.airport_table = airport_table
+        self.airline_table = airline_table
+        self.co2_table = co2_table
+        self.ttl_seconds = ttl_seconds
+
+        self.airports_by_iata: Dict[str, AirportInfo] = {}
+        self.airlines_by_icao: Dict[str, AirlineInfo] = {}
+        self.co2_by_aircraft: Dict[str, float] = {}
+        # Aircraft codes BigQuery has no factor for
+        self.co2_unknown: Set[str] = set()
+
+        self._versions = {}
+        self._listeners: List[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _table_id(self, table: str) -> str:
+        return f"{self.client.project}.{self.dataset_id}.{table}"
+
+    def _has_changed(self, table: str) -> bool:
+        # Table metadata lookups are free and much cheaper than a query job
+        modified = self.client.get_table(self._table_id(table)).modified
+        if modified is not None and self._versions.get(table) == modified:
+            return False
+        self._versions[table] = modified
+        return True
+
+    def _load_airports(self):
+        query = f"SELECT iata_code, name, lat, long FROM `{self._table_id(self.airport_table)}` WHERE iata_code IS NOT NULL"
+        rows = self.client.query(query).result()
+        self.airports_by_iata = {row.iata_code: AirportInfo(**dict(row)) for row in rows}
+
+    def _load_airlines(self):
+        query = f"SELECT airline_icao, airline_name FROM `{self._table_id(self.airline_table)}` WHERE airline_icao IS NOT NULL"
+        rows = self.client.query(query).result()
+        airlines = {}
+        for row in rows:
+            # Keep the first match, same as the single-row lookup
+            if row.airline_icao not in airlines:
+                airlines[row.airline_icao] = AirlineInfo(airline_name=row.airline_name)
+        self.airlines_by_icao = airlines
+
+    def _load_co2(self):
+        query = f"SELECT aircraft_code, co2_per_hour_per_passenger FROM `{self._table_id(self.co2_table)}` WHERE aircraft_code IS NOT NULL"
+        rows = self.client.query(query).result()
+        factors = {}
+        for row in rows:
+            if row.aircraft_code not in factors:
+                factors[row.aircraft_code] = row.co2_per_hour_per_passenger
+        self.co2_by_aircraft = factors
+        self.co2_unknown = set()
+
+    def refresh(self, force: bool = False):
+        loaders = [
+            (self.airport_table, self._load_airports),
+            (self.airline_table, self._load_airlines),
+            (self.co2_table, self._load_co2),
+        ]
+        reloaded = []
+        with self._lock:
+            for table, loader in loaders:
+                try:
+                    if force or self._has_changed(table):
+                        loader()
+                        reloaded.append(table)
+                except Exception as e:
+                    # Keep serving the previous snapshot, lookups fall back to BigQuery
+                    self._versions.pop(table, None)
+                    print(f"Error refreshing reference table {table}: {str(e)}")
+
+        for table in reloaded:
+            for listener in list(self._listeners):
+                try:
+                    listener(table)
+                except Exception as e:
+                    print(f"Error handling reload of reference table {table}: {str(e)}")
+
+    def on_reload(self, listener: Callable[[str], None]):
+        # listener(table) runs after each reload of a table
+        self._listeners.append(listener)
+
+    def _run(self):
+        self.refresh(force=True)
+        while not self._stop.wait(self.ttl_seconds):
+            self.refresh()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="reference-data-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def get_airport(self, iata_code: str) -> Optional[AirportInfo]:
+        return self.airports_by_iata.get(iata_code)
+
+    def get_airline(self, icao_code: str) -> Optional[AirlineInfo]:
+        return self.airlines_by_icao.get(icao_code)
+
+    def get_co2_factor(self, aircraft_code: str) -> Optional[float]:
+        return self.co2_by_aircraft.get(aircraft_code)
+
+    def is_co2_unknown(self, aircraft_code: str) -> bool:
+        return aircraft_code in self.co2_unknown
+
+    # Values fetched from BigQuery on a miss are kept until the next reload
+    def put_airport(self, airport: AirportInfo):
+        self.airports_by_iata[airport.iata_code] = airport
+
+    def put_airline(self, icao_code: str, airline: AirlineInfo):
+        self.airlines_by_icao[icao_code] = airline
+
+    def put_co2_factor(self, aircraft_code: str, co2_per_hour_per_passenger: float):
+        self.co2_by_aircraft[aircraft_code] = co2_per_hour_per_passenger
+
+    def put_co2_unknown(self, aircraft_code: str):
+        self.co2_unknown.add(aircraft_code)
+
+reference_cache = ReferenceDataCache(client, dataset_id, airport_table, airline_table, co2_table, REFERENCE_CACHE_TTL_SECONDS)
@@ -0,0 +1,72 @@
+from cachetools import LRUCache
+from core.config import ROUTE_DISTANCE_MAX_ENTRIES
+from models.common import AirportInfo
+from utils.geo import compute_distances
+from typing import Dict, Optional, Sequence
+import numpy as np
+import threading
+
+class RouteDistanceTable:
+    # Great-circle distance in km per airport pair, shared by both directions. The
+    # key holds the coordinates too, so a moved airport is simply a new pair. Pairs
+    # missing from a batch are computed together in one vectorized pass.
+
+    def __init__(self, max_entries: int):
+        self._distances = LRUCache(maxsize=max_entries)
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def _key(origin: AirportInfo, destination: AirportInfo) -> tuple:
+        start = (origin.iata_code, origin.lat, origin.long)
+        end = (destination.iata_code, destination.lat, destination.long)
+        return (start, end) if start <= end else (end, start)
+
+    def distances(self, origins: Sequence[AirportInfo], destinations: Sequence[AirportInfo]) -> np.ndarray:
+        keys = [self._key(origin, destination) for origin, destination in zip(origins, destinations)]
+        result = np.empty(len(keys), dtype=np.float64)
+        missing: Dict[tuple, list] = {}
+
+        with self._lock:
+            for index, key in enumerate(keys):
+                distance = self._distances.get(key)
+                if distance is None:
+                    missing.setdefault(key, []).append(index)
+                else:
+                    result[index] = distance
+            self.counters["hits"] += len(keys) - sum(len(indexes) for indexes in missing.values())
+            self.counters["misses"] += len(missing)
+
+        if not missing:
+            return result
+
+        pairs = list(missing)
+        computed = compute_distances(
+            [start[1] for start, _ in pairs], [start[2] for start, _ in pairs],
+            [end[1] for _, end in pairs], [end[2] for _, end in pairs]
+        )
+        with self._lock:
+            for key, distance in zip(pairs, computed.tolist()):
+                self._distances[key] = distance
+                result[missing[key]] = distance
+        return result
+
+    def distance(self, origin: AirportInfo, destination: AirportInfo) -> float:
+        return float(self.distances([origin], [destination])[0])
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self._distances)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0
+        return stats
+
+def co2_factor_array(aircraft_codes: Sequence[Optional[str]], co2_factors: Dict[str, float]) -> np.ndarray:
+    # CO2 per hour per passenger for each leg, NaN where the aircraft is unknown
+    return np.array([co2_factors.get(code, np.nan) if code else np.nan for code in aircraft_codes], dtype=np.float64)
+
+def estimate_emissions(durations: np.ndarray, co2_per_hour: np.ndarray) -> np.ndarray:
+    return np.round(co2_per_hour * durations, 2)
+
+route_distances = RouteDistanceTable(ROUTE_DISTANCE_MAX_ENTRIES)
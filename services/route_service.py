@@ -0,0 +1,95 @@
+from core.config import AS_API_KEY, AS_API_URL, AS_TIMEOUT_SECONDS, ROUTE_CACHE_TTL_SECONDS, ROUTE_CACHE_MAX_ENTRIES
+from utils.cache import SingleFlight
+from utils.metrics import upstream_call
+from cachetools import TTLCache
+from datetime import datetime
+from typing import List
+import requests
+import threading
+
+session = requests.Session()
+
+route_cache = TTLCache(maxsize=ROUTE_CACHE_MAX_ENTRIES, ttl=ROUTE_CACHE_TTL_SECONDS)
+route_cache_lock = threading.Lock()
+route_fetches = SingleFlight()
+route_cache_counters = {"hits": 0, "misses": 0, "upstream_calls": 0}
+
+def fetch_route_schedule(dep_iata: str, arr_iata: str):
+    # Returns the de-duplicated schedule, or None if AviationStack gave no data
+    params = {
+        "access_key": AS_API_KEY,
+        "dep_iata": dep_iata,
+        "arr_iata": arr_iata
+    }
+    route_cache_counters["upstream_calls"] += 1
+    with upstream_call("aviationstack") as call:
+        response = session.get(AS_API_URL, params=params, timeout=AS_TIMEOUT_SECONDS)
+        data = response.json()
+        call["outcome"] = "found" if "data" in data else "empty"
+
+    if "data" not in data:
+        return None
+
+    route_data = {}
+
+    for flight in data["data"]:
+        flight_key = (
+            flight["flight"]["iata"],  
+            flight["airline"]["name"],  
+            flight["departure"]["iata"],  
+            flight["arrival"]["iata"]
+        )
+        if flight_key not in route_data:
+            route_data[flight_key] = flight["departure"]
+
+    route_data_list = [
+        {
+            "flightNumber": key[0],
+            "airline": key[1],
+            "timezone": route_data[key]["timezone"],
+            "scheduledDepartureTime": datetime.fromisoformat(route_data[key]["scheduled"]).strftime("%H:%M"),
+            "origin": key[2],
+            "destination": key[3]
+        }
+        for key in route_data
+    ]
+
+    return route_data_list
+
+def get_route_schedule(dep_iata: str, arr_iata: str) -> List[dict]:
+    key = (dep_iata.upper(), arr_iata.upper())
+
+    with route_cache_lock:
+        cached = route_cache.get(key)
+    if cached is not None:
+        route_cache_counters["hits"] += 1
+        return cached
+
+    route_cache_counters["misses"] += 1
+
+    def load():
+        # Another caller may have filled the cache while we were waiting to lead
+        with route_cache_lock:
+            cached = route_cache.get(key)
+        if cached is not None:
+            return cached
+
+        route_data_list = fetch_route_schedule(key[0], key[1])
+        if route_data_list is None:
+            # Upstream errors are not cached
+            return []
+
+        with route_cache_lock:
+            route_cache[key] = route_data_list
+        return route_data_list
+
+    return route_fetches.do(key, load)
+
+def route_cache_stats() -> dict:
+    with route_cache_lock:
+        entries = len(route_cache)
+    stats = dict(route_cache_counters)
+    stats["entries"] = entries
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0
+    return stats
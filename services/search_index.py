@@ -0,0 +1,195 @@
+from bisect import bisect_left
+from collections import Counter
+from itertools import groupby
+from services.reference_data import reference_cache
+from typing import Dict, List, Optional
+import heapq
+import re
+import threading
+import unicodedata
+
+NON_ALPHANUMERIC = re.compile(r"[^a-z0-9]+")
+# Share of trigrams a misspelt word must have in common with an indexed word
+MIN_SIMILARITY = 0.45
+
+def normalize(text: Optional[str]) -> str:
+    # Lowercase ASCII words, so "Zürich-Kloten" matches "zurich kloten"
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    return NON_ALPHANUMERIC.sub(" ", text.lower()).strip()
+
+def trigrams(word: str) -> set:
+    padded = f" {word} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+class SearchIndex:
+    # Typeahead index over a code and a name per entry. Codes, names and every
+    # distinct word are kept in sorted lists for prefix lookups, and words are
+    # broken into trigrams so that misspelt words still find their closest matches.
+    # Results are ranked exact code, code prefix, name prefix, word prefixes, then
+    # fuzzy matches by similarity; within a rank shorter names come first. Entries
+    # are numbered in that order, so a rank is filled by taking the lowest ids and
+    # the lookup stops as soon as limit results are found.
+
+    def __init__(self, entries: List[dict], code_field: str, name_field: str):
+        keyed = sorted(
+            ((normalize(entry.get(code_field)), normalize(entry.get(name_field)), entry) for entry in entries),
+            key=lambda item: (len(item[1]), item[1], item[0])
+        )
+        self.entries = [entry for _, _, entry in keyed]
+        self._codes = sorted((code, entry_id) for entry_id, (code, _, _) in enumerate(keyed) if code)
+        self._names = sorted((name, entry_id) for entry_id, (_, name, _) in enumerate(keyed) if name)
+
+        postings: Dict[str, list] = {}
+        for entry_id, (code, name, _) in enumerate(keyed):
+            for word in dict.fromkeys(f"{code} {name}".split()):
+                postings.setdefault(word, []).append(entry_id)
+
+        self._vocabulary = sorted(postings)
+        word_ids = {word: word_id for word_id, word in enumerate(self._vocabulary)}
+        self._postings = [postings[word] for word in self._vocabulary]
+        self._entry_words = [[word_ids[word] for word in dict.fromkeys(f"{code} {name}".split())] for code, name, _ in keyed]
+        self._word_grams = [trigrams(word) for word in self._vocabulary]
+        self._grams: Dict[str, List[int]] = {}
+        for word_id, grams in enumerate(self._word_grams):
+            for gram in grams:
+                self._grams.setdefault(gram, []).append(word_id)
+
+    @staticmethod
+    def _range(keys: list, prefix: str, key=lambda value: value) -> range:
+        start = bisect_left(keys, key(prefix))
+        end = bisect_left(keys, key(prefix + "\x7f"), start)
+        return range(start, end)
+
+    def _word_range(self, prefix: str) -> range:
+        return self._range(self._vocabulary, prefix)
+
+    def _similar_words(self, word: str) -> Dict[int, float]:
+        # Vocabulary words sharing enough trigrams with word, by Dice coefficient
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._grams.get(gram, ()))
+        similar = {}
+        for word_id, count in shared.items():
+            similarity = 2 * count / (len(grams) + len(self._word_grams[word_id]))
+            if similarity >= MIN_SIMILARITY:
+                similar[word_id] = similarity
+        return similar
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        query = normalize(query)
+        if not query:
+            return []
+
+        words = query.split()
+        found = []
+        seen = set()
+
+        def take(entry_ids):
+            for entry_id in entry_ids:
+                if len(found) == limit:
+                    return
+                if entry_id not in seen:
+                    seen.add(entry_id)
+                    found.append(entry_id)
+
+        if len(words) == 1:
+            codes = self._range(self._codes, query, lambda prefix: (prefix,))
+            take(self._codes[index][1] for index in codes if self._codes[index][0] == query)
+            take(heapq.nsmallest(limit, (self._codes[index][1] for index in codes)))
+        if len(found) < limit:
+            names = self._range(self._names, query, lambda prefix: (prefix,))
+            take(heapq.nsmallest(limit + len(found), (self._names[index][1] for index in names)))
+
+        # Entries where every word starts a word of the entry. The most selective
+        # word is walked in rank order, so the walk stops after limit matches.
+        sizes = [sum(len(self._postings[word_id]) for word_id in self._word_range(word)) for word in words]
+        if len(found) < limit and all(sizes):
+            seed = min(range(len(words)), key=sizes.__getitem__)
+            others = [word for index, word in enumerate(words) if index != seed]
+            take(
+                entry_id for entry_id, _ in groupby(heapq.merge(*(self._postings[word_id] for word_id in self._word_range(words[seed]))))
+                if all(self._starts_word(entry_id, word) for word in others)
+            )
+        if len(found) < limit:
+            take(self._fuzzy_search(words, limit + len(found)))
+        return [self.entries[entry_id] for entry_id in found]
+
+    def _starts_word(self, entry_id: int, word: str) -> bool:
+        return any(self._vocabulary[word_id].startswith(word) for word_id in self._entry_words[entry_id])
+
+    def _fuzzy_search(self, words: List[str], limit: int) -> List[int]:
+        # Every word matches by prefix (1) or by trigram similarity, best total first
+        candidates = None
+        for word in words:
+            close = dict.fromkeys(self._word_range(word), 1.0)
+            if len(word) >= 3:
+                for word_id, similarity in self._similar_words(word).items():
+                    close.setdefault(word_id, similarity)
+            if candidates is None:
+                candidates = {}
+                for word_id, score in close.items():
+                    for entry_id in self._postings[word_id]:
+                        candidates[entry_id] = max(candidates.get(entry_id, 0), score)
+            else:
+                scored = {}
+                for entry_id, total in candidates.items():
+                    best = max((close.get(word_id, 0) for word_id in self._entry_words[entry_id]), default=0)
+                    if best:
+                        scored[entry_id] = total + best
+                candidates = scored
+            if not candidates:
+                return []
+        return heapq.nsmallest(limit, candidates, key=lambda entry_id: (-candidates[entry_id], entry_id))
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "words": len(self._vocabulary)}
+
+class ReferenceSearch:
+    # Search indexes over the cached airports and airlines. Each one is rebuilt on
+    # the reference cache's refresh thread whenever a new copy of its table has
+    # been loaded, then swapped in; searches never build an index. Entries the
+    # cache fetched one at a time on a miss are only searchable after the next
+    # reload, and searches before the first load find nothing.
+
+    def __init__(self):
+        self._indexes: Dict[str, SearchIndex] = {}
+        self._lock = threading.Lock()
+        reference_cache.on_reload(self._reload)
+
+    def _reload(self, table: str):
+        if table == reference_cache.airport_table:
+            self.rebuild_airports()
+        elif table == reference_cache.airline_table:
+            self.rebuild_airlines()
+
+    def _swap(self, name: str, index: SearchIndex):
+        with self._lock:
+            self._indexes[name] = index
+
+    def rebuild_airports(self):
+        airports = reference_cache.airports_by_iata
+        self._swap("airports", SearchIndex([airport.model_dump() for airport in list(airports.values())], "iata_code", "name"))
+
+    def rebuild_airlines(self):
+        airlines = reference_cache.airlines_by_icao
+        self._swap("airlines", SearchIndex(
+            [{"airline_icao": code, "airline_name": airline.airline_name} for code, airline in list(airlines.items())], "airline_icao", "airline_name"
+        ))
+
+    def _index(self, name: str, code_field: str, name_field: str) -> SearchIndex:
+        with self._lock:
+            index = self._indexes.get(name)
+        return index if index is not None else SearchIndex([], code_field, name_field)
+
+    def airports(self) -> SearchIndex:
+        return self._index("airports", "iata_code", "name")
+
+    def airlines(self) -> SearchIndex:
+        return self._index("airlines", "airline_icao", "airline_name")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: index.stats() for name, index in self._indexes.items()}
+
+reference_search = ReferenceSearch()
@@ -0,0 +1,371 @@
+from google.cloud import bigquery
+from core.config import dataset_id, flights_table, STATISTICS_CACHE_TTL_SECONDS, STATISTICS_CACHE_MAX_USERS
+from db.client import client
+from db.schema import active_flights_query
+from db.replica import replica
+from utils.time import convert_time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+import threading
+import time
+
+COUNTER_FIELDS = {
+    "top_airports": ("origin_iata", "destination_iata"),
+    "top_airlines": ("airline_name",),
+    "top_aircraft": ("aircraft",),
+    "top_routes": ("route",)
+}
+
+def new_bucket() -> dict:
+    return {
+        "total_distance": 0,
+        "total_flights": 0,
+        "total_carbon": 0,
+        "total_time": 0,
+        "top_airports": {},
+        "top_airlines": {},
+        "top_aircraft": {},
+        "top_routes": {}
+    }
+
+def flight_contribution(flight: dict) -> dict:
+    # Only the fields the dashboard aggregates over, so deletes can be subtracted later
+    date = flight.get("date")
+    return {
+        "year": str(date)[:4] if date is not None else None,
+        "month": str(date)[:7] if date is not None else None,
+        "estimated_distance": flight.get("estimated_distance") or 0,
+        "estimated_co2": flight.get("estimated_co2") or 0,
+        "estimated_time": convert_time(flight["estimated_time"]) if flight.get("estimated_time") is not None else 0,
+        "origin_iata": flight.get("origin_iata"),
+        "destination_iata": flight.get("destination_iata"),
+        "airline_name": flight.get("airline_name"),
+        "aircraft": flight.get("aircraft"),
+        "route": flight.get("route")
+    }
+
+def apply_to_bucket(bucket: dict, contribution: dict, sign: int):
+    bucket["total_flights"] += sign
+    bucket["total_distance"] += sign * contribution["estimated_distance"]
+    bucket["total_carbon"] += sign * contribution["estimated_co2"]
+    bucket["total_time"] += sign * contribution["estimated_time"]
+
+    for counter, fields in COUNTER_FIELDS.items():
+        for field in fields:
+            value = contribution[field]
+            if value is None:
+                continue
+            count = bucket[counter].get(value, 0) + sign
+            if count > 0:
+                bucket[counter][value] = count
+            else:
+                bucket[counter].pop(value, None)
+
+def limit_top(counts: dict, top_n: Optional[int]) -> dict:
+    if top_n is None:
+        return dict(counts)
+    return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:top_n])
+
+def render_bucket(bucket: dict, top_n: Optional[int] = None) -> dict:
+    rendered = dict(bucket)
+    for counter in COUNTER_FIELDS:
+        rendered[counter] = limit_top(bucket[counter], top_n)
+    rendered["total_carbon"] = round(bucket["total_carbon"], 2)
+    rendered["total_time"] = convert_time(bucket["total_time"])
+    return rendered
+
+def build_response(totals: dict, yearly: Dict[str, dict], monthly: Dict[str, dict], top_n: Optional[int] = None) -> dict:
+    rendered = render_bucket(totals, top_n)
+    return {
+        "total_distance": rendered["total_distance"],
+        "total_flights": rendered["total_flights"],
+        "total_carbon": rendered["total_carbon"],
+        "total_time": rendered["total_time"],
+        "top_airports": rendered["top_airports"],
+        "top_airlines": rendered["top_airlines"],
+        "top_aircraft": rendered["top_aircraft"],
+        "top_routes": rendered["top_routes"],
+        "yearly_statistics": {year: render_bucket(bucket, top_n) for year, bucket in sorted(yearly.items())},
+        "monthly_statistics": {month: render_bucket(bucket, top_n) for month, bucket in sorted(monthly.items())}
+    }
+
+class UserStatistics:
+    def __init__(self):
+        self.totals = new_bucket()
+        self.yearly: Dict[str, dict] = {}
+        self.monthly: Dict[str, dict] = {}
+        self.flights: Dict[str, dict] = {}
+        self.built_at = time.time()
+
+    def _apply(self, contribution: dict, sign: int):
+        apply_to_bucket(self.totals, contribution, sign)
+        for period, buckets in ((contribution["year"], self.yearly), (contribution["month"], self.monthly)):
+            if period is None:
+                continue
+            if period not in buckets:
+                buckets[period] = new_bucket()
+            apply_to_bucket(buckets[period], contribution, sign)
+            if buckets[period]["total_flights"] <= 0:
+                del buckets[period]
+
+    # Both operations are idempotent so they can be replayed after a rebuild
+    def add(self, flight_id: str, flight: dict):
+        if flight_id in self.flights:
+            return
+        contribution = flight_contribution(flight)
+        self.flights[flight_id] = contribution
+        self._apply(contribution, 1)
+
+    def remove(self, flight_id: str):
+        contribution = self.flights.pop(flight_id, None)
+        if contribution is not None:
+            self._apply(contribution, -1)
+
+    def to_response(self, top_n: Optional[int] = None) -> dict:
+        return build_response(self.totals, self.yearly, self.monthly, top_n)
+
+class StatisticsStore:
+    # Per-user dashboard aggregates kept in memory and updated by the write paths.
+    # Aggregates are rebuilt from BigQuery on first use and once they are older than
+    # ttl_seconds. The store is per instance: it only sees the writes this instance
+    # handles, so writes made through other instances show up in its reads after
+    # the next rebuild, up to ttl_seconds later. At most max_users aggregates are
+    # kept, the least recently used one is dropped with its flights.
+
+    def __init__(self, client: bigquery.Client, dataset_id: str, flights_table: str, ttl_seconds: int, max_users: int):
+        self.client = client
+        self.dataset_id = dataset_id
+        self.flights_table = flights_table
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self._users: "OrderedDict[str, UserStatistics]" = OrderedDict()
+        self._flight_owner: Dict[str, str] = {}
+        # One write log per running rebuild, concurrent rebuilds of a user each get their own
+        self._pending: Dict[str, List[list]] = {}
+        self._lock = threading.Lock()
+
+    def _fetch_flights(self, user_id: str):
+        if replica.is_fresh():
+            return replica.get_flights(user_id)
+
+        table_id = f"{self.client.project}.{self.dataset_id}.{self.flights_table}"
+
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter("user_id", "STRING", user_id)
+            ]
+        )
+
+        query = active_flights_query(
+            table_id,
+            select="""flight_id, date, estimated_distance, estimated_co2, estimated_time,
+            origin_iata, destination_iata, airline_name, aircraft, route"""
+        )
+
+        return self.client.query(query, job_config=job_config).result()
+
+    def _log(self, user_id: str, entry: tuple):
+        for log in self._pending.get(user_id, ()):
+            log.append(entry)
+
+    def _forget_log(self, user_id: str, log: list):
+        logs = self._pending.get(user_id, [])
+        logs[:] = [other for other in logs if other is not log]
+        if not logs:
+            self._pending.pop(user_id, None)
+
+    def _drop(self, user_id: str):
+        stats = self._users.pop(user_id, None)
+        if stats is not None:
+            for flight_id in stats.flights:
+                self._flight_owner.pop(flight_id, None)
+
+    def rebuild(self, user_id: str) -> UserStatistics:
+        log = []
+        with self._lock:
+            self._pending.setdefault(user_id, []).append(log)
+
+        try:
+            stats = UserStatistics()
+            for row in self._fetch_flights(user_id):
+                flight = dict(row)
+                stats.add(flight["flight_id"], flight)
+        except Exception:
+            with self._lock:
+                self._forget_log(user_id, log)
+            raise
+
+        with self._lock:
+            self._forget_log(user_id, log)
+            # Replay writes that raced with the rebuild query
+            for operation, flight_id, flight in log:
+                if operation == "add":
+                    stats.add(flight_id, flight)
+                else:
+                    stats.remove(flight_id)
+            self._drop(user_id)
+            for flight_id in stats.flights:
+                self._flight_owner[flight_id] = user_id
+            self._users[user_id] = stats
+            while len(self._users) > self.max_users:
+                self._drop(next(iter(self._users)))
+        return stats
+
+    def get(self, user_id: str) -> UserStatistics:
+        with self._lock:
+            stats = self._users.get(user_id)
+            if stats is not None:
+                self._users.move_to_end(user_id)
+        if stats is None or time.time() - stats.built_at > self.ttl_seconds:
+            stats = self.rebuild(user_id)
+        return stats
+
+    def get_statistics(self, user_id: str, top_n: Optional[int] = None) -> dict:
+        stats = self.get(user_id)
+        with self._lock:
+            return stats.to_response(top_n)
+
+    def add_flight(self, flight: dict):
+        user_id = flight.get("user_id")
+        flight_id = flight.get("flight_id")
+        if user_id is None or flight_id is None:
+            return
+        with self._lock:
+            self._log(user_id, ("add", flight_id, flight))
+            stats = self._users.get(user_id)
+            if stats is not None:
+                stats.add(flight_id, flight)
+                self._flight_owner[flight_id] = user_id
+
+    def remove_flight(self, flight_id: str, user_id: Optional[str] = None):
+        with self._lock:
+            owner = user_id or self._flight_owner.pop(flight_id, None)
+            if owner is None:
+                return
+            self._flight_owner.pop(flight_id, None)
+            self._log(owner, ("remove", flight_id, None))
+            stats = self._users.get(owner)
+            if stats is not None:
+                stats.remove(flight_id)
+
+    def flight_owner(self, flight_id: str) -> Optional[str]:
+        # Known for the flights of users whose aggregate is held
+        with self._lock:
+            return self._flight_owner.get(flight_id)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._drop(user_id)
+
+def query_statistics(
+    client: bigquery.Client,
+    dataset_id: str,
+    flights_table: str,
+    user_id: str,
+    top_n: Optional[int] = None,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None
+) -> dict:
+    # Aggregates in BigQuery so only the grouped rows come back. level 2 is the
+    # whole range, level 1 a year and level 0 a month.
+    if replica.is_fresh():
+        # The local rows are cheap to aggregate in process
+        stats = UserStatistics()
+        for flight in replica.get_flights(user_id, from_date=from_date, to_date=to_date):
+            stats.add(flight["flight_id"], flight)
+        return stats.to_response(top_n)
+
+    table_id = f"{client.project}.{dataset_id}.{flights_table}"
+
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("user_id", "STRING", user_id),
+            bigquery.ScalarQueryParameter("top_n", "INT64", top_n),
+            bigquery.ScalarQueryParameter("from_date", "DATE", datetime.strptime(from_date, "%Y-%m-%d").date() if from_date else None),
+            bigquery.ScalarQueryParameter("to_date", "DATE", datetime.strptime(to_date, "%Y-%m-%d").date() if to_date else None)
+        ]
+    )
+
+    # Only the bounds that are set, compared as DATE values so the partition filter prunes
+    range_filter = ""
+    if from_date is not None:
+        range_filter += "\n        AND date >= @from_date"
+    if to_date is not None:
+        range_filter += "\n        AND date <= @to_date"
+
+    active = active_flights_query(
+        table_id,
+        select="""
+            SUBSTR(CAST(date AS STRING), 1, 4) AS year,
+            SUBSTR(CAST(date AS STRING), 1, 7) AS month,
+            IFNULL(estimated_distance, 0) AS distance,
+            IFNULL(estimated_co2, 0) AS co2,
+            IFNULL(
+                SAFE_CAST(SPLIT(estimated_time, ':')[SAFE_OFFSET(0)] AS INT64)
+                + SAFE_CAST(SPLIT(estimated_time, ':')[SAFE_OFFSET(1)] AS INT64) / 60,
+                0
+            ) AS hours,
+            origin_iata, destination_iata, airline_name, aircraft, route""",
+        where=range_filter
+    )
+
+    query = f"""
+    WITH active AS ({active}),
+    dimensions AS (
+        SELECT year, month, 'top_airports' AS dimension, airport AS value
+        FROM active, UNNEST([origin_iata, destination_iata]) AS airport
+        UNION ALL SELECT year, month, 'top_airlines', airline_name FROM active
+        UNION ALL SELECT year, month, 'top_aircraft', aircraft FROM active
+        UNION ALL SELECT year, month, 'top_routes', route FROM active
+    ),
+    counts AS (
+        SELECT GROUPING(year) + GROUPING(month) AS level, year, month, dimension, value, COUNT(*) AS flights
+        FROM dimensions
+        WHERE value IS NOT NULL
+        GROUP BY GROUPING SETS ((year, month, dimension, value), (year, dimension, value), (dimension, value))
+    )
+    SELECT GROUPING(year) + GROUPING(month) AS level, year, month, 'totals' AS dimension, CAST(NULL AS STRING) AS value,
+        COUNT(*) AS flights, SUM(distance) AS distance, SUM(co2) AS co2, SUM(hours) AS hours
+    FROM active
+    GROUP BY ROLLUP(year, month)
+    UNION ALL
+    SELECT * FROM (
+        SELECT level, year, month, dimension, value, flights,
+            NULL AS distance, NULL AS co2, NULL AS hours
+        FROM counts
+        WHERE TRUE
+        QUALIFY @top_n IS NULL
+            OR ROW_NUMBER() OVER (PARTITION BY level, year, month, dimension ORDER BY flights DESC, value) <= @top_n
+    )
+    """
+
+    totals = new_bucket()
+    yearly = {}
+    monthly = {}
+
+    for row in client.query(query, job_config=job_config).result():
+        if row.level == 2:
+            bucket = totals
+        elif row.level == 1:
+            # Flights without a date only count towards the overall totals
+            if row.year is None:
+                continue
+            bucket = yearly.setdefault(row.year, new_bucket())
+        else:
+            if row.month is None:
+                continue
+            bucket = monthly.setdefault(row.month, new_bucket())
+
+        if row.dimension == "totals":
+            bucket["total_flights"] = row.flights
+            bucket["total_distance"] = row.distance or 0
+            bucket["total_carbon"] = row.co2 or 0
+            bucket["total_time"] = row.hours or 0
+        else:
+            bucket[row.dimension][row.value] = row.flights
+
+    # Counters were already cut to top_n in the query
+    return build_response(totals, yearly, monthly)
+
+statistics_store = StatisticsStore(client, dataset_id, flights_table, STATISTICS_CACHE_TTL_SECONDS, STATISTICS_CACHE_MAX_USERS)
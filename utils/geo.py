@@ -1,4 +1,5 @@
 from math import radians, sin, cos, atan2, sqrt
+import numpy as np
 
 def compute_distance(start_latitude: float, start_longitude: float, end_latitude: float, end_longitude: float) -> float:
     # Using haversine formula
@@ -14,4 +15,20 @@ def compute_distance(start_latitude: float, start_longitude: float, end_latitude
 
     distance = round(R * haversine_c, 2)
 
-    return distance
\ No newline at end of file
+    return distance
+
+def compute_distances(start_latitudes, start_longitudes, end_latitudes, end_longitudes) -> np.ndarray:
+    # Same haversine as compute_distance over whole arrays of coordinates
+    R = 6371.0  # radius earth in km
+
+    start_latitudes, start_longitudes, end_latitudes, end_longitudes = (
+        np.radians(np.asarray(values, dtype=np.float64)) for values in (start_latitudes, start_longitudes, end_latitudes, end_longitudes)
+    )
+
+    delta_longitudes = end_longitudes - start_longitudes
+    delta_latitudes = end_latitudes - start_latitudes
+
+    haversine_a = np.sin(delta_latitudes / 2)**2 + np.cos(start_latitudes) * np.cos(end_latitudes) * np.sin(delta_longitudes / 2)**2
+    haversine_c = 2 * np.arctan2(np.sqrt(haversine_a), np.sqrt(1 - haversine_a))
+
+    return np.round(R * haversine_c, 2)
@@ -0,0 +1,163 @@
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from time import perf_counter
+from typing import Dict, Optional, Tuple
+from utils.profiler import run_attached
+import threading
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _quote(value) -> str:
+    return '"' + _escape(value) + '"'
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f"{name}={_quote(value)}" for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return "\n".join(lines)
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # label values -> (bucket counts, sum, count)
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, 'le=' + _quote(bound))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, 'le=' + _quote('+Inf'))} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return "\n".join(lines)
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        # Prometheus text exposition format 0.0.4
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time to produce the response headers, per endpoint.", ("method", "route", "status")
+)
+bigquery_query_duration = registry.histogram(
+    "bigquery_query_duration_seconds", "BigQuery call time from submission to result, per query template.", ("template", "operation")
+)
+bigquery_queries = registry.counter(
+    "bigquery_queries_total", "BigQuery calls per query template and whether the result came from the query cache.", ("template", "operation", "cache_hit")
+)
+bigquery_bytes_processed = registry.counter(
+    "bigquery_bytes_processed_total", "Bytes processed by BigQuery, per query template.", ("template",)
+)
+upstream_request_duration = registry.histogram(
+    "upstream_request_duration_seconds", "HTTP calls to external flight data providers.", ("provider", "outcome")
+)
+upstream_attempts = registry.counter(
+    "upstream_attempts_total", "HTTP attempts made to external flight data providers.", ("provider", "outcome")
+)
+
+class RequestMetrics:
+    # Time spent per span (bigquery, fr24, ...) while handling one request. Spans
+    # recorded from worker threads add up, so they can exceed the wall time.
+
+    def __init__(self):
+        self.spans: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, duration_ms: float):
+        with self._lock:
+            span = self.spans.setdefault(name, [0.0, 0])
+            span[0] += duration_ms
+            span[1] += 1
+
+    def server_timing(self) -> str:
+        with self._lock:
+            return ", ".join(f'{name};dur={total:.1f};desc="{count} calls"' for name, (total, count) in self.spans.items())
+
+current_request: ContextVar[Optional[RequestMetrics]] = ContextVar("current_request", default=None)
+
+def record_span(name: str, duration_ms: float):
+    request_metrics = current_request.get()
+    if request_metrics is not None:
+        request_metrics.add(name, duration_ms)
+
+@contextmanager
+def upstream_call(provider: str):
+    # Yields a dict whose "outcome" the caller can set, exceptions count as "error"
+    call = {"outcome": "ok"}
+    start = perf_counter()
+    try:
+        yield call
+    except Exception:
+        call["outcome"] = "error"
+        raise
+    finally:
+        duration = perf_counter() - start
+        upstream_request_duration.observe(duration, provider=provider, outcome=call["outcome"])
+        upstream_attempts.inc(provider=provider, outcome=call["outcome"])
+        # Suffixed so the span does not clash with an endpoint stage named after the provider
+        record_span(f"{provider}-http", duration * 1000)
+
+def in_context(func):
+    # Carries the request context into executor threads, attaching the thread to
+    # the request's profile session while it runs
+    context = copy_context()
+    def wrapper(*args, **kwargs):
+        return context.run(run_attached, func, *args, **kwargs)
+    return wrapper
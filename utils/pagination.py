@@ -0,0 +1,21 @@
+import base64
+import datetime
+import json
+from typing import Optional, Tuple
+
+def encode_cursor(date, flight_id: str) -> str:
+    payload = json.dumps([str(date) if date is not None else "", flight_id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("utf-8")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, str]]:
+    # Raises ValueError for anything that is not a cursor we handed out
+    if not cursor:
+        return None
+    try:
+        date, flight_id = json.loads(base64.urlsafe_b64decode(cursor.encode("utf-8")))
+        if date:
+            # Sent to BigQuery as a DATE
+            datetime.date.fromisoformat(str(date))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return str(date), str(flight_id)
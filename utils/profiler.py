@@ -0,0 +1,242 @@
+from collections import Counter
+from core.config import PROFILER_ENABLED, PROFILER_ENDPOINTS, PROFILER_SAMPLE_RATE, PROFILER_INTERVAL_MS, PROFILER_HEADER, PROFILER_MAX_LABELS, PROFILER_MAX_STACKS
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Optional
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+import weakref
+
+# Leaf frames in these files mean the thread is parked, not burning CPU
+IDLE_FILES = {"selectors.py", "threading.py", "queue.py"}
+MAX_DEPTH = 64
+MAX_LABEL_LENGTH = 64
+OTHER = "other"
+
+class ProfileSession:
+    # Stacks sampled while one request is being handled. Executor workers are
+    # attached while they run work for the request. The event loop thread serves
+    # every request at once, so it is only sampled while one of the request's own
+    # tasks is the one running on it.
+
+    def __init__(self, label: str):
+        self.label = label
+        self.stacks = Counter()
+        self.samples = 0
+        self.loop = None
+        self.loop_thread = None
+        self._threads: Dict[int, int] = {}
+        self._tasks = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def add_task(self, task: Optional[asyncio.Task]):
+        if task is not None:
+            with self._lock:
+                self._tasks.add(task)
+
+    def owns(self, task: Optional[asyncio.Task]) -> bool:
+        with self._lock:
+            return task is not None and task in self._tasks
+
+    def attach(self, ident: int):
+        with self._lock:
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+
+    def detach(self, ident: int):
+        with self._lock:
+            count = self._threads.get(ident, 0) - 1
+            if count > 0:
+                self._threads[ident] = count
+            else:
+                self._threads.pop(ident, None)
+
+    def threads(self) -> list:
+        with self._lock:
+            return list(self._threads)
+
+    def record(self, stack: str):
+        with self._lock:
+            self.stacks[stack] += 1
+            self.samples += 1
+
+    def collected(self) -> list:
+        with self._lock:
+            return list(self.stacks.items())
+
+current_profile: ContextVar[Optional[ProfileSession]] = ContextVar("current_profile", default=None)
+
+def fold(frame) -> Optional[str]:
+    # root;...;leaf, or None for a thread that is only waiting
+    if frame is None or os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+        return None
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class SamplingProfiler:
+    # Opt-in statistical profiler. While enabled, a request is profiled when it
+    # carries the profile header, targets one of the configured endpoints or is
+    # picked by sample_rate. The header is only honoured on requests made with an
+    # admin token. A background thread samples the stacks of the threads attached to
+    # profiled requests every interval_ms; nothing runs while no request is being
+    # profiled. Stacks are aggregated per label (the request path, or the header
+    # value) in the folded format used by flamegraph.pl and speedscope, up to
+    # max_labels labels and max_stacks stacks; the rest is counted under "other".
+
+    def __init__(self, enabled: bool, endpoints: Iterable[str], sample_rate: float, interval_ms: float, header: str, max_labels: int, max_stacks: int):
+        self.header = header
+        self.max_labels = max_labels
+        self.max_stacks = max_stacks
+        self.configure(enabled, endpoints, sample_rate, interval_ms)
+        self.folded = Counter()
+        self.samples_per_label = Counter()
+        self.profiled_requests = 0
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def configure(self, enabled: bool, endpoints: Iterable[str], sample_rate: float, interval_ms: float):
+        self.enabled = enabled
+        self.endpoints = {endpoint for endpoint in endpoints if endpoint}
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.interval_ms = max(1.0, interval_ms)
+
+    def settings(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "endpoints": sorted(self.endpoints),
+            "sample_rate": self.sample_rate,
+            "interval_ms": self.interval_ms,
+            "header": self.header
+        }
+
+    def label_for(self, path: str, headers, is_admin: Callable[[], bool]) -> Optional[str]:
+        # Returns the label to profile this request under, or None to skip it.
+        # is_admin is only called for requests that carry the header.
+        if not self.enabled:
+            return None
+        requested = headers.get(self.header)
+        if requested and is_admin():
+            # Any other value names the profile, so a single request can be told apart
+            if requested.lower() in ("1", "true"):
+                return path
+            return requested[:MAX_LABEL_LENGTH].replace(";", "_").replace(" ", "_")
+        if path in self.endpoints or (self.sample_rate and random.random() < self.sample_rate):
+            return path
+        return None
+
+    def begin(self, label: str) -> ProfileSession:
+        session = ProfileSession(label)
+        try:
+            session.loop = asyncio.get_running_loop()
+            session.loop_thread = threading.get_ident()
+            session.add_task(asyncio.current_task())
+        except RuntimeError:
+            # Not called from a coroutine, sample the calling thread throughout
+            session.attach(threading.get_ident())
+        with self._lock:
+            self._sessions.add(session)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return session
+
+    def end(self, session: ProfileSession):
+        with self._lock:
+            self._sessions.discard(session)
+            label = session.label
+            if label not in self.samples_per_label and len(self.samples_per_label) >= self.max_labels:
+                label = OTHER
+            for stack, count in session.collected():
+                key = f"{label};{stack}"
+                if key not in self.folded and len(self.folded) >= self.max_stacks:
+                    key = f"{label};{OTHER}"
+                self.folded[key] += count
+                self.samples_per_label[label] += count
+            self.profiled_requests += 1
+
+    def _run(self):
+        while True:
+            with self._lock:
+                sessions = list(self._sessions)
+                if not sessions:
+                    self._wake.clear()
+            if not sessions:
+                self._wake.wait()
+                continue
+
+            # The running task is read just after the frames, so a sample taken as
+            # the loop switches tasks can occasionally land on the wrong request
+            frames = sys._current_frames()
+            running = {}
+            for session in sessions:
+                idents = session.threads()
+                if session.loop is not None:
+                    if session.loop not in running:
+                        running[session.loop] = asyncio.current_task(session.loop)
+                    if session.owns(running[session.loop]):
+                        idents.append(session.loop_thread)
+                for ident in idents:
+                    stack = fold(frames.get(ident))
+                    if stack is not None:
+                        session.record(stack)
+            del frames, running
+            time.sleep(self.interval_ms / 1000)
+
+    def export(self, label: Optional[str] = None) -> str:
+        with self._lock:
+            items = sorted(self.folded.items())
+        return "".join(f"{stack} {count}\n" for stack, count in items if label is None or stack.split(";", 1)[0] == label)
+
+    def reset(self):
+        with self._lock:
+            self.folded.clear()
+            self.samples_per_label.clear()
+            self.profiled_requests = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.settings(),
+                "profiled_requests": self.profiled_requests,
+                "active_sessions": len(self._sessions),
+                "stacks": len(self.folded),
+                "samples_per_label": dict(self.samples_per_label)
+            }
+
+class ProfileTaskMiddleware:
+    # Starlette's http middleware hands the request to the app in a new task. This
+    # ASGI middleware sits inside it and registers that task with the profile
+    # session. Further tasks the request spawns (e.g. a streaming response body)
+    # are not sampled on the loop thread.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        session = current_profile.get()
+        if session is not None:
+            session.add_task(asyncio.current_task())
+        await self.app(scope, receive, send)
+
+def run_attached(func, *args, **kwargs):
+    # Attaches the calling thread to the request's profile session, if there is one
+    session = current_profile.get()
+    if session is None:
+        return func(*args, **kwargs)
+    ident = threading.get_ident()
+    session.attach(ident)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        session.detach(ident)
+
+profiler = SamplingProfiler(PROFILER_ENABLED, PROFILER_ENDPOINTS, PROFILER_SAMPLE_RATE, PROFILER_INTERVAL_MS, PROFILER_HEADER, PROFILER_MAX_LABELS, PROFILER_MAX_STACKS)
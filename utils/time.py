@@ -6,9 +6,10 @@ def format_duration_as_time(hours: float) -> str:
     minutes = int((hours - whole_hours) * 60)
     return f"{whole_hours:02d}:{minutes:02d}"
 
+AVERAGE_SPEED_KMH = 850
+
 def estimate_flight_duration(distance: float) -> float:
-    average_speed = 850  # km/h
-    return distance / average_speed
+    return distance / AVERAGE_SPEED_KMH
 
 def convert_time(time_input):
     if isinstance(time_input, str):
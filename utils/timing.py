@@ -0,0 +1,26 @@
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict
+
+class StageTimer:
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = (perf_counter() - start) * 1000
+
+    def timed(self, name: str, func):
+        # Wrap a callable so it can be handed to an executor and still be timed
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def server_timing(self) -> str:
+        # Format as a Server-Timing header value, durations in milliseconds
+        return ", ".join(f"{name};dur={duration:.1f}" for name, duration in self.timings.items())